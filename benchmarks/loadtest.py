@@ -0,0 +1,227 @@
+"""Load test of many concurrent logins against a local AWS stand-in.
+
+Run from the repository root, e.g. to see how 500 jobs logging in at once fare:
+
+    python benchmarks/loadtest.py --logins 500
+    python benchmarks/loadtest.py --logins 200 --mode thread --role --throttle-rate 0.2
+
+Every login is a `partifact login` process, or a thread running the CLI in this
+process, talking to the HTTP stand-in in `stubs.py` through AWS_ENDPOINT_URL.
+The logins share a token cache unless --no-cache is given, as jobs on one
+runner would. The report lists latency percentiles, the calls that reached the
+stand-in, which show how well caching and deduplication work, and failures.
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from stubs import AWSServer, pyproject
+
+from partifact.main import app
+
+MODES = ("process", "thread")
+
+
+def percentile(durations: List[float], fraction: float) -> float:
+    """Returns the nearest-rank percentile of the durations."""
+    ordered = sorted(durations)
+    if not ordered:
+        return 0.0
+    rank = max(math.ceil(fraction * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def login_environment(workdir: Path, endpoint: str) -> Dict[str, str]:
+    """Returns the variables isolating logins from the real AWS and tool config."""
+    return {
+        "AWS_ENDPOINT_URL": endpoint,
+        "AWS_ACCESS_KEY_ID": "loadtest",
+        "AWS_SECRET_ACCESS_KEY": "loadtest",
+        "AWS_CONFIG_FILE": str(workdir / "aws" / "config"),
+        "AWS_SHARED_CREDENTIALS_FILE": str(workdir / "aws" / "credentials"),
+        "AWS_EC2_METADATA_DISABLED": "true",
+        "PARTIFACT_CREDENTIAL_SOURCE": "env",
+        "PARTIFACT_CACHE_DIR": str(workdir / "cache"),
+        "HOME": str(workdir / "home"),
+        "XDG_CONFIG_HOME": str(workdir / "config"),
+        "POETRY_CONFIG_DIR": str(workdir / "config" / "pypoetry"),
+        "POETRY_KEYRING_ENABLED": "false",
+    }
+
+
+def run_process(args: List[str], cwd: Path, env: Dict[str, str]) -> Optional[str]:
+    """Runs a login in its own process, returning why it failed if it did."""
+    command = [sys.executable, "-c", "from partifact.main import app; app()", *args]
+    result = subprocess.run(
+        command, cwd=cwd, env={**os.environ, **env}, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        return lines[-1] if lines else f"exit code {result.returncode}"
+    return None
+
+
+def run_thread(args: List[str]) -> Optional[str]:
+    """Runs a login in this process, returning why it failed if it did."""
+    try:
+        app(args, standalone_mode=False)
+    except Exception as err:  # noqa: B902
+        return f"{type(err).__name__}: {err}"
+    return None
+
+
+def load_test(
+    workdir: Path,
+    server: AWSServer,
+    logins: int,
+    concurrency: int,
+    mode: str,
+    repositories: int,
+    role: bool,
+    no_cache: bool,
+    max_attempts: int,
+) -> Dict[str, Any]:
+    """Runs the logins against the stand-in and summarises how they went."""
+    project = workdir / "project"
+    project.mkdir()
+    content, _ = pyproject(sources=repositories)
+    (project / "pyproject.toml").write_text(content)
+
+    args = ["login", *(f"repo-{i}" for i in range(repositories))]
+    args += ["--max-attempts", str(max_attempts)]
+    if role:
+        args += ["--role", "loadtest"]
+    if no_cache:
+        args.append("--no-cache")
+
+    env = login_environment(workdir, server.url)
+    if mode == "thread":
+        os.environ.update(env)
+        os.chdir(project)
+
+    start = threading.Barrier(min(concurrency, logins))
+
+    def login(_: int) -> Tuple[float, Optional[str]]:
+        # line the first wave up, so the logins really start at once
+        with contextlib.suppress(threading.BrokenBarrierError):
+            start.wait(timeout=60)
+        started = time.perf_counter()
+        if mode == "thread":
+            error = run_thread(args)
+        else:
+            error = run_process(args, project, env)
+        return time.perf_counter() - started, error
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(login, range(logins)))
+    duration = time.perf_counter() - started
+
+    durations = [d for d, _ in results]
+    errors: Dict[str, int] = {}
+    for _, error in results:
+        if error is not None:
+            errors[error] = errors.get(error, 0) + 1
+    failures = sum(errors.values())
+
+    return {
+        "logins": logins,
+        "concurrency": concurrency,
+        "mode": mode,
+        "duration": duration,
+        "failures": failures,
+        "failure_rate": failures / logins if logins else 0.0,
+        "latency": {
+            "p50": percentile(durations, 0.50),
+            "p95": percentile(durations, 0.95),
+            "p99": percentile(durations, 0.99),
+            "max": max(durations, default=0.0),
+        },
+        "upstream": dict(server.calls),
+        "errors": errors,
+    }
+
+
+def summary(report: Dict[str, Any]) -> str:
+    """Formats a report for people."""
+    latency = report["latency"]
+    upstream = report["upstream"]
+    lines = [
+        f"{report['logins']} logins ({report['mode']} mode, {report['concurrency']} at once)"
+        f" in {report['duration']:.1f} s",
+        "latency: " + ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in latency.items()),
+        "upstream calls: " + ", ".join(f"{k} {v}" for k, v in upstream.items()),
+        f"failures: {report['failures']} ({report['failure_rate']:.1%})",
+    ]
+    lines += [f"  {count}x {error}" for error, count in report["errors"].items()]
+    return "\n".join(lines)
+
+
+def main() -> None:
+    """Runs the load test."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument(
+        "--concurrency", type=int, help="logins running at once (default: all)"
+    )
+    parser.add_argument("--mode", choices=MODES, default="process")
+    parser.add_argument(
+        "--repositories", type=int, default=1, help="repositories per login"
+    )
+    parser.add_argument("--role", action="store_true", help="assume a role")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--max-attempts", type=int, default=10)
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="simulated AWS latency (s)"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", type=Path, help="write the report to a file")
+    args = parser.parse_args()
+
+    server = AWSServer(args.latency, args.error_rate, args.throttle_rate, args.seed)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            report = load_test(
+                Path(tmp),
+                server,
+                args.logins,
+                args.concurrency or args.logins,
+                args.mode,
+                args.repositories,
+                args.role,
+                args.no_cache,
+                args.max_attempts,
+            )
+    finally:
+        os.chdir(cwd)
+        server.shutdown()
+
+    report.update(
+        latency_injected=args.latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+    )
+    sys.stdout.write(summary(report) + "\n")
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""Offline benchmarks of partifact's hot paths.
+
+Run from the repository root, optionally comparing against an earlier run:
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --compare results.json
+
+AWS is replaced by the stand-in in `stubs.py`, so the results don't depend on
+the network, and poetry and pip are configured in a temporary directory.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from unittest import mock
+
+from stubs import FakeAWS, pyproject
+
+from partifact.config import Configuration, clear_sources_cache
+from partifact.credentials import clear_client_pool
+from partifact.main import app
+from partifact.shell_commands import configure_pip, configure_poetry
+
+Results = Dict[str, Dict[str, float]]
+
+
+def measure(
+    run: Callable[[], object],
+    repeat: int,
+    setup: Optional[Callable[[], object]] = None,
+) -> Dict[str, float]:
+    """Times a function, running the optional setup untimed before each run."""
+    durations: List[float] = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        run()
+        durations.append(time.perf_counter() - started)
+
+    return {
+        "min": min(durations),
+        "median": statistics.median(durations),
+        "mean": statistics.fmean(durations),
+        "max": max(durations),
+        "runs": repeat,
+    }
+
+
+def bench_import(repeat: int) -> Results:
+    """Measures the time to start the interpreter and import the CLI."""
+    baseline = [sys.executable, "-c", "pass"]
+    cli = [sys.executable, "-c", "import partifact.main"]
+
+    def run(command: List[str]) -> Callable[[], object]:
+        return lambda: subprocess.run(command, check=True)
+
+    return {
+        "import.interpreter": measure(run(baseline), repeat),
+        "import.cli": measure(run(cli), repeat),
+    }
+
+
+def bench_config(workdir: Path, repeat: int) -> Results:
+    """Measures loading the configuration from small and large pyproject files."""
+    results = {}
+    for name, sources, padding in (("small", 3, 0), ("large", 200, 20000)):
+        content, repository = pyproject(sources, padding)
+        path = workdir / name / "pyproject.toml"
+        path.parent.mkdir()
+        path.write_text(content)
+
+        os.chdir(path.parent)
+        results[f"config.load.{name}.cold"] = measure(
+            lambda r=repository: Configuration.load(r),
+            repeat,
+            setup=clear_sources_cache,
+        )
+        results[f"config.load.{name}.warm"] = measure(
+            lambda r=repository: Configuration.load(r), repeat
+        )
+    return results
+
+
+def bench_login(workdir: Path, repeat: int, latency: float) -> Results:
+    """Measures logins with an empty and with a populated token cache."""
+    project = workdir / "login"
+    project.mkdir()
+    content, _ = pyproject(sources=4)
+    (project / "pyproject.toml").write_text(content)
+    os.chdir(project)
+
+    cache_dir = workdir / "cache"
+    os.environ["PARTIFACT_CACHE_DIR"] = str(cache_dir)
+
+    def login(*repositories: str) -> Callable[[], object]:
+        return lambda: app(["login", *repositories], standalone_mode=False)
+
+    def clear_cache() -> None:
+        # a cold login runs in a fresh process, without cached tokens or clients
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        clear_client_pool()
+
+    aws = FakeAWS(latency)
+    results = {}
+    with mock.patch("boto3.Session", side_effect=aws.session):
+        results["login.cold"] = measure(login("repo-0"), repeat, setup=clear_cache)
+        results["login.warm"] = measure(login("repo-0"), repeat)
+        results["login.multi.cold"] = measure(
+            login("repo-0", "repo-1", "repo-2", "repo-3"), repeat, setup=clear_cache
+        )
+    results["login.aws_calls"] = {k: float(v) for k, v in aws.calls.items()}
+    return results
+
+
+def bench_configure(repeat: int) -> Results:
+    """Measures configuring poetry and pip natively and, if installed, via their CLIs."""
+    config = Configuration(
+        aws_account="123456789012",
+        aws_region="eu-west-1",
+        code_artifact_domain="domain",
+        code_artifact_repository="repo",
+    )
+
+    results = {
+        "configure.poetry.native": measure(
+            lambda: configure_poetry("repo", "token"), repeat
+        ),
+        "configure.pip.native": measure(lambda: configure_pip(config, "token"), repeat),
+    }
+
+    os.environ["PARTIFACT_CONFIG_WRITER"] = "subprocess"
+    try:
+        if shutil.which("poetry"):
+            results["configure.poetry.subprocess"] = measure(
+                lambda: configure_poetry("repo", "token"), repeat
+            )
+        if shutil.which("pip"):
+            results["configure.pip.subprocess"] = measure(
+                lambda: configure_pip(config, "token"), repeat
+            )
+    finally:
+        del os.environ["PARTIFACT_CONFIG_WRITER"]
+    return results
+
+
+def environment() -> Dict[str, str]:
+    """Describes what the benchmarks ran on, so runs can be compared."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def compare(current: Results, previous: Results) -> str:
+    """Formats the relative change of the median of every benchmark."""
+    lines = []
+    for name, stats in current.items():
+        before = previous.get(name, {}).get("median")
+        if "median" not in stats or not before:
+            continue
+        change = (stats["median"] - before) / before * 100
+        lines.append(
+            f"{name:<32} {before * 1000:9.2f} ms -> {stats['median'] * 1000:9.2f} ms"
+            f" ({change:+.1f}%)"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    """Runs the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="simulated AWS latency (s)"
+    )
+    parser.add_argument("--output", type=Path, help="write the results to a file")
+    parser.add_argument("--compare", type=Path, help="compare to an earlier run")
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        # the tools' user configuration lives below HOME on macOS and APPDATA
+        # on Windows, which must not be overwritten with fake tokens
+        os.environ["HOME"] = str(workdir / "config")
+        os.environ["XDG_CONFIG_HOME"] = str(workdir / "config")
+        os.environ["APPDATA"] = str(workdir / "config")
+        os.environ["POETRY_CONFIG_DIR"] = str(workdir / "config" / "pypoetry")
+        # keep fake tokens out of the system keyring too
+        os.environ["POETRY_KEYRING_ENABLED"] = "false"
+        os.environ.pop("PIP_CONFIG_FILE", None)
+        os.environ.pop("UV_CONFIG_FILE", None)
+
+        results: Results = {}
+        try:
+            results.update(bench_import(args.repeat))
+            results.update(bench_config(workdir, args.repeat))
+            results.update(bench_login(workdir, args.repeat, args.latency))
+            results.update(bench_configure(args.repeat))
+        finally:
+            os.chdir(cwd)
+
+    report = {**environment(), "latency": args.latency, "results": results}
+    sys.stdout.write(json.dumps(report, indent=2) + "\n")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    if args.compare:
+        previous = json.loads(args.compare.read_text())
+        sys.stdout.write(
+            f"\ncompared to {previous.get('commit', 'unknown')}:\n"
+            + compare(results, previous["results"])
+            + "\n"
+        )
+
+
+if __name__ == "__main__":
+    main()
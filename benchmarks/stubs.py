@@ -0,0 +1,272 @@
+"""Offline stand-ins for STS and CodeArtifact with injected latency."""
+
+import json
+import random
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+
+class FakeAWS:
+    """Issues tokens for any domain, sleeping to simulate network latency.
+
+    This plays the role of `DummyAWS` in the tests, so benchmarks measure
+    partifact rather than the network.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        """Creates the stand-in.
+
+        Args:
+            latency (float): How long each AWS call takes, in seconds.
+        """
+        self.latency = latency
+        self.calls: Dict[str, int] = {"assume_role": 0, "get_authorization_token": 0}
+        self._lock = threading.Lock()
+
+    def session(self, **kwargs: object) -> "FakeSession":
+        """Replaces `boto3.Session`."""
+        return FakeSession(self)
+
+    def call(self, operation: str) -> None:
+        """Records a call and waits for the configured latency."""
+        with self._lock:
+            self.calls[operation] += 1
+        time.sleep(self.latency)
+
+
+class FakeSession:
+    """Stands in for a boto3 session."""
+
+    def __init__(self, aws: FakeAWS) -> None:
+        """Creates a session issuing fake clients."""
+        self._aws = aws
+
+    def client(self, service: str, **kwargs: object) -> object:
+        """Returns a fake STS or CodeArtifact client."""
+        if service == "sts":
+            return FakeSTSClient(self._aws)
+        if service == "codeartifact":
+            return FakeCodeArtifactClient(self._aws)
+        raise ValueError(f"unexpected service {service}")
+
+
+class FakeSTSClient:
+    """Stands in for an STS client."""
+
+    def __init__(self, aws: FakeAWS) -> None:
+        """Creates a fake STS client."""
+        self._aws = aws
+
+    def assume_role(
+        self,
+        DurationSeconds: int = 3600,  # noqa: N803
+        **kwargs: object,
+    ) -> dict:
+        """Mimics `assume_role`."""
+        self._aws.call("assume_role")
+        return {
+            "Credentials": {
+                "AccessKeyId": "benchmark-key",
+                "SecretAccessKey": "benchmark-secret",
+                "SessionToken": "benchmark-session",
+                "Expiration": _expiry(DurationSeconds),
+            }
+        }
+
+
+class FakeCodeArtifactClient:
+    """Stands in for a CodeArtifact client."""
+
+    def __init__(self, aws: FakeAWS) -> None:
+        """Creates a fake CodeArtifact client."""
+        self._aws = aws
+
+    def get_authorization_token(self, domain: str = "", **kwargs: object) -> dict:
+        """Mimics `get_authorization_token`."""
+        self._aws.call("get_authorization_token")
+        return {"authorizationToken": f"token-{domain}", "expiration": _expiry(43200)}
+
+
+class AWSServer(ThreadingHTTPServer):
+    """An HTTP stand-in for the STS and CodeArtifact APIs used by partifact.
+
+    Unlike `FakeAWS`, it is reached through botocore itself, so it exercises
+    request signing, parsing and error handling. Point AWS_ENDPOINT_URL to
+    `url` to use it. Calls can be made to fail with a throttling error or an
+    internal error at random, to see how retries hold up.
+    """
+
+    daemon_threads = True
+    # hundreds of clients may connect at once
+    request_queue_size = 1024
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        """Creates the stand-in on a free port.
+
+        Args:
+            latency (float): How long each call takes, in seconds.
+            error_rate (float): The fraction of calls failing with an internal error.
+            throttle_rate (float): The fraction of calls failing with throttling.
+            seed (int, optional): Seeds the random failures.
+        """
+        super().__init__(("127.0.0.1", 0), _AWSHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.calls: Dict[str, int] = {
+            "assume_role": 0,
+            "get_authorization_token": 0,
+            "throttled": 0,
+            "errors": 0,
+        }
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        """The endpoint URL of the stand-in."""
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def call(self, operation: str) -> Optional[str]:
+        """Records a call, waits for the latency and returns the failure to inject."""
+        with self._lock:
+            self.calls[operation] += 1
+            roll = self._random.random()
+            failure = None
+            if roll < self.throttle_rate:
+                failure = "throttled"
+            elif roll < self.throttle_rate + self.error_rate:
+                failure = "errors"
+            if failure is not None:
+                self.calls[failure] += 1
+        time.sleep(self.latency)
+        return failure
+
+
+class _AWSHandler(BaseHTTPRequestHandler):
+    server: AWSServer
+
+    def do_POST(self) -> None:  # noqa: N802
+        length = int(self.headers.get("Content-Length") or 0)
+        body = urllib.parse.parse_qs(self.rfile.read(length).decode())
+        url = urllib.parse.urlsplit(self.path)
+
+        if url.path == "/v1/authorization-token":
+            domain = urllib.parse.parse_qs(url.query).get("domain", [""])[0]
+            self._authorization_token(domain)
+        elif body.get("Action") == ["AssumeRole"]:
+            duration = int(body.get("DurationSeconds", ["3600"])[0])
+            self._assume_role(duration)
+        else:
+            self._respond(404, "application/json", b"{}")
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+    def _authorization_token(self, domain: str) -> None:
+        failure = self.server.call("get_authorization_token")
+        if failure is not None:
+            code = (
+                "ThrottlingException"
+                if failure == "throttled"
+                else "InternalServerException"
+            )
+            status = 429 if failure == "throttled" else 500
+            body = json.dumps({"message": "injected failure"}).encode()
+            self._respond(status, "application/json", body, {"x-amzn-ErrorType": code})
+            return
+
+        expiration = _expiry(43200).timestamp()
+        body = json.dumps(
+            {"authorizationToken": f"token-{domain}", "expiration": expiration}
+        )
+        self._respond(200, "application/json", body.encode())
+
+    def _assume_role(self, duration: int) -> None:
+        failure = self.server.call("assume_role")
+        if failure is not None:
+            code = "Throttling" if failure == "throttled" else "InternalFailure"
+            status = 400 if failure == "throttled" else 500
+            body = (
+                "<ErrorResponse><Error><Type>Sender</Type>"
+                f"<Code>{code}</Code><Message>injected failure</Message>"
+                "</Error><RequestId>loadtest</RequestId></ErrorResponse>"
+            )
+            self._respond(status, "text/xml", body.encode())
+            return
+
+        expiration = _expiry(duration).strftime("%Y-%m-%dT%H:%M:%SZ")
+        body = (
+            '<AssumeRoleResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">'
+            "<AssumeRoleResult><Credentials>"
+            "<AccessKeyId>loadtest-key</AccessKeyId>"
+            "<SecretAccessKey>loadtest-secret</SecretAccessKey>"
+            "<SessionToken>loadtest-session</SessionToken>"
+            f"<Expiration>{expiration}</Expiration>"
+            "</Credentials><AssumedRoleUser>"
+            "<AssumedRoleId>loadtest:partifact-session</AssumedRoleId>"
+            "<Arn>arn:aws:sts::123456789012:assumed-role/loadtest</Arn>"
+            "</AssumedRoleUser></AssumeRoleResult>"
+            "<ResponseMetadata><RequestId>loadtest</RequestId></ResponseMetadata>"
+            "</AssumeRoleResponse>"
+        )
+        self._respond(200, "text/xml", body.encode())
+
+    def _respond(
+        self,
+        status: int,
+        content_type: str,
+        body: bytes,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _expiry(seconds: int) -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=seconds)
+
+
+def source_url(domain: str, repository: str, account: str = "123456789012") -> str:
+    """Returns the URL of a CodeArtifact repository as poetry would reference it."""
+    return f"https://{domain}-{account}.d.codeartifact.eu-west-1.amazonaws.com/pypi/{repository}/simple/"
+
+
+def pyproject(sources: int, padding: int = 0) -> Tuple[str, str]:
+    """Builds a pyproject.toml with the given number of CodeArtifact sources.
+
+    Args:
+        sources (int): The number of sources, spread over a handful of domains.
+        padding (int): The number of dependencies to add, to simulate large files.
+
+    Returns:
+        The content of the file and the name of its first source.
+    """
+    lines = ["[tool.poetry]", 'name = "benchmark"', 'version = "0.1.0"', ""]
+    lines.append("[tool.poetry.dependencies]")
+    lines.extend(f'package-{i} = "^{i % 10}.{i % 7}"' for i in range(padding))
+    for i in range(sources):
+        lines.extend(
+            [
+                "",
+                "[[tool.poetry.source]]",
+                f'name = "repo-{i}"',
+                f'url = "{source_url(f"domain-{i % 4}", f"repo-{i}")}"',
+            ]
+        )
+    return "\n".join(lines) + "\n", "repo-0"
@@ -0,0 +1,249 @@
+"""A long-running agent keeping tokens fresh and serving them over a Unix socket.
+
+The agent fetches tokens for its repositories up front and refreshes them ahead
+of expiry, so short-lived jobs can ask it for a token instead of going to AWS.
+Requests and responses are single lines of JSON:
+
+    {"repository": "my-repo"}
+    {"token": "...", "expiration": 1700000000.0}
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from partifact.auth_token import get_token
+from partifact.cache import CachedToken, TokenCache, cache_key, default_cache_dir
+from partifact.config import Configuration
+
+SOCKET_ENV = "PARTIFACT_AGENT_SOCKET"
+SOCKET_NAME = "agent.sock"
+DEFAULT_REFRESH_INTERVAL = 60.0
+DEFAULT_CLIENT_TIMEOUT = 2.0
+
+
+class AgentError(Exception):
+    """Raised if the agent cannot provide a token."""
+
+    pass
+
+
+class AgentUnavailable(AgentError):
+    """Raised if no agent is listening on the socket."""
+
+    pass
+
+
+def default_socket_path() -> Path:
+    """Returns the socket the agent listens on.
+
+    This can be overridden through the PARTIFACT_AGENT_SOCKET environment
+    variable, otherwise the socket is kept in the cache directory.
+    """
+    override = os.environ.get(SOCKET_ENV)
+    return Path(override) if override else default_cache_dir() / SOCKET_NAME
+
+
+class Agent:
+    """Holds tokens for a set of repositories and refreshes them ahead of expiry."""
+
+    def __init__(
+        self,
+        configurations: Dict[str, Configuration],
+        cache: TokenCache,
+        refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+    ) -> None:
+        """Creates an agent.
+
+        Args:
+            configurations (Dict[str, Configuration]): The configurations keyed
+                by poetry repository name.
+            cache (TokenCache): The cache tokens are shared through. Its refresh
+                margin determines how far ahead of expiry tokens are refreshed.
+            refresh_interval (float): The longest time between two checks for
+                tokens due a refresh, in seconds.
+        """
+        self.configurations = configurations
+        self.cache = cache
+        self.refresh_interval = refresh_interval
+        self._tokens: Dict[str, CachedToken] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._server: Optional[socketserver.BaseServer] = None
+
+    def token(self, repository: str) -> CachedToken:
+        """Returns a valid token for a repository, refreshing it if needed."""
+        try:
+            configuration = self.configurations[repository]
+        except KeyError:
+            raise AgentError(f"unknown repository {repository}")
+
+        key = cache_key(configuration)
+        with self._lock:
+            cached = self._tokens.get(key)
+        if cached is not None and cached.is_valid(self.cache.refresh_margin):
+            return cached
+        return self._fetch(configuration)
+
+    def refresh(self) -> float:
+        """Refreshes every token due a refresh.
+
+        Returns:
+            The number of seconds until the next refresh is due.
+        """
+        distinct = {cache_key(c): c for c in self.configurations.values()}
+        now = time.time()
+        next_due = now + self.refresh_interval
+
+        for key, configuration in distinct.items():
+            with self._lock:
+                cached = self._tokens.get(key)
+            if cached is None or not cached.is_valid(self.cache.refresh_margin, now):
+                cached = self._fetch(configuration)
+            next_due = min(next_due, cached.expiration - self.cache.refresh_margin)
+
+        return max(next_due - time.time(), 1.0)
+
+    def serve_forever(self, socket_path: Path) -> None:
+        """Serves tokens on the socket until `shutdown` is called.
+
+        Tokens are fetched before the socket starts accepting requests, and
+        refreshed in the background for as long as the agent runs.
+
+        Raises:
+            AgentError: If another agent is already listening on the socket.
+        """
+        if _is_listening(socket_path):
+            raise AgentError(f"an agent is already listening on {socket_path}")
+        self.refresh()
+
+        # the socket is left behind by an agent that didn't shut down cleanly
+        with contextlib.suppress(FileNotFoundError):
+            socket_path.unlink()
+        socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+        # create the socket accessible to the user only, rather than restricting
+        # it once other users may have connected already
+        umask = os.umask(0o077)
+        try:
+            server = _Server(str(socket_path), _Handler)
+        finally:
+            os.umask(umask)
+
+        with server:
+            server.agent = self
+            self._server = server
+
+            refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+            refresher.start()
+            try:
+                server.serve_forever()
+            finally:
+                self._stopped.set()
+                with contextlib.suppress(FileNotFoundError):
+                    socket_path.unlink()
+
+    def shutdown(self) -> None:
+        """Stops serving tokens."""
+        self._stopped.set()
+        if self._server is not None:
+            self._server.shutdown()
+
+    def _fetch(self, configuration: Configuration) -> CachedToken:
+        token = get_token(configuration, self.cache)
+        # fall back to the refresh interval if AWS didn't report the expiry
+        expiration = token.expiration or (
+            time.time() + self.cache.refresh_margin + self.refresh_interval
+        )
+        cached = CachedToken(token=str(token), expiration=expiration)
+        with self._lock:
+            self._tokens[cache_key(configuration)] = cached
+        return cached
+
+    def _refresh_loop(self) -> None:
+        delay = self.refresh_interval
+        while not self._stopped.wait(delay):
+            try:
+                delay = self.refresh()
+            except Exception:  # noqa: B902
+                # keep serving the tokens we have and try again later
+                delay = self.refresh_interval
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    agent: Agent
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: _Server
+
+    def handle(self) -> None:
+        try:
+            request = json.loads(self.rfile.readline())
+            cached = self.server.agent.token(request["repository"])
+            response = {"token": cached.token, "expiration": cached.expiration}
+        except (ValueError, KeyError, TypeError):
+            response = {"error": "invalid request"}
+        except Exception as err:  # noqa: B902
+            response = {"error": str(err) or type(err).__name__}
+
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+def _is_listening(socket_path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(DEFAULT_CLIENT_TIMEOUT)
+        try:
+            client.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+
+def request_token(
+    repository: str,
+    socket_path: Optional[Path] = None,
+    timeout: float = DEFAULT_CLIENT_TIMEOUT,
+) -> CachedToken:
+    """Asks a running agent for the token of a repository.
+
+    Args:
+        repository: The name of the poetry repository.
+        socket_path: The agent's socket, see `default_socket_path`.
+        timeout: How long to wait for the agent, in seconds.
+
+    Raises:
+        AgentUnavailable: If no agent is listening on the socket.
+        AgentError: If the agent failed to provide the token.
+    """
+    socket_path = socket_path or default_socket_path()
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        try:
+            client.connect(str(socket_path))
+        except OSError as err:
+            raise AgentUnavailable(f"no agent listening on {socket_path}: {err}")
+
+        request = json.dumps({"repository": repository}).encode() + b"\n"
+        client.sendall(request)
+        with client.makefile("rb") as f:
+            line = f.readline()
+
+    try:
+        response = json.loads(line)
+    except ValueError:
+        raise AgentError("invalid response from agent")
+
+    if "error" in response:
+        raise AgentError(response["error"])
+    return CachedToken(token=response["token"], expiration=response["expiration"])
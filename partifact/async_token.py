@@ -0,0 +1,189 @@
+"""Asyncio counterparts of `get_token` and `get_tokens`, for async services.
+
+They never block the event loop on AWS or the disk: calls go through an
+`AsyncAWS` client, which by default runs the boto3 calls of the synchronous
+path in worker threads, and the token cache and its locks are accessed in
+worker threads too. Tokens and role credentials are cached in the same
+`TokenCache` as the synchronous path, so either one reuses what the other
+fetched.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import List, Optional, Protocol, Sequence, Tuple
+
+from partifact.auth_token import (
+    DEFAULT_MAX_WORKERS,
+    Token,
+    assume_role,
+    cached_role_credentials,
+    codeartifact_token,
+    retry_time,
+    role_arn,
+    store_role_credentials,
+    token_key,
+)
+from partifact.cache import RoleCredentials, TokenCache
+from partifact.config import Configuration
+from partifact.lock import FileLock
+from partifact.metrics import increment
+from partifact.retry import DEFAULT_RETRY_POLICY, RetryPolicy
+
+
+class AsyncAWS(Protocol):
+    """The AWS calls needed to fetch a token, awaitable."""
+
+    async def assume_role(
+        self, configuration: Configuration, role_arn: str
+    ) -> RoleCredentials:
+        """Assumes the role of the configuration with its base credentials."""
+        ...
+
+    async def get_authorization_token(
+        self, configuration: Configuration, credentials: Optional[RoleCredentials]
+    ) -> Tuple[str, Optional[float]]:
+        """Returns a token and its expiry, using role credentials if given."""
+        ...
+
+
+class ThreadedAWS:
+    """Runs the boto3 calls of the synchronous path in worker threads.
+
+    boto3 has no asyncio support, so this keeps the event loop free while
+    retaining the same credential resolution, pooled clients and retries.
+    """
+
+    def __init__(self, retry: Optional[RetryPolicy] = None) -> None:
+        """Creates a client.
+
+        Args:
+            retry (Optional[RetryPolicy]): How throttled AWS calls are retried.
+        """
+        self.retry = retry or DEFAULT_RETRY_POLICY
+
+    async def assume_role(
+        self, configuration: Configuration, role_arn: str
+    ) -> RoleCredentials:
+        """Assumes the role of the configuration with its base credentials."""
+        return await asyncio.to_thread(assume_role, configuration, role_arn, self.retry)
+
+    async def get_authorization_token(
+        self, configuration: Configuration, credentials: Optional[RoleCredentials]
+    ) -> Tuple[str, Optional[float]]:
+        """Returns a token and its expiry, using role credentials if given."""
+        return await asyncio.to_thread(
+            codeartifact_token, configuration, credentials, self.retry
+        )
+
+
+async def get_token(
+    configuration: Configuration,
+    cache: Optional[TokenCache] = None,
+    retry: Optional[RetryPolicy] = None,
+    aws: Optional[AsyncAWS] = None,
+) -> Token:
+    """Returns a valid CodeArtifact token.
+
+    Args:
+        configuration: The partifact configuration to use.
+        cache: The token cache to use, see `partifact.auth_token.get_token`.
+        retry: How throttled AWS calls are retried by the default client.
+        aws: The client making the AWS calls. Defaults to `ThreadedAWS`.
+
+    Returns:
+        A valid CodeArtifact token with its expiry.
+    """
+    aws = aws or ThreadedAWS(retry)
+    if cache is None:
+        return Token(*await _fetch_token(configuration, aws))
+
+    cached = await asyncio.to_thread(cache.get, configuration)
+    if cached is not None:
+        increment("cache.hit")
+        return Token(cached.token, cached.expiration)
+    increment("cache.miss")
+
+    lock = await asyncio.to_thread(
+        cache.lock, configuration, retry_time(configuration, retry)
+    )
+    await _acquire(lock)
+    try:
+        # whoever held the lock before us may have fetched the token already
+        cached = await asyncio.to_thread(cache.get, configuration)
+        if cached is not None:
+            return Token(cached.token, cached.expiration)
+
+        token, expiration = await _fetch_token(configuration, aws, cache)
+        if expiration is not None:
+            await asyncio.to_thread(cache.put, configuration, token, expiration)
+    finally:
+        await asyncio.to_thread(lock.release)
+    return Token(token, expiration)
+
+
+async def get_tokens(
+    configurations: Sequence[Configuration],
+    cache: Optional[TokenCache] = None,
+    max_concurrency: int = DEFAULT_MAX_WORKERS,
+    retry: Optional[RetryPolicy] = None,
+    aws: Optional[AsyncAWS] = None,
+) -> List[Token]:
+    """Returns valid CodeArtifact tokens for several configurations.
+
+    Each distinct token is fetched once, see
+    `partifact.auth_token.get_tokens`, and distinct tokens are fetched
+    concurrently.
+
+    Args:
+        configurations: The partifact configurations to get tokens for.
+        cache: The token cache to use, see `get_token`.
+        max_concurrency: The maximum number of tokens fetched at the same time.
+        retry: How throttled AWS calls are retried by the default client.
+        aws: The client making the AWS calls. Defaults to `ThreadedAWS`.
+
+    Returns:
+        The tokens in the same order as the configurations.
+    """
+    aws = aws or ThreadedAWS(retry)
+    distinct = {token_key(c): c for c in configurations}
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch(configuration: Configuration) -> Token:
+        async with semaphore:
+            return await get_token(configuration, cache, aws=aws)
+
+    results = await asyncio.gather(*(fetch(c) for c in distinct.values()))
+    tokens = dict(zip(distinct, results))
+    return [tokens[token_key(c)] for c in configurations]
+
+
+async def _acquire(lock: FileLock) -> None:
+    loop = asyncio.get_running_loop()
+    acquiring = loop.run_in_executor(None, lock.acquire)
+    try:
+        await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        # the thread can't be stopped, and would otherwise hold the lock until
+        # it goes stale, so it is given back as soon as the thread has it
+        acquiring.add_done_callback(lambda _: loop.run_in_executor(None, lock.release))
+        raise
+
+
+async def _fetch_token(
+    configuration: Configuration,
+    aws: AsyncAWS,
+    cache: Optional[TokenCache] = None,
+) -> Tuple[str, Optional[float]]:
+    credentials = None
+    if configuration.aws_role_name:
+        credentials = await asyncio.to_thread(
+            cached_role_credentials, configuration, cache
+        )
+        if credentials is None:
+            credentials = await aws.assume_role(configuration, role_arn(configuration))
+            await asyncio.to_thread(
+                store_role_credentials, configuration, cache, credentials
+            )
+
+    return await aws.get_authorization_token(configuration, credentials)
@@ -1,45 +1,280 @@
-import boto3
+from __future__ import annotations
 
+import time
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from partifact.cache import RoleCredentials, TokenCache, cache_key
 from partifact.config import Configuration
+from partifact.credentials import client_pool
+from partifact.metrics import increment
+from partifact.retry import DEFAULT_RETRY_POLICY, RetryPolicy, call_with_retry
+from partifact.timing import phase
 
 AWS_ROLE_TEMPLATE = "arn:aws:iam::{account}:role/{role_name}"
+DEFAULT_MAX_WORKERS = 8
+
+
+class Token(str):
+    """A CodeArtifact token, usable wherever its string is, along with its expiry.
+
+    Attributes:
+        expiration (float, optional): When the token expires, as a UNIX
+            timestamp, or None if AWS didn't report it.
+    """
+
+    expiration: Optional[float]
+
+    def __new__(cls, value: str, expiration: Optional[float] = None) -> Token:
+        """Creates a token.
 
+        Args:
+            value (str): The CodeArtifact authorisation token.
+            expiration (Optional[float]): When the token expires, if known.
+        """
+        token = super().__new__(cls, value)
+        token.expiration = expiration
+        return token
 
-def get_token(configuration: Configuration) -> str:
+    def remaining(self, now: Optional[float] = None) -> Optional[float]:
+        """Returns how many seconds the token is still valid for, if known."""
+        if self.expiration is None:
+            return None
+        now = time.time() if now is None else now
+        return max(self.expiration - now, 0.0)
+
+
+def get_token(
+    configuration: Configuration,
+    cache: Optional[TokenCache] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> Token:
     """Returns a valid CodeArtifact token.
 
     Args:
         configuration: The partifact configuration to use.
+        cache: If supplied, a still valid token is returned from the cache
+            without any calls to AWS, and newly fetched tokens are stored in it.
+            Concurrent fetches of the same token on the host are serialised,
+            so only the first caller goes to AWS.
+        retry: How throttled AWS calls are retried.
 
     Returns:
-        A valid CodeArtifact token.
+        A valid CodeArtifact token with its expiry.
+    """
+    if cache is None:
+        return Token(*_fetch_token(configuration, retry=retry))
+
+    with phase("cache.lookup"):
+        cached = cache.get(configuration)
+    if cached is not None:
+        increment("cache.hit")
+        return Token(cached.token, cached.expiration)
+    increment("cache.miss")
+
+    with cache.lock(configuration, retry_time(configuration, retry)):
+        # whoever held the lock before us may have fetched the token already
+        cached = cache.get(configuration)
+        if cached is not None:
+            return Token(cached.token, cached.expiration)
+
+        token, expiration = _fetch_token(configuration, cache, retry)
+        if expiration is not None:
+            cache.put(configuration, token, expiration)
+    return Token(token, expiration)
+
+
+def get_tokens(
+    configurations: Sequence[Configuration],
+    cache: Optional[TokenCache] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    retry: Optional[RetryPolicy] = None,
+) -> List[Token]:
+    """Returns valid CodeArtifact tokens for several configurations.
+
+    Configurations sharing a domain, credentials and token duration share a
+    token, so each distinct token is fetched only once. Distinct tokens are
+    fetched concurrently.
+
+    Args:
+        configurations: The partifact configurations to get tokens for.
+        cache: The token cache to use, see `get_token`.
+        max_workers: The maximum number of tokens fetched at the same time.
+        retry: How throttled AWS calls are retried.
+
+    Returns:
+        The tokens in the same order as the configurations.
+    """
+    distinct = {token_key(c): c for c in configurations}
+
+    if len(distinct) <= 1:
+        tokens = {key: get_token(c, cache, retry) for key, c in distinct.items()}
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(distinct))) as pool:
+            futures = {
+                key: pool.submit(get_token, c, cache, retry)
+                for key, c in distinct.items()
+            }
+            tokens = {key: future.result() for key, future in futures.items()}
+
+    return [tokens[token_key(c)] for c in configurations]
+
+
+def token_key(configuration: Configuration) -> Tuple[str, Optional[int]]:
+    """Returns the key of the distinct tokens `get_tokens` fetches.
+
+    Repositories sharing a cache key share a token only if they also ask
+    for the same duration, as a token fetched for one may not last for the
+    other.
     """
-    session = boto3.Session(
-        profile_name=configuration.aws_profile, region_name=configuration.aws_region
+    return cache_key(configuration), configuration.code_artifact_token_duration
+
+
+def retry_time(
+    configuration: Configuration, retry: Optional[RetryPolicy] = None
+) -> float:
+    """Returns the longest time fetching a token may spend retrying AWS calls.
+
+    Waiting for the token lock has to outlast it, see `TokenCache.lock`.
+    """
+    calls = 2 if configuration.aws_role_name else 1
+    return calls * (retry or DEFAULT_RETRY_POLICY).deadline
+
+
+def role_arn(configuration: Configuration) -> str:
+    """Returns the ARN of the role the configuration assumes."""
+    return AWS_ROLE_TEMPLATE.format(
+        account=configuration.aws_account,
+        role_name=configuration.aws_role_name,
     )
 
-    if configuration.aws_role_name:
-        role_arn = AWS_ROLE_TEMPLATE.format(
-            account=configuration.aws_account,
-            role_name=configuration.aws_role_name,
-        )
-        session = _assume_role(session, role_arn, configuration.aws_region)
 
-    client = session.client("codeartifact")
-    response = client.get_authorization_token(
-        domain=configuration.code_artifact_domain,
-        domainOwner=configuration.aws_account,
+def cached_role_credentials(
+    configuration: Configuration, cache: Optional[TokenCache]
+) -> Optional[RoleCredentials]:
+    """Returns the cached credentials of the configuration's role, if still valid."""
+    if cache is None:
+        return None
+    return cache.get_role_credentials(
+        role_arn(configuration),
+        configuration.aws_profile,
+        configuration.aws_credential_source,
     )
-    return response["authorizationToken"]
 
 
-def _assume_role(session: boto3.Session, role_arn: str, region: str) -> boto3.Session:
-    client = session.client("sts")
-    response = client.assume_role(RoleArn=role_arn, RoleSessionName="partifact-session")
+def store_role_credentials(
+    configuration: Configuration,
+    cache: Optional[TokenCache],
+    credentials: RoleCredentials,
+) -> None:
+    """Caches the credentials of the configuration's role, if their expiry is known."""
+    if cache is None or not credentials.expiration:
+        return
+    cache.put_role_credentials(
+        role_arn(configuration),
+        configuration.aws_profile,
+        credentials,
+        configuration.aws_credential_source,
+    )
+
 
-    return boto3.Session(
-        aws_access_key_id=response["Credentials"]["AccessKeyId"],
-        aws_secret_access_key=response["Credentials"]["SecretAccessKey"],
-        aws_session_token=response["Credentials"]["SessionToken"],
-        region_name=region,
+def assume_role(
+    configuration: Configuration,
+    role_arn: str,
+    retry: RetryPolicy = DEFAULT_RETRY_POLICY,
+) -> RoleCredentials:
+    """Assumes a role with the base credentials of the configuration."""
+    client = _client("sts", configuration, None, retry)
+    duration = configuration.aws_role_duration
+    kwargs = {"DurationSeconds": duration} if duration else {}
+    with phase("aws.assume_role"):
+        response = call_with_retry(
+            "assume_role",
+            lambda: client.assume_role(
+                RoleArn=role_arn, RoleSessionName="partifact-session", **kwargs
+            ),
+            retry,
+        )
+
+    credentials = response["Credentials"]
+    return RoleCredentials(
+        access_key_id=credentials["AccessKeyId"],
+        secret_access_key=credentials["SecretAccessKey"],
+        session_token=credentials["SessionToken"],
+        expiration=_timestamp(credentials.get("Expiration")) or 0,
     )
+
+
+def codeartifact_token(
+    configuration: Configuration,
+    credentials: Optional[RoleCredentials],
+    retry: RetryPolicy,
+) -> Tuple[str, Optional[float]]:
+    """Fetches a token and its expiry, using role credentials if given."""
+    client = _client("codeartifact", configuration, credentials, retry)
+    duration = configuration.code_artifact_token_duration
+    kwargs = {"durationSeconds": duration} if duration is not None else {}
+    with phase("aws.get_authorization_token"):
+        response = call_with_retry(
+            "get_authorization_token",
+            lambda: client.get_authorization_token(
+                domain=configuration.code_artifact_domain,
+                domainOwner=configuration.aws_account,
+                **kwargs,
+            ),
+            retry,
+        )
+    return response["authorizationToken"], _timestamp(response.get("expiration"))
+
+
+def _fetch_token(
+    configuration: Configuration,
+    cache: Optional[TokenCache] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> Tuple[str, Optional[float]]:
+    # boto3 takes longer to import than the rest of the CLI, so it's only
+    # loaded once a token actually has to be fetched
+    with phase("aws.import"):
+        import boto3  # noqa: F401
+
+    retry = retry or DEFAULT_RETRY_POLICY
+    credentials = None
+    if configuration.aws_role_name:
+        credentials = _role_credentials(configuration, cache, retry)
+
+    return codeartifact_token(configuration, credentials, retry)
+
+
+def _client(
+    service: str,
+    configuration: Configuration,
+    credentials: Optional[RoleCredentials],
+    retry: RetryPolicy,
+) -> Any:
+    # creating a client resolves the credentials, and is only done once per
+    # process for the same credentials and region
+    with phase(f"aws.client.{service}"):
+        return client_pool().client(
+            service,
+            configuration.aws_profile,
+            configuration.aws_region,
+            configuration.aws_credential_source,
+            credentials,
+            retry.botocore_config(),
+        )
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    return value.timestamp() if value is not None else None
+
+
+def _role_credentials(
+    configuration: Configuration, cache: Optional[TokenCache], retry: RetryPolicy
+) -> RoleCredentials:
+    credentials = cached_role_credentials(configuration, cache)
+    if credentials is None:
+        credentials = assume_role(configuration, role_arn(configuration), retry)
+        store_role_credentials(configuration, cache, credentials)
+    return credentials
@@ -0,0 +1,288 @@
+"""On-disk cache for CodeArtifact tokens."""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+from partifact.config import Configuration
+from partifact.files import atomic_write
+from partifact.lock import DEFAULT_LOCK_TIMEOUT, DEFAULT_STALE_AFTER, FileLock
+
+CACHE_DIR_ENV = "PARTIFACT_CACHE_DIR"
+DEFAULT_REFRESH_MARGIN = 300
+TOKEN_FILE_SUFFIX = ".token.json"
+ROLE_FILE_SUFFIX = ".role.json"
+LOCK_FILE_SUFFIX = ".lock"
+DEFAULT_ROLE_REFRESH_MARGIN = 60
+
+
+def default_cache_dir() -> Path:
+    """Returns the directory partifact caches its state in.
+
+    This can be overridden through the PARTIFACT_CACHE_DIR environment variable,
+    otherwise it follows the XDG base directory specification.
+    """
+    override = os.environ.get(CACHE_DIR_ENV)
+    if override:
+        return Path(override)
+
+    xdg_cache_home = os.environ.get("XDG_CACHE_HOME")
+    base = Path(xdg_cache_home) if xdg_cache_home else Path.home() / ".cache"
+    return base / "partifact"
+
+
+def cache_key(configuration: Configuration) -> str:
+    """Returns the cache key identifying the token of a configuration.
+
+    Tokens are issued per domain, so repositories within the same domain
+    accessed with the same credentials share a key. Credentials taken from
+    different sources may belong to different identities, so the source is
+    part of the key too.
+    """
+    import hashlib
+
+    fields = (
+        configuration.aws_account,
+        configuration.aws_region,
+        configuration.code_artifact_domain,
+        configuration.aws_role_name or "",
+        configuration.aws_profile or "",
+        configuration.aws_credential_source or "",
+    )
+    return hashlib.sha256("\0".join(fields).encode()).hexdigest()
+
+
+def role_cache_key(
+    role_arn: str, profile: Optional[str], credential_source: Optional[str] = None
+) -> str:
+    """Returns the cache key identifying the credentials of an assumed role.
+
+    The profile and credential source are part of the key, as they determine
+    the credentials the role is assumed with.
+    """
+    import hashlib
+
+    fields = (role_arn, profile or "", credential_source or "")
+    return hashlib.sha256("\0".join(fields).encode()).hexdigest()
+
+
+@dataclass(frozen=True)
+class CachedToken:
+    """A cached CodeArtifact token.
+
+    Attributes:
+        token (str): The CodeArtifact authorisation token.
+        expiration (float): When the token expires, as a UNIX timestamp.
+    """
+
+    token: str
+    expiration: float
+
+    def is_valid(self, margin: float = 0, now: Optional[float] = None) -> bool:
+        """Whether the token is still valid for at least `margin` seconds."""
+        now = time.time() if now is None else now
+        return self.expiration - margin > now
+
+
+@dataclass(frozen=True)
+class RoleCredentials:
+    """Temporary credentials of an assumed role.
+
+    Attributes:
+        access_key_id (str): The access key ID.
+        secret_access_key (str): The secret access key.
+        session_token (str): The session token.
+        expiration (float): When the credentials expire, as a UNIX timestamp.
+    """
+
+    access_key_id: str
+    secret_access_key: str
+    session_token: str
+    expiration: float
+
+    def is_valid(self, margin: float = 0, now: Optional[float] = None) -> bool:
+        """Whether the credentials are still valid for at least `margin` seconds."""
+        now = time.time() if now is None else now
+        return self.expiration - margin > now
+
+
+class TokenCache:
+    """Stores CodeArtifact tokens on disk along with their expiry.
+
+    Each token is kept in its own file, so concurrent writers for different
+    domains never contend with each other. Credentials of assumed roles are
+    kept alongside the tokens, so a fresh token for a role doesn't require
+    assuming it again.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        refresh_margin: float = DEFAULT_REFRESH_MARGIN,
+        lock_timeout: float = DEFAULT_LOCK_TIMEOUT,
+        lock_stale_after: float = DEFAULT_STALE_AFTER,
+        role_refresh_margin: float = DEFAULT_ROLE_REFRESH_MARGIN,
+    ) -> None:
+        """Creates a token cache.
+
+        Args:
+            directory (Path, optional): Where to store the tokens.
+                Defaults to the result of `default_cache_dir`.
+            refresh_margin (float): Cached tokens expiring within this many
+                seconds are treated as stale, so a fresh one is fetched ahead
+                of expiry.
+            lock_timeout (float): How long to wait for another process
+                fetching the same token before fetching it regardless, on top
+                of the time the other process may spend retrying AWS calls.
+            lock_stale_after (float): How long a fetch may hold the lock before
+                it is considered abandoned.
+            role_refresh_margin (float): Cached role credentials expiring
+                within this many seconds are treated as stale.
+        """
+        self.directory = directory or default_cache_dir()
+        self.refresh_margin = refresh_margin
+        self.lock_timeout = lock_timeout
+        self.lock_stale_after = lock_stale_after
+        self.role_refresh_margin = role_refresh_margin
+
+    def path(self, configuration: Configuration) -> Path:
+        """The path of the file storing the token for the configuration."""
+        return self.directory / f"{cache_key(configuration)}{TOKEN_FILE_SUFFIX}"
+
+    def lock(self, configuration: Configuration, retry_time: float = 0.0) -> FileLock:
+        """Returns the lock guarding fetches of the configuration's token.
+
+        Holding it while fetching ensures concurrent processes on the host
+        request a token only once, with the rest picking it up from the cache.
+
+        Args:
+            configuration (Configuration): The configuration of the token.
+            retry_time (float): The longest a fetch may spend retrying AWS
+                calls, in seconds. Waiters outlast it, as otherwise they would
+                all give up and call AWS at once while it is throttling.
+        """
+        self._ensure_directory()
+        timeout = self.lock_timeout + retry_time
+        return FileLock(
+            self.directory / f"{cache_key(configuration)}{LOCK_FILE_SUFFIX}",
+            timeout=timeout,
+            stale_after=max(self.lock_stale_after, timeout),
+        )
+
+    def get(self, configuration: Configuration) -> Optional[CachedToken]:
+        """Returns the cached token if it is still valid beyond the refresh margin.
+
+        If the configuration asks for tokens lasting a given duration, the
+        cached token must also last that long, less the refresh margin.
+        """
+        cached = self._read(self.path(configuration))
+        margin = self.refresh_margin
+        duration = configuration.code_artifact_token_duration
+        if duration:
+            margin = max(margin, duration - margin)
+        if cached is None or not cached.is_valid(margin):
+            return None
+        return cached
+
+    def peek(self, configuration: Configuration) -> Optional[CachedToken]:
+        """Returns the cached token of a configuration even if it has expired."""
+        return self._read(self.path(configuration))
+
+    def put(self, configuration: Configuration, token: str, expiration: float) -> None:
+        """Stores a token, evicting any expired entries along the way."""
+        self.evict_expired()
+        content = json.dumps({"token": token, "expiration": expiration})
+        self._write(self.path(configuration), content)
+
+    def role_path(
+        self,
+        role_arn: str,
+        profile: Optional[str],
+        credential_source: Optional[str] = None,
+    ) -> Path:
+        """The path of the file storing the credentials of an assumed role."""
+        key = role_cache_key(role_arn, profile, credential_source)
+        return self.directory / f"{key}{ROLE_FILE_SUFFIX}"
+
+    def get_role_credentials(
+        self,
+        role_arn: str,
+        profile: Optional[str],
+        credential_source: Optional[str] = None,
+    ) -> Optional[RoleCredentials]:
+        """Returns the cached credentials of a role if they are still valid."""
+        try:
+            with open(self.role_path(role_arn, profile, credential_source)) as f:
+                credentials = RoleCredentials(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+        if not credentials.is_valid(self.role_refresh_margin):
+            return None
+        return credentials
+
+    def put_role_credentials(
+        self,
+        role_arn: str,
+        profile: Optional[str],
+        credentials: RoleCredentials,
+        credential_source: Optional[str] = None,
+    ) -> None:
+        """Stores the credentials of an assumed role."""
+        self.evict_expired()
+        content = json.dumps(asdict(credentials))
+        self._write(self.role_path(role_arn, profile, credential_source), content)
+
+    def evict_expired(self) -> int:
+        """Removes expired tokens and role credentials from the cache.
+
+        Returns:
+            The number of entries removed.
+        """
+        if not self.directory.is_dir():
+            return 0
+
+        removed = 0
+        now = time.time()
+        for suffix in (TOKEN_FILE_SUFFIX, ROLE_FILE_SUFFIX):
+            for path in self.directory.glob(f"*{suffix}"):
+                expiration = self._read_expiration(path)
+                if expiration is None or expiration <= now:
+                    try:
+                        path.unlink()
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+        return removed
+
+    def _ensure_directory(self) -> None:
+        # the cache holds credentials, so keep it private to the user
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    def _write(self, path: Path, content: str) -> None:
+        self._ensure_directory()
+        atomic_write(path, content)
+
+    @staticmethod
+    def _read(path: Path) -> Optional[CachedToken]:
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            return CachedToken(
+                token=data["token"], expiration=float(data["expiration"])
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    @staticmethod
+    def _read_expiration(path: Path) -> Optional[float]:
+        try:
+            with open(path, "r") as f:
+                return float(json.load(f)["expiration"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
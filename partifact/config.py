@@ -1,13 +1,24 @@
 from __future__ import annotations
 
+import dataclasses
+import json
+import os
 import re
-from dataclasses import dataclass
-from typing import Optional
+import threading
+import warnings
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
 
-from tomlkit import parse as parse_toml
-from tomlkit.exceptions import TOMLKitError
+from partifact.files import atomic_write
 
 CONFIG_PATH = "./pyproject.toml"
+CONFIG_FILE_NAME = "pyproject.toml"
+CONFIG_DIR_ENV = "PARTIFACT_CONFIG_DIR"
+REGISTRY_FILE_NAME = "repositories.json"
+REGISTRY_VERSION = 1
+DEFAULT_SCAN_WORKERS = 8
+SKIPPED_DIRECTORIES = frozenset({"__pycache__", "node_modules", "site-packages"})
 URL_PATTERN = r"https://(?P<code_artifact_domain>.*)-(?P<aws_account>\d+).d.codeartifact.(?P<aws_region>[a-z0-9-]+).amazonaws.com/pypi/(?P<code_artifact_repository>.*)"
 
 
@@ -28,6 +39,18 @@ class Configuration:
         aws_role_name (str, optional):
             If specified, this role will be assumed to get the authorisation
             token.
+        aws_role_duration (int, optional):
+            How long the credentials of the assumed role should last, in seconds.
+            Defaults to the role's default session duration.
+        aws_credential_source (str, optional):
+            Where the AWS credentials are taken from, one of "env", "profile",
+            "web-identity" or "container". If not specified, the
+            PARTIFACT_CREDENTIAL_SOURCE environment variable is used, falling
+            back to the resolution logic of boto3.
+        code_artifact_token_duration (int, optional):
+            How long CodeArtifact tokens should last, in seconds, either 0 to
+            last as long as the credentials of an assumed role, or between 900
+            and 43200. Defaults to CodeArtifact's default of 12 hours.
     """
 
     aws_account: str
@@ -36,6 +59,9 @@ class Configuration:
     code_artifact_repository: str
     aws_profile: Optional[str] = None
     aws_role_name: Optional[str] = None
+    aws_role_duration: Optional[int] = None
+    aws_credential_source: Optional[str] = None
+    code_artifact_token_duration: Optional[int] = None
 
     @classmethod
     def load(
@@ -43,33 +69,386 @@ class Configuration:
         repository: str,
         profile: Optional[str] = None,
         role_name: Optional[str] = None,
+        role_duration: Optional[int] = None,
+        credential_source: Optional[str] = None,
     ) -> Configuration:
         """Loads the configuration for the supplied repository.
 
+        The repository is read from the nearest pyproject.toml, or from the
+        registry of repositories set up with `partifact configure` if no
+        pyproject.toml defines it. The registry's stored defaults apply to any
+        argument not given, unless the pyproject.toml defines the repository
+        differently, in which case the registry entry is ignored with a warning.
+
         Args:
             repository (str): The name of the section in the configuration file,
                 which should match the name of the poetry repository.
             profile (Optional[str]): The AWS profile to use.
             role_name (Optional[str]): The name of the AWS role to use.
+            role_duration (Optional[int]): The session duration of the role.
+            credential_source (Optional[str]): Where AWS credentials are taken from.
         """
-        try:
-            with open(CONFIG_PATH, "r") as f:
-                config = parse_toml(f.read())
-        except FileNotFoundError:
-            raise MissingConfiguration("no pyproject.toml found")
-        except TOMLKitError:
-            raise MissingConfiguration("invalid pyproject.toml")
-
-        try:
-            source = config["tool"]["poetry"]["source"]  # type: ignore
-            repo = next(s for s in source if s["name"] == repository)  # type: ignore
-            url = repo["url"]
-        except (TOMLKitError, StopIteration):
+        registered = _registered(repository)
+        url = _project_source(repository)
+
+        if url is not None:
+            parsed_url = parse_url(url)
+            if registered is not None and parsed_url != _location(registered):
+                warnings.warn(
+                    f"{repository} is configured differently in the registry and"
+                    f" {find_config()}, ignoring the registry",
+                    ConfigurationWarning,
+                    stacklevel=2,
+                )
+                registered = None
+
+        if registered is not None:
+            return dataclasses.replace(
+                registered,
+                aws_profile=profile or registered.aws_profile,
+                aws_role_name=role_name or registered.aws_role_name,
+                aws_role_duration=role_duration or registered.aws_role_duration,
+                aws_credential_source=(
+                    credential_source or registered.aws_credential_source
+                ),
+            )
+
+        if url is None:
             raise MissingConfiguration(f"no configuration found for {repository}")
 
-        parsed_url = parse_url(url)
+        return Configuration(
+            aws_profile=profile,
+            aws_role_name=role_name,
+            aws_role_duration=role_duration,
+            aws_credential_source=credential_source,
+            **parsed_url,
+        )
+
+    @classmethod
+    def load_all(
+        cls,
+        profile: Optional[str] = None,
+        role_name: Optional[str] = None,
+        role_duration: Optional[int] = None,
+        credential_source: Optional[str] = None,
+    ) -> Dict[str, Configuration]:
+        """Loads the configuration of every CodeArtifact source in the config file.
+
+        Sources not pointing to CodeArtifact, such as PyPI mirrors, are skipped.
+
+        Args:
+            profile (Optional[str]): The AWS profile to use.
+            role_name (Optional[str]): The name of the AWS role to use.
+            role_duration (Optional[int]): The session duration of the role.
+            credential_source (Optional[str]): Where AWS credentials are taken from.
+
+        Returns:
+            The configurations keyed by the name of the poetry repository.
+        """
+        configurations = {}
+        for name, url in load_sources().items():
+            if not re.match(URL_PATTERN, url):
+                continue
+            configurations[name] = Configuration(
+                aws_profile=profile,
+                aws_role_name=role_name,
+                aws_role_duration=role_duration,
+                aws_credential_source=credential_source,
+                **parse_url(url),
+            )
+        return configurations
+
+    @classmethod
+    def scan(
+        cls,
+        directory: Union[str, Path],
+        profile: Optional[str] = None,
+        role_name: Optional[str] = None,
+        role_duration: Optional[int] = None,
+        credential_source: Optional[str] = None,
+        max_workers: int = DEFAULT_SCAN_WORKERS,
+    ) -> Dict[str, Configuration]:
+        """Loads every CodeArtifact source of the pyproject.toml files in a tree.
+
+        This is meant for monorepos, where many packages declare the same
+        sources. The files are parsed concurrently, and each distinct source
+        URL is only parsed once.
+
+        Args:
+            directory (Union[str, Path]): The root of the tree to scan.
+            profile (Optional[str]): The AWS profile to use.
+            role_name (Optional[str]): The name of the AWS role to use.
+            role_duration (Optional[int]): The session duration of the role.
+            credential_source (Optional[str]): Where AWS credentials are taken from.
+            max_workers (int): The maximum number of files parsed at once.
+
+        Returns:
+            The configurations keyed by the name of the poetry repository.
+
+        Raises:
+            InvalidConfiguration: If packages use the same repository name for
+                different CodeArtifact domains, which poetry can't tell apart.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            all_sources = list(pool.map(load_sources, find_configs(directory)))
+
+        parsed_urls: Dict[str, Optional[dict]] = {}
+        configurations: Dict[str, Configuration] = {}
+        for sources in all_sources:
+            for name, url in sources.items():
+                if url not in parsed_urls:
+                    is_code_artifact = re.match(URL_PATTERN, url)
+                    parsed_urls[url] = parse_url(url) if is_code_artifact else None
 
-        return Configuration(aws_profile=profile, aws_role_name=role_name, **parsed_url)  # type: ignore
+                parsed_url = parsed_urls[url]
+                if parsed_url is None:
+                    continue
+
+                configuration = Configuration(
+                    aws_profile=profile,
+                    aws_role_name=role_name,
+                    aws_role_duration=role_duration,
+                    aws_credential_source=credential_source,
+                    **parsed_url,
+                )
+                existing = configurations.setdefault(name, configuration)
+                if _domain(existing) != _domain(configuration):
+                    raise InvalidConfiguration(
+                        f"repository {name} refers to different CodeArtifact domains"
+                    )
+        return configurations
+
+
+def _domain(configuration: Configuration) -> Tuple[str, str, str]:
+    return (
+        configuration.aws_account,
+        configuration.aws_region,
+        configuration.code_artifact_domain,
+    )
+
+
+def find_configs(directory: Union[str, Path]) -> Iterator[Path]:
+    """Yields every pyproject.toml in a tree.
+
+    Hidden directories, such as .git and .venv, and other directories that
+    never hold projects of their own are not descended into.
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(
+            d for d in dirs if not d.startswith(".") and d not in SKIPPED_DIRECTORIES
+        )
+        if CONFIG_FILE_NAME in files:
+            yield Path(root) / CONFIG_FILE_NAME
+
+
+_sources_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, str]]] = {}
+_sources_lock = threading.Lock()
+
+
+def find_config(start: Union[str, Path, None] = None) -> Optional[Path]:
+    """Returns the nearest pyproject.toml in the directory or any of its parents.
+
+    Args:
+        start: The directory to start looking in, the current one by default.
+    """
+    directory = Path(start or os.getcwd()).absolute()
+    for candidate in (directory, *directory.parents):
+        path = candidate / CONFIG_FILE_NAME
+        if path.is_file():
+            return path
+    return None
+
+
+def load_sources(path: Union[str, Path, None] = None) -> Dict[str, str]:
+    """Returns the URLs of the poetry sources in the config file, keyed by name.
+
+    The parsed sources are memoised per file for as long as it is unchanged,
+    so loading several repositories only parses the file once.
+
+    Args:
+        path: The config file to read. Defaults to the nearest pyproject.toml
+            found by `find_config`.
+    """
+    path = path or find_config()
+    if path is None:
+        raise MissingConfiguration("no pyproject.toml found")
+
+    key = os.path.abspath(path)
+    try:
+        stat = os.stat(key)
+    except FileNotFoundError:
+        raise MissingConfiguration("no pyproject.toml found")
+    version = (stat.st_mtime_ns, stat.st_size)
+
+    with _sources_lock:
+        cached = _sources_cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+    sources = _parse_sources(key)
+    with _sources_lock:
+        _sources_cache[key] = (version, sources)
+    return sources
+
+
+def clear_sources_cache() -> None:
+    """Forgets any memoised sources, forcing config files to be parsed again."""
+    with _sources_lock:
+        _sources_cache.clear()
+
+
+_registry_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, Configuration]]] = {}
+
+
+def default_config_dir() -> Path:
+    """Returns the directory partifact keeps its user configuration in.
+
+    This can be overridden through the PARTIFACT_CONFIG_DIR environment
+    variable, otherwise it follows the XDG base directory specification.
+    """
+    override = os.environ.get(CONFIG_DIR_ENV)
+    if override:
+        return Path(override)
+
+    xdg_config_home = os.environ.get("XDG_CONFIG_HOME")
+    base = Path(xdg_config_home) if xdg_config_home else Path.home() / ".config"
+    return base / "partifact"
+
+
+def load_registry(path: Union[str, Path, None] = None) -> Dict[str, Configuration]:
+    """Returns the repositories set up with `partifact configure`, keyed by name.
+
+    The registry stores every repository already parsed, so loading it takes
+    neither TOML parsing nor URL matching. It is memoised for as long as the
+    file is unchanged.
+
+    Args:
+        path: The registry to read. Defaults to repositories.json in the
+            directory returned by `default_config_dir`.
+
+    Raises:
+        InvalidConfiguration: If the registry is invalid.
+    """
+    key = os.path.abspath(path or default_config_dir() / REGISTRY_FILE_NAME)
+    try:
+        stat = os.stat(key)
+    except FileNotFoundError:
+        return {}
+    version = (stat.st_mtime_ns, stat.st_size)
+
+    with _sources_lock:
+        cached = _registry_cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+    try:
+        with open(key) as f:
+            entries = json.load(f)["repositories"]
+        registry = {name: Configuration(**entry) for name, entry in entries.items()}
+    except OSError as err:
+        raise InvalidConfiguration(f"failed to read repository registry {key}: {err}")
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise InvalidConfiguration(f"invalid repository registry {key}")
+
+    with _sources_lock:
+        _registry_cache[key] = (version, registry)
+    return registry
+
+
+def save_registry(
+    registry: Dict[str, Configuration], path: Union[str, Path, None] = None
+) -> None:
+    """Writes the repositories to the registry, replacing its content.
+
+    Args:
+        registry: The configurations keyed by the name of the repository.
+        path: The registry to write, see `load_registry`.
+    """
+    content = {
+        "version": REGISTRY_VERSION,
+        "repositories": {
+            name: {k: v for k, v in asdict(c).items() if v is not None}
+            for name, c in sorted(registry.items())
+        },
+    }
+    atomic_write(
+        Path(path or default_config_dir() / REGISTRY_FILE_NAME),
+        json.dumps(content, indent=2) + "\n",
+    )
+
+
+def clear_registry_cache() -> None:
+    """Forgets the memoised registry, forcing it to be read again."""
+    with _sources_lock:
+        _registry_cache.clear()
+
+
+def _registered(repository: str) -> Optional[Configuration]:
+    # repositories in a pyproject.toml can still be logged into if the
+    # registry is broken
+    try:
+        return load_registry().get(repository)
+    except InvalidConfiguration as err:
+        warnings.warn(f"{err}, ignoring it", ConfigurationWarning, stacklevel=3)
+        return None
+
+
+def _project_source(repository: str) -> Optional[str]:
+    path = find_config()
+    return load_sources(path).get(repository) if path is not None else None
+
+
+def _location(configuration: Configuration) -> Dict[str, str]:
+    return {
+        "aws_account": configuration.aws_account,
+        "aws_region": configuration.aws_region,
+        "code_artifact_domain": configuration.code_artifact_domain,
+        "code_artifact_repository": configuration.code_artifact_repository,
+    }
+
+
+def _parse_sources(path: str) -> Dict[str, str]:
+    config = _read_toml(path)
+
+    tool = config.get("tool") or {}
+    poetry = tool.get("poetry") or {}
+    sources = poetry.get("source") or []
+
+    return {
+        str(s["name"]): str(s["url"])
+        for s in sources
+        if isinstance(s, dict) and "name" in s and "url" in s
+    }
+
+
+def _read_toml(path: str) -> Dict[str, Any]:
+    # only read access is needed here, for which tomllib is much faster than
+    # tomlkit, which is kept for files partifact edits
+    try:
+        import tomllib
+    except ModuleNotFoundError:  # Python 3.10
+        tomllib = None  # type: ignore
+
+    try:
+        if tomllib is not None:
+            with open(path, "rb") as f:
+                try:
+                    return tomllib.load(f)
+                except tomllib.TOMLDecodeError:
+                    raise MissingConfiguration("invalid pyproject.toml")
+
+        from tomlkit import parse as parse_toml
+        from tomlkit.exceptions import TOMLKitError
+
+        with open(path, "r") as f:
+            try:
+                return parse_toml(f.read())
+            except TOMLKitError:
+                raise MissingConfiguration("invalid pyproject.toml")
+    except FileNotFoundError:
+        raise MissingConfiguration("no pyproject.toml found")
 
 
 def parse_url(url: str) -> dict:
@@ -104,3 +483,9 @@ class InvalidConfiguration(Exception):
     """Raised if a key is missing from the repository's configuration."""
 
     pass
+
+
+class ConfigurationWarning(UserWarning):
+    """Warns of configuration which is ignored."""
+
+    pass
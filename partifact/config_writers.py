@@ -0,0 +1,375 @@
+"""Writers updating the configuration files of poetry, pip, uv and twine directly.
+
+Writing the files in-process saves launching a poetry and a pip interpreter on
+every login. The file locations mirror the ones poetry and pip resolve
+themselves; whenever they cannot be determined with certainty, the location
+functions return None and the caller falls back to the `config` subcommands.
+uv, twine and pdm files are always written, as `pdm config` would take the
+token as an argument, visible to other users of the machine.
+
+Poetry keeps passwords in the system keyring unless its keyring is disabled, so
+auth.toml is only written directly when poetry would store them there itself.
+"""
+
+import configparser
+import io
+import os
+import sys
+from pathlib import Path
+from typing import Dict, Mapping, Optional, Tuple
+
+from partifact.files import atomic_write, parse_toml
+
+WRITER_ENV = "PARTIFACT_CONFIG_WRITER"
+SUBPROCESS_WRITER = "subprocess"
+
+POETRY_USERNAME = "aws"
+POETRY_KEYRING_ENV = "POETRY_KEYRING_ENABLED"
+KEYRING_BACKEND_ENV = "PYTHON_KEYRING_BACKEND"
+# keyring backends which store nothing, making poetry fall back to auth.toml
+UNAVAILABLE_KEYRING_BACKENDS = frozenset(
+    {"keyring.backends.null.Keyring", "keyring.backends.fail.Keyring"}
+)
+
+
+def native_writers_enabled() -> bool:
+    """Whether configuration files may be written directly.
+
+    Setting PARTIFACT_CONFIG_WRITER to "subprocess" forces the use of
+    `poetry config` and `pip config` instead.
+    """
+    return os.environ.get(WRITER_ENV, "").lower() != SUBPROCESS_WRITER
+
+
+def poetry_auth_path() -> Optional[Path]:
+    """Returns the path of poetry's auth.toml, if passwords are stored in it.
+
+    None is returned if it can't be resolved, or if poetry's keyring may be
+    enabled, in which case `poetry config` keeps the passwords in the keyring.
+    """
+    if not native_writers_enabled():
+        return None
+
+    config_dir: Optional[Path]
+    if os.environ.get("POETRY_CONFIG_DIR"):
+        config_dir = Path(os.environ["POETRY_CONFIG_DIR"])
+    else:
+        base = _user_config_base(macos_dir="Library/Application Support")
+        config_dir = base / "pypoetry" if base else None
+
+    if config_dir is None or _poetry_keyring_enabled(config_dir):
+        return None
+    return config_dir / "auth.toml"
+
+
+def pip_config_path() -> Optional[Path]:
+    """Returns the path of the file `pip config set` writes to, if it can be resolved.
+
+    pip prefers a site-level file in the active environment, and an explicit
+    PIP_CONFIG_FILE changes its precedence, so both defer to pip itself.
+    """
+    if not native_writers_enabled() or os.environ.get("PIP_CONFIG_FILE"):
+        return None
+
+    prefixes = {sys.prefix, os.environ.get("VIRTUAL_ENV") or sys.prefix}
+    if any(Path(prefix, _pip_config_name()).exists() for prefix in prefixes):
+        return None
+
+    base: Optional[Path]
+    if sys.platform == "darwin":
+        home = _home()
+        if home is None:
+            return None
+        app_support = home / "Library" / "Application Support" / "pip"
+        if app_support.is_dir():
+            return app_support / "pip.conf"
+        base = home / ".config"
+    else:
+        base = _user_config_base()
+
+    return base / "pip" / _pip_config_name() if base else None
+
+
+def uv_config_path() -> Optional[Path]:
+    """Returns the path of uv's user-level uv.toml, or of UV_CONFIG_FILE if set."""
+    config_file = os.environ.get("UV_CONFIG_FILE")
+    if config_file:
+        return Path(config_file)
+
+    base = _user_config_base()
+    return base / "uv" / "uv.toml" if base else None
+
+
+def pdm_config_path() -> Optional[Path]:
+    """Returns the path of pdm's global config.toml, or of PDM_CONFIG_FILE if set.
+
+    The location mirrors `platformdirs.user_config_path("pdm")`, which pdm uses.
+    """
+    config_file = os.environ.get("PDM_CONFIG_FILE")
+    if config_file:
+        return Path(config_file)
+
+    if sys.platform == "win32":
+        local_appdata = os.environ.get("LOCALAPPDATA")
+        return (
+            Path(local_appdata, "pdm", "pdm", "config.toml") if local_appdata else None
+        )
+
+    base = _user_config_base(macos_dir="Library/Application Support")
+    return base / "pdm" / "config.toml" if base else None
+
+
+def pypirc_path() -> Optional[Path]:
+    """Returns the path of the .pypirc twine reads repositories from."""
+    home = _home()
+    return home / ".pypirc" if home else None
+
+
+def write_poetry_credentials(path: Path, passwords: Mapping[str, str]) -> None:
+    """Stores http-basic credentials for repositories in poetry's auth.toml.
+
+    All repositories are updated in a single write. Credentials for other
+    repositories and any other settings are preserved.
+
+    Args:
+        path (Path): The path of poetry's auth.toml.
+        passwords (Mapping[str, str]): The passwords keyed by repository name.
+    """
+    from tomlkit import document, dumps, parse, table
+
+    doc = parse(path.read_text()) if path.exists() else document()
+
+    if "http-basic" not in doc:
+        doc["http-basic"] = table()
+
+    for repository, password in passwords.items():
+        credentials = table()
+        credentials["username"] = POETRY_USERNAME
+        credentials["password"] = password
+        doc["http-basic"][repository] = credentials  # type: ignore
+
+    atomic_write(path, dumps(doc))
+
+
+def read_poetry_credentials(path: Path) -> Dict[str, str]:
+    """Returns the passwords partifact stored in poetry's auth.toml, keyed by repository.
+
+    Credentials with another username, kept in the keyring, or in a file that
+    can't be read are left out.
+    """
+    try:
+        doc = parse_toml(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+    http_basic = doc.get("http-basic")
+    if not isinstance(http_basic, dict):
+        return {}
+    return {
+        str(repository): str(credentials["password"])
+        for repository, credentials in http_basic.items()
+        if isinstance(credentials, dict)
+        and credentials.get("username") == POETRY_USERNAME
+        and "password" in credentials
+    }
+
+
+def read_pip_index_url(path: Path) -> Optional[str]:
+    """Returns global.index-url of a pip configuration file, if it is set."""
+    parser = configparser.RawConfigParser()
+    try:
+        parser.read(path)
+    except configparser.Error:
+        return None
+    return parser.get("global", "index-url", fallback=None)
+
+
+def write_pip_index_url(path: Path, url: str) -> None:
+    """Sets global.index-url in a pip configuration file, preserving other keys."""
+    parser = configparser.RawConfigParser()
+    parser.read(path)
+
+    if not parser.has_section("global"):
+        parser.add_section("global")
+    parser.set("global", "index-url", url)
+
+    buffer = io.StringIO()
+    parser.write(buffer)
+    atomic_write(path, buffer.getvalue())
+
+
+def _poetry_keyring_enabled(config_dir: Path) -> bool:
+    # poetry itself gives the environment precedence over config.toml
+    enabled = os.environ.get(POETRY_KEYRING_ENV)
+    if enabled is not None:
+        return enabled.lower() in ("true", "1")
+    if os.environ.get(KEYRING_BACKEND_ENV) in UNAVAILABLE_KEYRING_BACKENDS:
+        return False
+
+    try:
+        config = parse_toml((config_dir / "config.toml").read_text())
+    except (OSError, ValueError):
+        return True
+    keyring = config.get("keyring")
+    return not (isinstance(keyring, dict) and keyring.get("enabled") is False)
+
+
+def _pip_config_name() -> str:
+    return "pip.ini" if sys.platform == "win32" else "pip.conf"
+
+
+def _user_config_base(macos_dir: Optional[str] = None) -> Optional[Path]:
+    if sys.platform == "win32":
+        appdata = os.environ.get("APPDATA")
+        return Path(appdata) if appdata else None
+
+    if sys.platform == "darwin" and macos_dir:
+        home = _home()
+        return home / macos_dir if home else None
+
+    xdg_config_home = os.environ.get("XDG_CONFIG_HOME")
+    if xdg_config_home:
+        return Path(xdg_config_home)
+
+    home = _home()
+    return home / ".config" if home else None
+
+
+def _home() -> Optional[Path]:
+    try:
+        return Path.home()
+    except RuntimeError:
+        return None
+
+
+def write_uv_indexes(path: Path, urls: Mapping[str, str]) -> None:
+    """Adds or updates named indexes in uv.toml, preserving any other settings.
+
+    Args:
+        path (Path): The path of uv.toml.
+        urls (Mapping[str, str]): The index URLs keyed by index name.
+    """
+    from tomlkit import aot, document, dumps, parse, table
+
+    doc = parse(path.read_text()) if path.exists() else document()
+    if "index" not in doc:
+        doc["index"] = aot()
+
+    indexes = doc["index"]
+    existing = {str(i.get("name")): i for i in indexes}  # type: ignore
+    for name, url in urls.items():
+        index = existing.get(name)
+        if index is None:
+            index = table()
+            index["name"] = name
+            indexes.append(index)  # type: ignore
+        index["url"] = url
+
+    atomic_write(path, dumps(doc))
+
+
+def read_uv_indexes(path: Path) -> Dict[str, str]:
+    """Returns the URLs of the named indexes in uv.toml, keyed by name."""
+    try:
+        doc = parse_toml(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+    indexes = doc.get("index")
+    if not isinstance(indexes, list):
+        return {}
+    return {
+        str(index["name"]): str(index["url"])
+        for index in indexes
+        if isinstance(index, dict) and "name" in index and "url" in index
+    }
+
+
+def write_pypirc(path: Path, repositories: Mapping[str, Tuple[str, str]]) -> None:
+    """Adds or updates repositories in .pypirc, preserving the rest.
+
+    Args:
+        path (Path): The path of .pypirc.
+        repositories (Mapping[str, Tuple[str, str]]): The upload URLs and
+            passwords keyed by repository name.
+    """
+    parser = configparser.RawConfigParser()
+    parser.read(path)
+
+    if not parser.has_section("distutils"):
+        parser.add_section("distutils")
+    servers = parser.get("distutils", "index-servers", fallback="").split()
+
+    for name, (url, password) in repositories.items():
+        if name not in servers:
+            servers.append(name)
+        if not parser.has_section(name):
+            parser.add_section(name)
+        parser.set(name, "repository", url)
+        parser.set(name, "username", POETRY_USERNAME)
+        parser.set(name, "password", password)
+    parser.set("distutils", "index-servers", "\n" + "\n".join(servers))
+
+    buffer = io.StringIO()
+    parser.write(buffer)
+    atomic_write(path, buffer.getvalue())
+
+
+def read_pypirc(path: Path) -> Dict[str, Tuple[str, str]]:
+    """Returns the upload URLs and passwords partifact stored in .pypirc."""
+    parser = configparser.RawConfigParser()
+    try:
+        parser.read(path)
+    except configparser.Error:
+        return {}
+    return {
+        name: (parser.get(name, "repository"), parser.get(name, "password"))
+        for name in parser.sections()
+        if parser.get(name, "username", fallback=None) == POETRY_USERNAME
+        and parser.has_option(name, "repository")
+        and parser.has_option(name, "password")
+    }
+
+
+def write_pdm_sources(path: Path, sources: Mapping[str, Tuple[str, str]]) -> None:
+    """Adds or updates named sources in pdm's config.toml, preserving the rest.
+
+    Args:
+        path (Path): The path of pdm's config.toml.
+        sources (Mapping[str, Tuple[str, str]]): The index URLs and passwords
+            keyed by source name.
+    """
+    from tomlkit import document, dumps, parse, table
+
+    doc = parse(path.read_text()) if path.exists() else document()
+    if "pypi" not in doc:
+        doc["pypi"] = table(is_super_table=True)
+
+    for name, (url, password) in sources.items():
+        source = table()
+        source["url"] = url
+        source["username"] = POETRY_USERNAME
+        source["password"] = password
+        doc["pypi"][name] = source  # type: ignore
+
+    atomic_write(path, dumps(doc))
+
+
+def read_pdm_sources(path: Path) -> Dict[str, Tuple[str, str]]:
+    """Returns the index URLs and passwords partifact stored in pdm's config.toml."""
+    try:
+        doc = parse_toml(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+    pypi = doc.get("pypi")
+    if not isinstance(pypi, dict):
+        return {}
+    return {
+        str(name): (str(source["url"]), str(source["password"]))
+        for name, source in pypi.items()
+        if isinstance(source, dict)
+        and source.get("username") == POETRY_USERNAME
+        and "url" in source
+        and "password" in source
+    }
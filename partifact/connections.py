@@ -0,0 +1,162 @@
+"""Keep-alive HTTP connections to CodeArtifact, reused across requests.
+
+Downloading or uploading many files over fresh connections spends much of the
+time in TCP and TLS handshakes. The pool keeps one connection per thread and
+host open instead, so each worker of a transfer pays for the handshake once.
+"""
+
+from __future__ import annotations
+
+import base64
+import io
+import threading
+import urllib.parse
+from typing import IO, TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+
+from partifact.config_writers import POETRY_USERNAME
+
+if TYPE_CHECKING:
+    import http.client
+
+DEFAULT_TIMEOUT = 60.0
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = frozenset({301, 302, 303, 307, 308})
+
+Body = Union[bytes, IO[bytes], io.RawIOBase, None]
+
+
+def basic_auth(token: str) -> str:
+    """Returns the Authorization header value for a CodeArtifact token."""
+    credentials = f"{POETRY_USERNAME}:{token}".encode()
+    return f"Basic {base64.b64encode(credentials).decode()}"
+
+
+class ConnectionPool:
+    """HTTP connections kept open per thread and host.
+
+    Responses must be read to the end or closed before the thread sends its
+    next request, as they share the connection.
+    """
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT) -> None:
+        """Creates an empty pool.
+
+        Args:
+            timeout (float): The socket timeout of the connections, in seconds.
+        """
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections: List[Any] = []
+        self._lock = threading.Lock()
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        body: Body = None,
+    ) -> http.client.HTTPResponse:
+        """Sends a request over a pooled connection, following redirects.
+
+        Credentials are only sent to the host of the original URL, e.g. not to
+        storage a download redirects to.
+
+        Args:
+            method: The HTTP method.
+            url: The URL to request.
+            headers: The headers to send.
+            body: The body to send, either bytes or a file streamed from its
+                current position.
+        """
+        headers = dict(headers or {})
+        origin = urllib.parse.urlsplit(url).netloc
+        start = None if isinstance(body, (bytes, type(None))) else body.tell()
+
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._send(method, url, headers, body, start)
+            if response.status not in REDIRECT_STATUSES:
+                return response
+
+            response.read()
+            url = urllib.parse.urljoin(url, response.getheader("Location", ""))
+            if urllib.parse.urlsplit(url).netloc != origin:
+                headers.pop("Authorization", None)
+            if response.status == 303:
+                method, body = "GET", None
+
+        raise OSError(f"too many redirects requesting {url}")
+
+    def close(self) -> None:
+        """Closes every connection of the pool."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+
+    def __enter__(self) -> ConnectionPool:
+        """Returns the pool, which is closed when the block exits."""
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        """Closes the pool."""
+        self.close()
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+        body: Body,
+        start: Optional[int],
+    ) -> http.client.HTTPResponse:
+        import http.client
+
+        parsed = urllib.parse.urlsplit(url)
+        path = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+        key = (parsed.scheme, parsed.netloc)
+
+        connection, reused = self._connection(key)
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            return connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            # the server may have closed a connection kept open for too long,
+            # in which case the request is sent again over a new one
+            if not reused or not _rewind(body, start):
+                raise
+            connection, _ = self._connection(key, fresh=True)
+            connection.request(method, path, body=body, headers=headers)
+            return connection.getresponse()
+
+    def _connection(
+        self, key: Tuple[str, str], fresh: bool = False
+    ) -> Tuple[http.client.HTTPConnection, bool]:
+        import http.client
+
+        connections = self._local.__dict__.setdefault("connections", {})
+        connection = connections.get(key)
+        if connection is not None and not fresh:
+            return connection, True
+
+        scheme, netloc = key
+        factory = (
+            http.client.HTTPSConnection
+            if scheme == "https"
+            else http.client.HTTPConnection
+        )
+        connection = factory(netloc, timeout=self.timeout)
+        connections[key] = connection
+        with self._lock:
+            self._connections.append(connection)
+        return connection, False
+
+
+def _rewind(body: Body, start: Optional[int]) -> bool:
+    # whether the body can be sent again, rewinding files to where they started
+    if body is None or isinstance(body, bytes):
+        return True
+    if start is None:
+        return False
+    body.seek(start)
+    return True
@@ -0,0 +1,345 @@
+"""Resolving the AWS credentials tokens are fetched with.
+
+By default botocore walks its whole credential provider chain, which ends with
+the EC2 instance metadata service (IMDS). Outside of EC2, probing it costs
+connection timeouts before botocore gives up. Pinning the credential source
+only consults the matching providers, and never IMDS.
+
+Either way, credentials are resolved once per profile and source and shared by
+every session partifact creates, instead of each token fetch resolving them again.
+Sessions and clients themselves are shared through a `ClientPool`.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from enum import Enum
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from partifact.config import InvalidConfiguration
+from partifact.timing import phase
+
+if TYPE_CHECKING:
+    import boto3
+
+    from partifact.cache import RoleCredentials
+
+CREDENTIAL_SOURCE_ENV = "PARTIFACT_CREDENTIAL_SOURCE"
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+
+
+class CredentialSource(str, Enum):
+    """Where AWS credentials are taken from."""
+
+    ENV = "env"
+    PROFILE = "profile"
+    WEB_IDENTITY = "web-identity"
+    CONTAINER = "container"
+
+
+# the botocore credential providers consulted for each source, by their METHOD
+PROVIDERS = {
+    CredentialSource.ENV: frozenset({"env"}),
+    CredentialSource.PROFILE: frozenset(
+        {
+            "assume-role",
+            "sso",
+            "shared-credentials-file",
+            "login",
+            "custom-process",
+            "config-file",
+        }
+    ),
+    CredentialSource.WEB_IDENTITY: frozenset({"assume-role-with-web-identity"}),
+    CredentialSource.CONTAINER: frozenset({"container-role"}),
+}
+
+
+def credential_source(
+    source: Optional[str] = None,
+) -> Optional[CredentialSource]:
+    """Returns the credential source to use.
+
+    Args:
+        source: The configured source. Defaults to the PARTIFACT_CREDENTIAL_SOURCE
+            environment variable, and to botocore's full provider chain if
+            neither is set.
+
+    Raises:
+        InvalidConfiguration: If the source is unknown.
+    """
+    source = source or os.environ.get(CREDENTIAL_SOURCE_ENV) or None
+    if source is None:
+        return None
+    try:
+        return CredentialSource(source)
+    except ValueError:
+        choices = ", ".join(s.value for s in CredentialSource)
+        raise InvalidConfiguration(
+            f"unknown credential source {source}, use one of {choices}"
+        )
+
+
+class SharedCredentialProvider:
+    """Resolves credentials once and hands the same credentials to every session.
+
+    It stands in for botocore's credential resolver, so sessions created
+    concurrently wait for the first one to resolve the credentials instead of
+    walking the provider chain themselves. Refreshable credentials, e.g. of SSO
+    or assumed roles, still refresh themselves when they expire.
+    """
+
+    def __init__(
+        self, profile: Optional[str], source: Optional[CredentialSource]
+    ) -> None:
+        """Creates a provider.
+
+        Args:
+            profile (Optional[str]): The AWS profile to use.
+            source (Optional[CredentialSource]): The pinned credential source, or
+                None for botocore's full provider chain.
+        """
+        self.profile = profile
+        self.source = source
+        self._credentials: Any = None
+        self._lock = threading.Lock()
+
+    def load_credentials(self) -> Any:
+        """Returns the credentials, resolving them on first use."""
+        with self._lock:
+            if self._credentials is None:
+                with phase("aws.credentials"):
+                    self._credentials = self.resolver().load_credentials()
+            return self._credentials
+
+    def resolver(self) -> Any:
+        """Returns botocore's credential resolver limited to the pinned source."""
+        import botocore.session
+
+        resolver = botocore.session.Session(profile=self.profile).get_component(
+            "credential_provider"
+        )
+        if self.source is not None:
+            allowed = PROVIDERS[self.source]
+            for provider in list(resolver.providers):
+                if provider.METHOD not in allowed:
+                    resolver.remove(provider.METHOD)
+        return resolver
+
+
+_providers: Dict[
+    Tuple[Optional[str], Optional[CredentialSource]], SharedCredentialProvider
+] = {}
+_providers_lock = threading.Lock()
+
+
+def credential_provider(
+    profile: Optional[str], source: Optional[str] = None
+) -> SharedCredentialProvider:
+    """Returns the shared credential provider of a profile and source."""
+    key = (profile, credential_source(source))
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None:
+            provider = _providers[key] = SharedCredentialProvider(*key)
+    return provider
+
+
+def clear_credential_providers() -> None:
+    """Forgets any resolved credentials, forcing them to be resolved again."""
+    with _providers_lock:
+        _providers.clear()
+
+
+def aws_session(
+    profile: Optional[str], region: str, source: Optional[str] = None
+) -> boto3.Session:
+    """Creates a boto3 session using the shared credentials of a profile and source.
+
+    Args:
+        profile: The AWS profile to use.
+        region: The AWS region of the session.
+        source: The credential source, see `credential_source`.
+    """
+    import boto3
+    import botocore.session
+
+    botocore_session = botocore.session.Session(profile=profile)
+    botocore_session.register_component(
+        "credential_provider", credential_provider(profile, source)
+    )
+    return boto3.Session(
+        botocore_session=botocore_session,
+        profile_name=profile,
+        region_name=region,
+    )
+
+
+# a session's kind, then its profile and source or its role's access key, and region
+_SessionKey = Tuple[str, Optional[str], Optional[str], str]
+
+
+class ClientPool:
+    """Creates each boto3 session and client once and shares them in the process.
+
+    Creating a session loads botocore's data files and each client builds its
+    service model and HTTP connection pool, which takes longer than fetching a
+    token. Clients are thread-safe, so every token fetch in the process shares
+    them, and with them their keep-alive connections. Sessions aren't, so each
+    one is only used under its own lock.
+
+    Sessions are keyed by profile, credential source and region, or by the
+    access key of role credentials. Those of expired role credentials are
+    dropped whenever clients for other role credentials are asked for.
+    """
+
+    def __init__(
+        self, max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS
+    ) -> None:
+        """Creates an empty pool.
+
+        Args:
+            max_pool_connections (int): The number of connections each client
+                keeps open, which bounds its concurrent requests before new
+                connections are thrown away after use.
+        """
+        self.max_pool_connections = max_pool_connections
+        self._sessions: Dict[_SessionKey, Tuple[boto3.Session, float]] = {}
+        self._clients: Dict[Tuple[_SessionKey, str], Any] = {}
+        self._locks: Dict[_SessionKey, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def client(
+        self,
+        service: str,
+        profile: Optional[str],
+        region: str,
+        source: Optional[str] = None,
+        credentials: Optional[RoleCredentials] = None,
+        config: Any = None,
+    ) -> Any:
+        """Returns the shared client of a service.
+
+        Args:
+            service: The name of the service, e.g. "codeartifact".
+            profile: The AWS profile whose credentials are used.
+            region: The AWS region of the client.
+            source: The credential source, see `credential_source`.
+            credentials: Role credentials to use instead of the profile's.
+            config: The botocore config of the client if it has to be created.
+                It is only applied once, so it must be the same on every call.
+        """
+        if credentials is None:
+            pinned = credential_source(source)
+            key: _SessionKey = ("profile", profile, pinned and pinned.value, region)
+        else:
+            key = ("role", credentials.access_key_id, None, region)
+
+        client = self._clients.get((key, service))
+        if client is not None:
+            return client
+
+        with self._session_lock(key):
+            client = self._clients.get((key, service))
+            if client is None:
+                session = self._session(key, profile, region, source, credentials)
+                client = session.client(service, config=self._config(config))
+                self._clients[(key, service)] = client
+        if credentials is not None:
+            self._drop_expired(key)
+        return client
+
+    def clear(self) -> None:
+        """Forgets every session and client."""
+        with self._lock:
+            self._sessions.clear()
+            self._clients.clear()
+            self._locks.clear()
+
+    def _session_lock(self, key: _SessionKey) -> threading.Lock:
+        with self._lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+        return lock
+
+    def _session(
+        self,
+        key: _SessionKey,
+        profile: Optional[str],
+        region: str,
+        source: Optional[str],
+        credentials: Optional[RoleCredentials],
+    ) -> boto3.Session:
+        entry = self._sessions.get(key)
+        if entry is not None:
+            return entry[0]
+
+        import boto3
+
+        with phase("aws.session"):
+            if credentials is None:
+                session = aws_session(profile, region, source)
+            else:
+                session = boto3.Session(
+                    aws_access_key_id=credentials.access_key_id,
+                    aws_secret_access_key=credentials.secret_access_key,
+                    aws_session_token=credentials.session_token,
+                    region_name=region,
+                )
+
+        expiration = credentials.expiration if credentials else 0.0
+        with self._lock:
+            self._sessions[key] = (session, expiration)
+        return session
+
+    def _drop_expired(self, current: _SessionKey) -> None:
+        now = time.time()
+        with self._lock:
+            expired = {
+                key
+                for key, (_, expiration) in self._sessions.items()
+                if key[0] == "role" and key != current and 0 < expiration < now
+            }
+            for key in expired:
+                del self._sessions[key]
+                del self._locks[key]
+            for client_key in [k for k in self._clients if k[0] in expired]:
+                del self._clients[client_key]
+
+    def _config(self, config: Any) -> Any:
+        from botocore.config import Config
+
+        pool = Config(max_pool_connections=self.max_pool_connections)
+        return config.merge(pool) if config is not None else pool
+
+
+_client_pool: Optional[ClientPool] = None
+_client_pool_lock = threading.Lock()
+
+
+def client_pool() -> ClientPool:
+    """Returns the client pool shared by every token fetch in the process."""
+    global _client_pool
+    with _client_pool_lock:
+        if _client_pool is None:
+            _client_pool = ClientPool()
+        return _client_pool
+
+
+def configure_client_pool(max_pool_connections: int) -> ClientPool:
+    """Replaces the shared client pool with one keeping more or fewer connections.
+
+    Clients of the previous pool are no longer handed out, but keep working.
+    """
+    global _client_pool
+    with _client_pool_lock:
+        _client_pool = ClientPool(max_pool_connections)
+        return _client_pool
+
+
+def clear_client_pool() -> None:
+    """Forgets every shared session and client, forcing them to be created again."""
+    client_pool().clear()
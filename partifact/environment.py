@@ -0,0 +1,45 @@
+"""Credentials passed to tools through environment variables.
+
+This avoids writing configuration files altogether, which suits ephemeral
+containers where the credentials only need to live as long as one command.
+"""
+
+import re
+import shlex
+from typing import Dict
+
+from partifact.config import Configuration
+from partifact.config_writers import POETRY_USERNAME
+from partifact.shell_commands import pip_url
+
+POETRY_USERNAME_VARIABLE = "POETRY_HTTP_BASIC_{name}_USERNAME"
+POETRY_PASSWORD_VARIABLE = "POETRY_HTTP_BASIC_{name}_PASSWORD"
+
+
+def credential_environment(
+    repository: str, config: Configuration, token: str
+) -> Dict[str, str]:
+    """Returns the environment variables configuring poetry, pip and uv.
+
+    Args:
+        repository: The name of the poetry repository.
+        config: The configuration of the repository.
+        token: A valid CodeArtifact token.
+    """
+    # poetry looks repositories up with non-alphanumerics replaced by underscores
+    name = re.sub(r"[^A-Z0-9]", "_", repository.upper())
+    url = pip_url(config, token)
+
+    return {
+        POETRY_USERNAME_VARIABLE.format(name=name): POETRY_USERNAME,
+        POETRY_PASSWORD_VARIABLE.format(name=name): token,
+        "PIP_INDEX_URL": url,
+        "UV_INDEX_URL": url,
+    }
+
+
+def shell_exports(variables: Dict[str, str]) -> str:
+    """Formats environment variables as POSIX shell export statements."""
+    return "\n".join(
+        f"export {name}={shlex.quote(value)}" for name, value in variables.items()
+    )
@@ -0,0 +1,41 @@
+"""Helpers for reading and writing files."""
+
+import os
+from pathlib import Path
+from typing import Any, Dict
+
+
+def atomic_write(path: Path, content: str, mode: int = 0o600) -> None:
+    """Writes content to the path atomically via a temporary file and a rename.
+
+    Readers either see the previous content or the new one, never a partially
+    written file.
+    """
+    import tempfile
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def parse_toml(text: str) -> Dict[str, Any]:
+    """Parses a TOML document for reading.
+
+    Raises:
+        ValueError: If the document is invalid.
+    """
+    # tomllib is much faster than tomlkit, which is only needed for editing
+    try:
+        import tomllib
+    except ModuleNotFoundError:  # Python 3.10
+        from tomlkit import parse
+
+        return parse(text)
+    return tomllib.loads(text)
@@ -0,0 +1,154 @@
+"""Cross-process file locks."""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import time
+from pathlib import Path
+from types import TracebackType
+from typing import Optional, Type
+
+from partifact.timing import phase
+
+DEFAULT_LOCK_TIMEOUT = 30.0
+DEFAULT_STALE_AFTER = 120.0
+POLL_INTERVAL = 0.05
+
+
+class FileLock:
+    """An exclusive lock backed by a file created with O_EXCL.
+
+    The lock file records the owner's host, PID and acquisition time,
+    so locks left behind by crashed processes can be detected and broken.
+    Waiting for the lock is bounded: once the timeout passes, `acquire`
+    gives up and returns False rather than blocking forever.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        timeout: float = DEFAULT_LOCK_TIMEOUT,
+        stale_after: float = DEFAULT_STALE_AFTER,
+    ) -> None:
+        """Creates a file lock.
+
+        Args:
+            path (Path): The path of the lock file.
+            timeout (float): How long to wait for the lock, in seconds.
+            stale_after (float): Locks held for longer than this many seconds
+                are considered abandoned and are broken.
+        """
+        self.path = path
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.acquired = False
+
+    def acquire(self) -> bool:
+        """Acquires the lock, waiting up to the timeout.
+
+        Returns:
+            Whether the lock was acquired.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+            except FileExistsError:
+                if self._break_if_stale():
+                    continue
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            with os.fdopen(fd, "w") as f:
+                json.dump(_owner(), f)
+            self.acquired = True
+            return True
+
+    def release(self) -> None:
+        """Releases the lock if it is held."""
+        if not self.acquired:
+            return
+        self.acquired = False
+        with contextlib.suppress(FileNotFoundError):
+            self.path.unlink()
+
+    def __enter__(self) -> FileLock:
+        """Acquires the lock; check `acquired` to see whether it timed out."""
+        with phase("lock.wait"):
+            self.acquire()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        """Releases the lock."""
+        self.release()
+
+    def _break_if_stale(self) -> bool:
+        try:
+            with open(self.path, "r") as f:
+                content = f.read()
+            created = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            # released in the meantime, the lock can be retried straight away
+            return True
+
+        if not self._is_stale(content, created):
+            return False
+
+        try:
+            with open(self.path, "r") as f:
+                if f.read() != content:
+                    # another process broke the lock and took it over
+                    return False
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+        return True
+
+    def _is_stale(self, content: str, created: float) -> bool:
+        if time.time() - created > self.stale_after:
+            return True
+
+        try:
+            owner = json.loads(content)
+        except ValueError:
+            # the owner may still be writing its details
+            return False
+
+        if owner.get("host") != _hostname():
+            return False
+        return not _is_running(owner.get("pid"))
+
+
+def _owner() -> dict:
+    return {"host": _hostname(), "pid": os.getpid(), "time": time.time()}
+
+
+def _hostname() -> str:
+    # socket is only loaded once a lock is taken, not on startup
+    import socket
+
+    return socket.gethostname()
+
+
+def _is_running(pid: Optional[int]) -> bool:
+    if not isinstance(pid, int) or os.name != "posix":
+        # signalling a process on Windows would terminate it, so rely on age
+        return True
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -1,14 +1,49 @@
-from typing import Optional
+import contextlib
+import dataclasses
+import json
+import os
+import subprocess
+from pathlib import Path
+from typing import TYPE_CHECKING, Annotated, Dict, List, Optional
 
 import typer
-from typing_extensions import Annotated
 
-from partifact.auth_token import get_token
-from partifact.config import Configuration
-from partifact.shell_commands import configure_pip, configure_poetry
+# only what the options need is imported up front, the commands import the rest
+# themselves, so that startup and --help stay fast
+from partifact.auth_token import DEFAULT_MAX_WORKERS
+from partifact.cache import DEFAULT_REFRESH_MARGIN
+from partifact.config import (
+    Configuration,
+    InvalidConfiguration,
+    MissingConfiguration,
+    load_registry,
+    load_sources,
+    parse_url,
+    save_registry,
+)
+from partifact.credentials import CredentialSource
+from partifact.lock import DEFAULT_LOCK_TIMEOUT
+from partifact.metrics import METRICS_ENV
+from partifact.retry import DEFAULT_RETRY_POLICY
+from partifact.timing import phase, recording
+
+if TYPE_CHECKING:
+    from partifact.metrics import Emitter
 
 app = typer.Typer()
 
+MEGABYTE = 1024**2
+DEFAULT_LOCK_FILE = "poetry.lock"
+DEFAULT_WHEELHOUSE = "wheelhouse"
+DEFAULT_PROXY_HOST = "127.0.0.1"
+DEFAULT_PROXY_PORT = 3142
+MIN_TOKEN_DURATION = 900
+MAX_TOKEN_DURATION = 43200
+
+repositories_argument = typer.Argument(
+    help="The names of the poetry repositories to log into.", show_default=False
+)
+
 profile_option = typer.Option(
     "--profile",
     "-p",
@@ -19,37 +54,764 @@ role_option = typer.Option(
     "--role", "-r", help="The AWS role to use when getting the CodeArtifact token."
 )
 
+role_duration_option = typer.Option(
+    "--role-duration",
+    help="How long the credentials of the assumed role should last, in seconds.",
+)
+
+
+def _check_duration(value: Optional[int]) -> Optional[int]:
+    if value is not None and not (
+        value == 0 or MIN_TOKEN_DURATION <= value <= MAX_TOKEN_DURATION
+    ):
+        raise typer.BadParameter(
+            f"use 0 or between {MIN_TOKEN_DURATION} and {MAX_TOKEN_DURATION} seconds"
+        )
+    return value
+
+
+duration_option = typer.Option(
+    "--duration",
+    help="How long the CodeArtifact token should last, in seconds: 0 to last as long"
+    " as the assumed role's credentials, or 900 to 43200. Defaults to 12 hours.",
+    callback=_check_duration,
+    show_default=False,
+)
+
+credential_source_option = typer.Option(
+    "--credential-source",
+    help="Only take AWS credentials from this source, skipping the rest of the chain"
+    " including instance metadata. Defaults to PARTIFACT_CREDENTIAL_SOURCE.",
+    show_default=False,
+)
+
+all_option = typer.Option(
+    "--all",
+    "-a",
+    help="Log into every CodeArtifact source in pyproject.toml.",
+)
+
+scan_option = typer.Option(
+    "--scan",
+    help="Use every CodeArtifact source of the pyproject.toml files under a directory.",
+    show_default=False,
+)
+
+target_option = typer.Option(
+    "--target",
+    "-t",
+    help="The tools to configure, comma separated or repeated: poetry, pip, uv,"
+    " twine, pdm or a plugin's. Defaults to poetry.",
+    show_default=False,
+)
+
 should_configure_pip_option = typer.Option(
     "--configure-pip",
     "-c",
-    help="Set global.index-url for pip in addition to configuring poetry.",
+    help="Set global.index-url for pip to the first repository, same as adding the pip target.",
+)
+
+plan_option = typer.Option(
+    "--plan",
+    help="Only print what would be configured, without changing anything.",
+)
+
+no_cache_option = typer.Option(
+    "--no-cache",
+    help="Always fetch a new token instead of reusing a cached one.",
+)
+
+refresh_margin_option = typer.Option(
+    "--refresh-margin",
+    help="Refresh cached tokens expiring within this many seconds.",
+)
+
+lock_timeout_option = typer.Option(
+    "--lock-timeout",
+    help="Seconds to wait for a concurrent login fetching the same token,"
+    " on top of the time it may spend retrying.",
+)
+
+max_workers_option = typer.Option(
+    "--max-workers",
+    help="The maximum number of tokens to fetch concurrently.",
+)
+
+max_attempts_option = typer.Option(
+    "--max-attempts",
+    help="The maximum number of attempts of a throttled AWS call.",
+)
+
+retry_deadline_option = typer.Option(
+    "--retry-deadline",
+    help="The longest time spent retrying a throttled AWS call, in seconds.",
+)
+
+timings_option = typer.Option(
+    "--timings",
+    help="Print how long each phase of the login took to stderr.",
+)
+
+timings_json_option = typer.Option(
+    "--timings-json",
+    help="Write how long each phase of the login took to a JSON file.",
+)
+
+metrics_option = typer.Option(
+    "--metrics",
+    envvar=METRICS_ENV,
+    help="Send metrics to statsd://host:port, dogstatsd://host:port or"
+    " otlp-file:path.",
+    show_default=False,
+)
+
+status_repositories_argument = typer.Argument(
+    help="The repositories to check. Defaults to every configured repository.",
+    show_default=False,
+)
+
+min_validity_option = typer.Option(
+    "--min-validity",
+    help="Fail unless every token is valid for at least this many seconds.",
+)
+
+json_option = typer.Option("--json", help="Print the status as JSON.")
+
+command_argument = typer.Argument(
+    help="The command to run, separated from partifact's options by --.",
+    show_default=False,
+)
+
+socket_option = typer.Option(
+    "--socket",
+    help="The Unix socket of the agent. Defaults to agent.sock in the cache directory.",
+)
+
+
+def _emitter(url: Optional[str]) -> Optional["Emitter"]:
+    from partifact.metrics import from_url
+
+    try:
+        return from_url(url) if url else None
+    except ValueError as err:
+        raise typer.BadParameter(str(err))
+
+
+def _with_duration(
+    configuration: Configuration, duration: Optional[int]
+) -> Configuration:
+    if duration is None:
+        return configuration
+    return dataclasses.replace(configuration, code_artifact_token_duration=duration)
+
+
+def _load_configurations(
+    repositories: Optional[List[str]],
+    all_repositories: bool,
+    profile: Optional[str],
+    role: Optional[str],
+    role_duration: Optional[int],
+    scan: Optional[str] = None,
+    credential_source: Optional[str] = None,
+) -> Dict[str, Configuration]:
+    if scan:
+        configs = Configuration.scan(
+            scan, profile, role, role_duration, credential_source
+        )
+    elif all_repositories:
+        configs = Configuration.load_all(
+            profile, role, role_duration, credential_source
+        )
+    elif repositories:
+        configs = {
+            r: Configuration.load(r, profile, role, role_duration, credential_source)
+            for r in repositories
+        }
+    else:
+        raise typer.BadParameter("specify the repositories to use, --all or --scan")
+
+    if not configs:
+        raise typer.BadParameter("no CodeArtifact sources found")
+    return configs
+
+
+def _configured_repositories(
+    repositories: Optional[List[str]], profile: Optional[str], role: Optional[str]
+) -> Dict[str, Configuration]:
+    if repositories:
+        return {r: Configuration.load(r, profile, role) for r in repositories}
+
+    # every source of pyproject.toml, plus those set up with `partifact configure`
+    configs = {}
+    with contextlib.suppress(MissingConfiguration):
+        configs.update(Configuration.load_all(profile, role))
+    for repository in load_registry():
+        configs[repository] = Configuration.load(repository, profile, role)
+    if not configs:
+        raise typer.BadParameter("no CodeArtifact repositories configured")
+    return configs
+
+
+host_option = typer.Option("--host", help="The address the proxy listens on.")
+
+port_option = typer.Option("--port", help="The port the proxy listens on.")
+
+index_ttl_option = typer.Option(
+    "--index-ttl",
+    help="Seconds index pages are served from the cache before revalidating them.",
+    show_default=False,
+)
+
+max_cache_size_option = typer.Option(
+    "--max-cache-size",
+    help="The size of the proxy's distribution cache in megabytes.",
+    show_default=False,
+)
+
+proxy_configure_pip_option = typer.Option(
+    "--configure-pip",
+    "-c",
+    help="Set global.index-url for pip to the URL of the local proxy once it's serving.",
+)
+
+
+lock_file_option = typer.Option("--lock-file", help="The poetry lock file to read.")
+
+wheelhouse_option = typer.Option(
+    "--wheelhouse", help="The directory to download the distributions to."
+)
+
+include_option = typer.Option(
+    "--include",
+    help="Only download files matching this glob pattern, e.g. '*manylinux*'."
+    " Can be repeated.",
+    show_default=False,
+)
+
+download_workers_option = typer.Option(
+    "--max-workers",
+    help="The maximum number of files downloaded concurrently.",
+    show_default=False,
+)
+
+distributions_argument = typer.Argument(
+    help="The wheels and sdists to upload, e.g. dist/*.", show_default=False
+)
+
+upload_workers_option = typer.Option(
+    "--max-workers",
+    help="The maximum number of files uploaded concurrently.",
+    show_default=False,
+)
+
+upload_attempts_option = typer.Option(
+    "--max-attempts",
+    help="The maximum number of attempts to upload each file.",
+    show_default=False,
+)
+
+skip_existing_option = typer.Option(
+    "--skip-existing",
+    help="Skip files already in the repository instead of failing.",
+)
+
+url_option = typer.Option(
+    "--url",
+    help="The CodeArtifact URL of the repository. Defaults to the URL of the poetry"
+    " source of the same name.",
+    show_default=False,
+)
+
+default_profile_option = typer.Option(
+    "--profile",
+    "-p",
+    help="The AWS profile used for the repository unless another is given.",
+)
+
+default_role_option = typer.Option(
+    "--role",
+    "-r",
+    help="The AWS role assumed for the repository unless another is given.",
+)
+
+remove_option = typer.Option(
+    "--remove", help="Remove the repository from the registry."
 )
 
 
 @app.command()
 def login(
-    repository: str,
+    repositories: Annotated[Optional[List[str]], repositories_argument] = None,
+    all_repositories: Annotated[bool, all_option] = False,
+    scan: Annotated[Optional[str], scan_option] = None,
     profile: Annotated[Optional[str], profile_option] = None,
     role: Annotated[Optional[str], role_option] = None,
+    role_duration: Annotated[Optional[int], role_duration_option] = None,
+    duration: Annotated[Optional[int], duration_option] = None,
+    credential_source: Annotated[
+        Optional[CredentialSource], credential_source_option
+    ] = None,
+    targets: Annotated[Optional[List[str]], target_option] = None,
     should_configure_pip: Annotated[bool, should_configure_pip_option] = False,
+    plan: Annotated[bool, plan_option] = False,
+    no_cache: Annotated[bool, no_cache_option] = False,
+    refresh_margin: Annotated[int, refresh_margin_option] = DEFAULT_REFRESH_MARGIN,
+    lock_timeout: Annotated[float, lock_timeout_option] = DEFAULT_LOCK_TIMEOUT,
+    max_workers: Annotated[int, max_workers_option] = DEFAULT_MAX_WORKERS,
+    max_attempts: Annotated[
+        int, max_attempts_option
+    ] = DEFAULT_RETRY_POLICY.max_attempts,
+    retry_deadline: Annotated[
+        float, retry_deadline_option
+    ] = DEFAULT_RETRY_POLICY.deadline,
+    show_timings: Annotated[bool, timings_option] = False,
+    timings_json: Annotated[Optional[str], timings_json_option] = None,
+    metrics_url: Annotated[Optional[str], metrics_option] = None,
 ) -> None:
     """Log into CodeArtifact.
 
-    This configures pip and poetry to make use of the created CodeArtifact session.
+    This configures poetry, or the tools given with --target, to make use of the
+    created CodeArtifact session. Several repositories can be logged into at once,
+    in which case each distinct token is only fetched once. Tools already holding
+    the current token are left untouched.
+    """
+    from partifact.auth_token import get_tokens
+    from partifact.cache import TokenCache
+    from partifact.metrics import emitting
+    from partifact.retry import RetryPolicy
+    from partifact.targets import (
+        DEFAULT_TARGETS,
+        UnknownTarget,
+        configure_targets,
+        describe_plan,
+        get_target,
+        plan_targets,
+    )
+
+    names = [n.strip() for t in targets or DEFAULT_TARGETS for n in t.split(",")]
+    # pip only has a single index URL, which goes to the first repository
+    if should_configure_pip and "pip" not in names:
+        names.append("pip")
+    try:
+        selected = [get_target(n) for n in dict.fromkeys(names) if n]
+    except UnknownTarget as err:
+        raise typer.BadParameter(str(err))
+
+    emitter = _emitter(metrics_url)
+    with emitting(emitter), recording() as timings, phase("login"):
+        with phase("config.load"):
+            configs = _load_configurations(
+                repositories,
+                all_repositories,
+                profile,
+                role,
+                role_duration,
+                scan,
+                credential_source,
+            )
+            configs = {r: _with_duration(c, duration) for r, c in configs.items()}
+        cache = (
+            None
+            if no_cache
+            else TokenCache(refresh_margin=refresh_margin, lock_timeout=lock_timeout)
+        )
+        retry = RetryPolicy(max_attempts=max_attempts, deadline=retry_deadline)
+        tokens = get_tokens(list(configs.values()), cache, max_workers, retry)
+        credentials = dict(zip(configs, tokens))
+
+        logins = {r: (configs[r], credentials[r]) for r in configs}
+        with phase("configure.plan"):
+            changes = plan_targets(selected, logins)
+
+        if plan:
+            typer.echo(describe_plan(changes))
+        elif changes:
+            configure_targets(changes)
+
+    if show_timings:
+        typer.echo(timings.summary(), err=True)
+    if timings_json:
+        timings.write_json(Path(timings_json))
+
+
+@app.command()
+def agent(
+    repositories: Annotated[Optional[List[str]], repositories_argument] = None,
+    all_repositories: Annotated[bool, all_option] = False,
+    scan: Annotated[Optional[str], scan_option] = None,
+    profile: Annotated[Optional[str], profile_option] = None,
+    role: Annotated[Optional[str], role_option] = None,
+    role_duration: Annotated[Optional[int], role_duration_option] = None,
+    credential_source: Annotated[
+        Optional[CredentialSource], credential_source_option
+    ] = None,
+    refresh_margin: Annotated[int, refresh_margin_option] = DEFAULT_REFRESH_MARGIN,
+    socket_path: Annotated[Optional[str], socket_option] = None,
+) -> None:
+    """Run an agent that keeps tokens fresh and serves them over a Unix socket.
+
+    Tokens are refreshed ahead of expiry, so `partifact token` returns
+    immediately without calling AWS.
+    """
+    from partifact.agent import Agent, AgentError, default_socket_path
+    from partifact.cache import TokenCache
+
+    configs = _load_configurations(
+        repositories,
+        all_repositories,
+        profile,
+        role,
+        role_duration,
+        scan,
+        credential_source,
+    )
+    path = Path(socket_path) if socket_path else default_socket_path()
+
+    typer.echo(f"serving tokens for {', '.join(configs)} on {path}", err=True)
+    token_agent = Agent(configs, TokenCache(refresh_margin=refresh_margin))
+    try:
+        with contextlib.suppress(KeyboardInterrupt):
+            token_agent.serve_forever(path)
+    except AgentError as err:
+        raise typer.BadParameter(str(err))
+
+
+@app.command()
+def token(
+    repository: str,
+    profile: Annotated[Optional[str], profile_option] = None,
+    role: Annotated[Optional[str], role_option] = None,
+    role_duration: Annotated[Optional[int], role_duration_option] = None,
+    duration: Annotated[Optional[int], duration_option] = None,
+    credential_source: Annotated[
+        Optional[CredentialSource], credential_source_option
+    ] = None,
+    socket_path: Annotated[Optional[str], socket_option] = None,
+    metrics_url: Annotated[Optional[str], metrics_option] = None,
+) -> None:
+    """Print the token for a repository.
+
+    The token is requested from the agent if one is running, unless any of
+    --profile, --role, --role-duration, --duration or --credential-source is
+    given, as the agent's tokens are fetched with its own configuration.
+    Otherwise the token is taken from the cache or fetched from AWS.
+    """
+    from partifact.agent import AgentError, request_token
+    from partifact.auth_token import get_token
+    from partifact.cache import TokenCache
+    from partifact.metrics import emitting
+
+    emitter = _emitter(metrics_url)
+    with emitting(emitter), phase("token"):
+        value = None
+        overrides = (profile, role, role_duration, duration, credential_source)
+        if all(o is None for o in overrides):
+            path = Path(socket_path) if socket_path else None
+            with contextlib.suppress(AgentError):
+                value = request_token(repository, path).token
+        if value is None:
+            config = Configuration.load(
+                repository, profile, role, role_duration, credential_source
+            )
+            value = get_token(_with_duration(config, duration), TokenCache())
+
+    typer.echo(value)
+
+
+@app.command()
+def status(
+    repositories: Annotated[Optional[List[str]], status_repositories_argument] = None,
+    profile: Annotated[Optional[str], profile_option] = None,
+    role: Annotated[Optional[str], role_option] = None,
+    min_validity: Annotated[int, min_validity_option] = 0,
+    as_json: Annotated[bool, json_option] = False,
+) -> None:
+    """Show how long the token of each repository is still valid.
+
+    This only reads the token cache and the configuration of poetry and pip,
+    without any calls to AWS. It exits with status 1 if any token is missing,
+    unknown as poetry or pip hold another one, or expires within --min-validity
+    seconds,
+    e.g. `partifact status --min-validity 3600 || partifact login --all`.
+    """
+    from partifact.cache import TokenCache
+    from partifact.status import token_status
+
+    configs = _configured_repositories(repositories, profile, role)
+    statuses = token_status(configs, TokenCache(), min_validity)
+
+    if as_json:
+        typer.echo(json.dumps([dataclasses.asdict(s) for s in statuses], indent=2))
+    else:
+        width = max(len(s.repository) for s in statuses)
+        for s in statuses:
+            typer.echo(f"{s.repository:<{width}}  {s.describe()}")
+
+    if not all(s.valid for s in statuses):
+        raise typer.Exit(1)
+
+
+@app.command()
+def env(
+    repository: str,
+    profile: Annotated[Optional[str], profile_option] = None,
+    role: Annotated[Optional[str], role_option] = None,
+    role_duration: Annotated[Optional[int], role_duration_option] = None,
+    duration: Annotated[Optional[int], duration_option] = None,
+    credential_source: Annotated[
+        Optional[CredentialSource], credential_source_option
+    ] = None,
+    no_cache: Annotated[bool, no_cache_option] = False,
+) -> None:
+    """Print shell exports configuring poetry, pip and uv for a repository.
+
+    Nothing is written to disk, e.g. run `eval "$(partifact env my-repo)"`.
+    """
+    from partifact.auth_token import get_token
+    from partifact.cache import TokenCache
+    from partifact.environment import credential_environment, shell_exports
+
+    config = Configuration.load(
+        repository, profile, role, role_duration, credential_source
+    )
+    config = _with_duration(config, duration)
+    value = get_token(config, None if no_cache else TokenCache())
+
+    typer.echo(shell_exports(credential_environment(repository, config, value)))
+
+
+@app.command("exec")
+def exec_command(
+    repository: str,
+    command: Annotated[List[str], command_argument],
+    profile: Annotated[Optional[str], profile_option] = None,
+    role: Annotated[Optional[str], role_option] = None,
+    role_duration: Annotated[Optional[int], role_duration_option] = None,
+    duration: Annotated[Optional[int], duration_option] = None,
+    credential_source: Annotated[
+        Optional[CredentialSource], credential_source_option
+    ] = None,
+    no_cache: Annotated[bool, no_cache_option] = False,
+) -> None:
+    """Run a command with credentials for a repository in its environment.
+
+    Nothing is written to disk, e.g. `partifact exec my-repo -- poetry install`.
+    """
+    from partifact.auth_token import get_token
+    from partifact.cache import TokenCache
+    from partifact.environment import credential_environment
+
+    config = Configuration.load(
+        repository, profile, role, role_duration, credential_source
+    )
+    config = _with_duration(config, duration)
+    value = get_token(config, None if no_cache else TokenCache())
+
+    environment = {**os.environ, **credential_environment(repository, config, value)}
+    try:
+        result = subprocess.run(command, env=environment)
+    except FileNotFoundError:
+        raise typer.BadParameter(f"command not found: {command[0]}")
+    raise typer.Exit(result.returncode)
+
+
+@app.command()
+def proxy(
+    repository: str,
+    profile: Annotated[Optional[str], profile_option] = None,
+    role: Annotated[Optional[str], role_option] = None,
+    role_duration: Annotated[Optional[int], role_duration_option] = None,
+    credential_source: Annotated[
+        Optional[CredentialSource], credential_source_option
+    ] = None,
+    host: Annotated[str, host_option] = DEFAULT_PROXY_HOST,
+    port: Annotated[int, port_option] = DEFAULT_PROXY_PORT,
+    index_ttl: Annotated[Optional[float], index_ttl_option] = None,
+    max_cache_size: Annotated[Optional[int], max_cache_size_option] = None,
+    should_configure_pip: Annotated[bool, proxy_configure_pip_option] = False,
+    refresh_margin: Annotated[int, refresh_margin_option] = DEFAULT_REFRESH_MARGIN,
+) -> None:
+    """Run a local caching proxy for a repository's simple index.
+
+    Index pages are cached briefly and distributions are kept on disk, so
+    repeated installs on the host don't download them from CodeArtifact again.
+    """
+    from partifact.agent import Agent
+    from partifact.cache import TokenCache
+    from partifact.proxy import DEFAULT_INDEX_TTL, DEFAULT_MAX_CACHE_SIZE, Proxy
+    from partifact.shell_commands import configure_pip_index, index_url
+
+    config = Configuration.load(
+        repository, profile, role, role_duration, credential_source
+    )
+    tokens = Agent({repository: config}, TokenCache(refresh_margin=refresh_margin))
+    index_proxy = Proxy(
+        index_url(config),
+        lambda: tokens.token(repository).token,
+        index_ttl=DEFAULT_INDEX_TTL if index_ttl is None else index_ttl,
+        max_cache_size=(
+            DEFAULT_MAX_CACHE_SIZE
+            if max_cache_size is None
+            else max_cache_size * MEGABYTE
+        ),
+    )
+
+    def ready(url: str) -> None:
+        if should_configure_pip:
+            configure_pip_index(url)
+        typer.echo(f"serving {repository} on {url}", err=True)
+
+    with contextlib.suppress(KeyboardInterrupt):
+        index_proxy.serve_forever(host, port, ready)
+
+
+@app.command()
+def prefetch(
+    repository: str,
+    lock_file: Annotated[str, lock_file_option] = DEFAULT_LOCK_FILE,
+    wheelhouse: Annotated[str, wheelhouse_option] = DEFAULT_WHEELHOUSE,
+    include: Annotated[Optional[List[str]], include_option] = None,
+    max_workers: Annotated[Optional[int], download_workers_option] = None,
+    profile: Annotated[Optional[str], profile_option] = None,
+    role: Annotated[Optional[str], role_option] = None,
+    role_duration: Annotated[Optional[int], role_duration_option] = None,
+    credential_source: Annotated[
+        Optional[CredentialSource], credential_source_option
+    ] = None,
+    no_cache: Annotated[bool, no_cache_option] = False,
+) -> None:
+    """Download the distributions locked in poetry.lock into a wheelhouse.
+
+    Install from it with `pip install --no-index --find-links <wheelhouse>`.
     """
-    config = Configuration.load(repository, profile, role)
-    token = get_token(config)
+    from partifact.auth_token import get_token
+    from partifact.cache import TokenCache
+    from partifact.prefetch import (
+        DEFAULT_DOWNLOAD_WORKERS,
+        PrefetchError,
+        locked_files,
+        prefetch_files,
+    )
+    from partifact.shell_commands import index_url
+
+    try:
+        files = locked_files(Path(lock_file), include or ())
+    except PrefetchError as err:
+        raise typer.BadParameter(str(err))
+
+    config = Configuration.load(
+        repository, profile, role, role_duration, credential_source
+    )
+    value = get_token(config, None if no_cache else TokenCache())
+
+    result = prefetch_files(
+        files,
+        Path(wheelhouse),
+        index_url(config),
+        value,
+        max_workers or DEFAULT_DOWNLOAD_WORKERS,
+    )
+    for filename, reason in result.failed.items():
+        typer.echo(f"failed to download {filename}: {reason}", err=True)
+    typer.echo(result.summary(), err=True)
+    if result.failed:
+        raise typer.Exit(1)
+
 
-    if should_configure_pip:
-        configure_pip(config, token)
-    configure_poetry(repository, token)
+@app.command()
+def publish(
+    repository: str,
+    distributions: Annotated[List[str], distributions_argument],
+    max_workers: Annotated[Optional[int], upload_workers_option] = None,
+    max_attempts: Annotated[Optional[int], upload_attempts_option] = None,
+    skip_existing: Annotated[bool, skip_existing_option] = False,
+    profile: Annotated[Optional[str], profile_option] = None,
+    role: Annotated[Optional[str], role_option] = None,
+    role_duration: Annotated[Optional[int], role_duration_option] = None,
+    credential_source: Annotated[
+        Optional[CredentialSource], credential_source_option
+    ] = None,
+    no_cache: Annotated[bool, no_cache_option] = False,
+) -> None:
+    """Upload built distributions to a repository, several at a time."""
+    from partifact.auth_token import get_token
+    from partifact.cache import TokenCache
+    from partifact.publish import (
+        DEFAULT_UPLOAD_POLICY,
+        DEFAULT_UPLOAD_WORKERS,
+        DISTRIBUTION_SUFFIXES,
+        publish_files,
+    )
+    from partifact.shell_commands import upload_url
+
+    paths = [Path(d) for d in distributions]
+    for path in paths:
+        if not path.is_file() or not path.name.endswith(DISTRIBUTION_SUFFIXES):
+            raise typer.BadParameter(f"{path} is not a wheel or sdist")
+
+    config = Configuration.load(
+        repository, profile, role, role_duration, credential_source
+    )
+    value = get_token(config, None if no_cache else TokenCache())
+
+    policy = DEFAULT_UPLOAD_POLICY
+    if max_attempts is not None:
+        policy = dataclasses.replace(policy, max_attempts=max_attempts)
+    result = publish_files(
+        paths,
+        upload_url(config),
+        value,
+        max_workers or DEFAULT_UPLOAD_WORKERS,
+        policy,
+        skip_existing,
+    )
+    for filename, reason in result.failed.items():
+        typer.echo(f"failed to upload {filename}: {reason}", err=True)
+    typer.echo(result.summary(), err=True)
+    if result.failed:
+        raise typer.Exit(1)
 
 
 @app.command()
-def configure():
+def configure(
+    repository: str,
+    url: Annotated[Optional[str], url_option] = None,
+    profile: Annotated[Optional[str], default_profile_option] = None,
+    role: Annotated[Optional[str], default_role_option] = None,
+    role_duration: Annotated[Optional[int], role_duration_option] = None,
+    duration: Annotated[Optional[int], duration_option] = None,
+    credential_source: Annotated[
+        Optional[CredentialSource], credential_source_option
+    ] = None,
+    remove: Annotated[bool, remove_option] = False,
+) -> None:
     """Setup a repository with the necessary details for login.
 
-    This stores the configuration in a file.
+    This stores the configuration in a registry in the user's configuration
+    directory, so the repository can be logged into from any directory.
     """
-    # TODO: configure a new repository
-    pass
+    registry = dict(load_registry())
+    if remove:
+        if registry.pop(repository, None) is None:
+            raise typer.BadParameter(f"{repository} is not configured")
+        save_registry(registry)
+        typer.echo(f"removed {repository}", err=True)
+        return
+
+    try:
+        parsed_url = parse_url(url or load_sources()[repository])
+    except KeyError:
+        raise typer.BadParameter(f"no source named {repository}, pass its --url")
+    except (MissingConfiguration, InvalidConfiguration) as err:
+        raise typer.BadParameter(str(err))
+
+    registry[repository] = Configuration(
+        aws_profile=profile,
+        aws_role_name=role,
+        aws_role_duration=role_duration,
+        aws_credential_source=credential_source,
+        code_artifact_token_duration=duration,
+        **parsed_url,
+    )
+    save_registry(registry)
+    typer.echo(f"configured {repository}", err=True)
@@ -0,0 +1,328 @@
+"""Metrics and traces of partifact's work, for fleet-wide visibility.
+
+While an `Emitter` is active, every timed phase, see `partifact.timing`, is
+reported to it as a duration histogram and a span, and as an error counter if
+it raises. Token cache hits and misses are counted too. Built in are emitters
+sending StatsD over UDP and appending OTLP/JSON to a file, which the
+OpenTelemetry collector can pick up.
+
+Nothing is emitted unless an emitter is set, e.g. through the PARTIFACT_METRICS
+environment variable of the CLI, and phases then cost no more than without.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+METRICS_ENV = "PARTIFACT_METRICS"
+METRIC_PREFIX = "partifact"
+DEFAULT_STATSD_PORT = 8125
+
+Tags = Dict[str, str]
+# a metric name with its sorted tags
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Emitter:
+    """Receives counters, histograms and spans.
+
+    Emitters may be called from several threads at once. They must not raise,
+    as reporting metrics should never fail a login.
+    """
+
+    def increment(self, name: str, value: int = 1, tags: Optional[Tags] = None) -> None:
+        """Adds to a counter, e.g. "cache.hit"."""
+        pass
+
+    def histogram(self, name: str, value: float, tags: Optional[Tags] = None) -> None:
+        """Records a value of a distribution, e.g. a duration in milliseconds."""
+        pass
+
+    def span(
+        self,
+        name: str,
+        start: float,
+        duration: float,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        """Records an operation starting at a unix time and lasting some seconds."""
+        pass
+
+    def phase(
+        self,
+        name: str,
+        start: float,
+        duration: float,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        """Records a timed phase, by default as a histogram, a span and errors."""
+        self.histogram(f"{name}.duration", duration * 1000)
+        self.span(name, start, duration, error)
+        if error is not None:
+            self.increment(f"{name}.errors", tags={"error": type(error).__name__})
+
+    def flush(self) -> None:
+        """Sends anything still buffered."""
+        pass
+
+
+class StatsdEmitter(Emitter):
+    """Sends counters and histograms as StatsD datagrams over UDP.
+
+    Spans are only sent as their duration histogram, which StatsD calls a timer.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = DEFAULT_STATSD_PORT,
+        prefix: str = METRIC_PREFIX,
+        tags: bool = False,
+    ) -> None:
+        """Creates an emitter.
+
+        Args:
+            host (str): The host of the StatsD server.
+            port (int): The UDP port of the StatsD server.
+            prefix (str): Prepended to every metric name.
+            tags (bool): Whether to append tags in the DogStatsD format, which
+                plain StatsD servers don't understand.
+        """
+        import socket
+
+        self.address = (host, port)
+        self.prefix = prefix
+        self.tags = tags
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def increment(self, name: str, value: int = 1, tags: Optional[Tags] = None) -> None:
+        """Sends a counter."""
+        self._send(name, f"{value}|c", tags)
+
+    def histogram(self, name: str, value: float, tags: Optional[Tags] = None) -> None:
+        """Sends a timer, as histograms are durations in milliseconds here."""
+        self._send(name, f"{value:.3f}|ms", tags)
+
+    def _send(self, name: str, value: str, tags: Optional[Tags]) -> None:
+        line = f"{self.prefix}.{name}:{value}"
+        if self.tags and tags:
+            line += "|#" + ",".join(f"{k}:{v}" for k, v in tags.items())
+        with contextlib.suppress(OSError):
+            self._socket.sendto(line.encode(), self.address)
+
+
+class OtlpFileEmitter(Emitter):
+    """Appends metrics and spans to a file in the OTLP/JSON format.
+
+    Everything is buffered and written on `flush` as two lines, an
+    ExportMetricsServiceRequest and an ExportTraceServiceRequest, as read by
+    the OpenTelemetry collector's otlpjsonfile receiver. Counters and
+    histograms are aggregated since the previous flush. The spans of one
+    emitter share a trace.
+    """
+
+    def __init__(self, path: Path, service_name: str = METRIC_PREFIX) -> None:
+        """Creates an emitter.
+
+        Args:
+            path (Path): The file to append to.
+            service_name (str): The service.name attribute of the resource.
+        """
+        self.path = path
+        self.service_name = service_name
+        self._trace_id = os.urandom(16).hex()
+        self._counters: Dict[_Key, int] = {}
+        self._histograms: Dict[_Key, List[float]] = {}
+        self._spans: List[Dict[str, Any]] = []
+        self._since = time.time_ns()
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: int = 1, tags: Optional[Tags] = None) -> None:
+        """Adds to a counter."""
+        key = (name, tuple(sorted((tags or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def histogram(self, name: str, value: float, tags: Optional[Tags] = None) -> None:
+        """Adds a value to a histogram."""
+        key = (name, tuple(sorted((tags or {}).items())))
+        with self._lock:
+            self._histograms.setdefault(key, []).append(value)
+
+    def span(
+        self,
+        name: str,
+        start: float,
+        duration: float,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        """Buffers a span."""
+        start_ns = int(start * 1e9)
+        span = {
+            "traceId": self._trace_id,
+            "spanId": os.urandom(8).hex(),
+            "name": name,
+            "kind": 1,
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(start_ns + int(duration * 1e9)),
+            "status": {"code": 2, "message": str(error)} if error else {},
+        }
+        with self._lock:
+            self._spans.append(span)
+
+    def flush(self) -> None:
+        """Appends everything buffered to the file."""
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            histograms, self._histograms = self._histograms, {}
+            spans, self._spans = self._spans, []
+            since, self._since = self._since, time.time_ns()
+
+        lines = []
+        if counters or histograms:
+            metrics = self._metrics(counters, histograms, since, time.time_ns())
+            lines.append({"resourceMetrics": [{**self._resource(), **metrics}]})
+        if spans:
+            scope_spans = {"scopeSpans": [{"scope": self._scope(), "spans": spans}]}
+            lines.append({"resourceSpans": [{**self._resource(), **scope_spans}]})
+        if not lines:
+            return
+
+        content = "".join(
+            json.dumps(line, separators=(",", ":")) + "\n" for line in lines
+        )
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(content)
+        except OSError:
+            pass
+
+    def _resource(self) -> Dict[str, Any]:
+        return {
+            "resource": {"attributes": _attributes({"service.name": self.service_name})}
+        }
+
+    def _scope(self) -> Dict[str, Any]:
+        return {"name": METRIC_PREFIX}
+
+    def _metrics(
+        self,
+        counters: Dict[_Key, int],
+        histograms: Dict[_Key, List[float]],
+        since: int,
+        now: int,
+    ) -> Dict[str, Any]:
+        window = {"startTimeUnixNano": str(since), "timeUnixNano": str(now)}
+        # metrics with the same name but different tags share an entry
+        metrics: Dict[str, Dict[str, Any]] = {}
+        for (name, tags), value in counters.items():
+            metric = metrics.setdefault(
+                name,
+                {
+                    "name": f"{METRIC_PREFIX}.{name}",
+                    # delta temporality, as counts restart at every flush
+                    "sum": {
+                        "dataPoints": [],
+                        "aggregationTemporality": 1,
+                        "isMonotonic": True,
+                    },
+                },
+            )
+            metric["sum"]["dataPoints"].append(
+                {"attributes": _attributes(dict(tags)), **window, "asInt": str(value)}
+            )
+        for (name, tags), values in histograms.items():
+            metric = metrics.setdefault(
+                name,
+                {
+                    "name": f"{METRIC_PREFIX}.{name}",
+                    "unit": "ms",
+                    "histogram": {"dataPoints": [], "aggregationTemporality": 1},
+                },
+            )
+            metric["histogram"]["dataPoints"].append(
+                {
+                    "attributes": _attributes(dict(tags)),
+                    **window,
+                    "count": str(len(values)),
+                    "sum": sum(values),
+                    "min": min(values),
+                    "max": max(values),
+                    "bucketCounts": [str(len(values))],
+                    "explicitBounds": [],
+                }
+            )
+        return {
+            "scopeMetrics": [
+                {"scope": self._scope(), "metrics": list(metrics.values())}
+            ]
+        }
+
+
+def _attributes(values: Tags) -> List[Dict[str, Any]]:
+    return [{"key": k, "value": {"stringValue": v}} for k, v in values.items()]
+
+
+def from_url(url: str) -> Emitter:
+    """Creates an emitter from a URL.
+
+    Supported are "statsd://host:port", "dogstatsd://host:port" for StatsD
+    with tags, and "otlp-file:path" for an OTLP/JSON file. The host and port
+    default to 127.0.0.1 and 8125.
+
+    Raises:
+        ValueError: If the URL isn't supported.
+    """
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme in ("statsd", "dogstatsd"):
+        return StatsdEmitter(
+            parsed.hostname or "127.0.0.1",
+            parsed.port or DEFAULT_STATSD_PORT,
+            tags=parsed.scheme == "dogstatsd",
+        )
+    if parsed.scheme == "otlp-file":
+        path = url[len("otlp-file:") :]
+        if path:
+            return OtlpFileEmitter(Path(path).expanduser())
+    raise ValueError(
+        f"unsupported metrics URL {url}, use statsd://host:port or otlp-file:path"
+    )
+
+
+_emitter: Optional[Emitter] = None
+
+
+def active_emitter() -> Optional[Emitter]:
+    """Returns the emitter metrics are sent to, if any."""
+    return _emitter
+
+
+@contextlib.contextmanager
+def emitting(emitter: Optional[Emitter]) -> Iterator[Optional[Emitter]]:
+    """Sends metrics to the emitter until the block exits, then flushes it.
+
+    Passing None leaves metrics disabled.
+    """
+    global _emitter
+    previous, _emitter = _emitter, emitter
+    try:
+        yield emitter
+    finally:
+        _emitter = previous
+        if emitter is not None:
+            emitter.flush()
+
+
+def increment(name: str, value: int = 1, tags: Optional[Tags] = None) -> None:
+    """Adds to a counter if an emitter is active."""
+    emitter = _emitter
+    if emitter is not None:
+        emitter.increment(name, value, tags)
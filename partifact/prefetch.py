@@ -0,0 +1,278 @@
+"""Downloading the distributions locked in poetry.lock into a wheelhouse.
+
+Docker builds can then install from the wheelhouse with `pip install --no-index
+--find-links wheelhouse`, without credentials or access to CodeArtifact.
+
+Download URLs are resolved from the simple index of the repository, and files
+are streamed to disk over keep-alive connections, several at a time. Every file
+is checked against the hash in the lock file, and files already in the
+wheelhouse with the right hash aren't downloaded again.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import fnmatch
+import hashlib
+import html
+import http.client
+import os
+import re
+import tempfile
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from partifact.connections import ConnectionPool, basic_auth
+from partifact.files import parse_toml
+
+DEFAULT_DOWNLOAD_WORKERS = 8
+CHUNK_SIZE = 1024 * 1024
+# sources poetry installs from without going through an index
+NON_INDEX_SOURCES = frozenset({"git", "directory", "file", "url"})
+
+_HREF_PATTERN = re.compile(r'href="([^"]*)"')
+
+
+class PrefetchError(Exception):
+    """Raised if the lock file cannot be read."""
+
+    pass
+
+
+@dataclass(frozen=True)
+class LockedFile:
+    """A distribution pinned in poetry.lock.
+
+    Attributes:
+        project (str): The normalised name of the project.
+        filename (str): The name of the distribution file.
+        sha256 (str, optional): The SHA-256 digest of the file, if locked.
+    """
+
+    project: str
+    filename: str
+    sha256: Optional[str] = None
+
+
+@dataclass
+class PrefetchResult:
+    """The outcome of a prefetch.
+
+    Attributes:
+        downloaded (List[str]): The files downloaded.
+        skipped (List[str]): The files already in the wheelhouse.
+        failed (Dict[str, str]): Why files failed to download, keyed by file.
+        size (int): The number of bytes downloaded.
+        duration (float): How long the prefetch took, in seconds.
+    """
+
+    downloaded: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    size: int = 0
+    duration: float = 0.0
+
+    def summary(self) -> str:
+        """Returns a human readable summary."""
+        megabytes = self.size / 1024**2
+        rate = megabytes / self.duration if self.duration else 0.0
+        return (
+            f"downloaded {len(self.downloaded)} files ({megabytes:.1f} MB) in"
+            f" {self.duration:.1f} s ({rate:.1f} MB/s), {len(self.skipped)} already"
+            f" present, {len(self.failed)} failed"
+        )
+
+
+def normalize(name: str) -> str:
+    """Returns the normalised name of a project, as used by the simple index."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def locked_files(path: Path, include: Sequence[str] = ()) -> List[LockedFile]:
+    """Returns the distributions pinned in a poetry lock file.
+
+    Packages from git, directories, files and URLs are left out, as they
+    aren't served by the index.
+
+    Args:
+        path: The lock file.
+        include: Glob patterns of the file names to return, e.g.
+            "*manylinux*". All files are returned if no pattern is given.
+
+    Raises:
+        PrefetchError: If the lock file is missing or invalid.
+    """
+    try:
+        lock = parse_toml(path.read_text())
+    except FileNotFoundError:
+        raise PrefetchError(f"{path} not found")
+    except OSError as err:
+        raise PrefetchError(f"failed to read {path}: {err}")
+    except ValueError:
+        raise PrefetchError(f"invalid lock file {path}")
+
+    try:
+        return _locked_files(lock, include)
+    except KeyError as err:
+        raise PrefetchError(f"invalid lock file {path}: missing {err}")
+    except (AttributeError, TypeError):
+        raise PrefetchError(f"invalid lock file {path}")
+
+
+def _locked_files(lock: Dict[str, Any], include: Sequence[str]) -> List[LockedFile]:
+    # lock files written before poetry 1.5 list the files separately
+    legacy_files = (lock.get("metadata") or {}).get("files") or {}
+
+    files = []
+    for package in lock.get("package") or []:
+        source = package.get("source") or {}
+        if source.get("type") in NON_INDEX_SOURCES:
+            continue
+
+        name = package["name"]
+        for locked in package.get("files") or legacy_files.get(name) or []:
+            filename = locked["file"]
+            if include and not any(fnmatch.fnmatch(filename, p) for p in include):
+                continue
+            files.append(
+                LockedFile(normalize(name), filename, _sha256(locked.get("hash")))
+            )
+    return files
+
+
+def prefetch_files(
+    files: Sequence[LockedFile],
+    wheelhouse: Path,
+    index_url: str,
+    token: str,
+    max_workers: int = DEFAULT_DOWNLOAD_WORKERS,
+) -> PrefetchResult:
+    """Downloads distributions into a wheelhouse.
+
+    The index pages of the projects are fetched first, then the files are
+    downloaded, each step with up to `max_workers` requests at a time.
+
+    Args:
+        files: The distributions to download.
+        wheelhouse: The directory to download to.
+        index_url: The simple index URL of the repository.
+        token: A valid CodeArtifact token.
+        max_workers: The maximum number of concurrent requests.
+    """
+    started = time.perf_counter()
+    result = PrefetchResult()
+    wheelhouse.mkdir(parents=True, exist_ok=True)
+
+    pending: Dict[str, List[LockedFile]] = {}
+    for locked in files:
+        if _is_present(wheelhouse / locked.filename, locked.sha256):
+            result.skipped.append(locked.filename)
+        else:
+            pending.setdefault(locked.project, []).append(locked)
+
+    auth = {"Authorization": basic_auth(token)}
+    index_url = index_url if index_url.endswith("/") else index_url + "/"
+    with ConnectionPool() as pool, ThreadPoolExecutor(max_workers) as executor:
+
+        def resolve(project: str) -> Tuple[Dict[str, str], Optional[str]]:
+            try:
+                return _links(pool, f"{index_url}{project}/", auth), None
+            except (http.client.HTTPException, OSError) as err:
+                return {}, str(err) or type(err).__name__
+
+        downloads: List[Tuple[LockedFile, str]] = []
+        for project, (links, error) in zip(pending, executor.map(resolve, pending)):
+            for locked in pending[project]:
+                url = links.get(locked.filename)
+                if url is None:
+                    result.failed[locked.filename] = error or "not found in the index"
+                else:
+                    downloads.append((locked, url))
+
+        def download(item: Tuple[LockedFile, str]) -> Tuple[str, Optional[str], int]:
+            locked, url = item
+            target = wheelhouse / locked.filename
+            try:
+                size = _download(pool, url, auth, target, locked.sha256)
+            except (http.client.HTTPException, OSError, ValueError) as err:
+                return locked.filename, str(err) or type(err).__name__, 0
+            return locked.filename, None, size
+
+        for filename, error, size in executor.map(download, downloads):
+            if error is None:
+                result.downloaded.append(filename)
+                result.size += size
+            else:
+                result.failed[filename] = error
+
+    result.duration = time.perf_counter() - started
+    return result
+
+
+def _sha256(value: Optional[str]) -> Optional[str]:
+    algorithm, _, digest = (value or "").partition(":")
+    return digest.lower() if algorithm == "sha256" and digest else None
+
+
+def _is_present(path: Path, sha256: Optional[str]) -> bool:
+    if not path.is_file():
+        return False
+    if sha256 is None:
+        return True
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest() == sha256
+
+
+def _links(pool: ConnectionPool, url: str, headers: Dict[str, str]) -> Dict[str, str]:
+    response = pool.request("GET", url, {**headers, "Accept": "text/html"})
+    body = response.read()
+    if response.status == 404:
+        return {}
+    if response.status != 200:
+        raise OSError(f"failed to fetch {url}: {response.status} {response.reason}")
+
+    links = {}
+    for href in _HREF_PATTERN.findall(body.decode()):
+        link = urllib.parse.urljoin(url, html.unescape(href)).partition("#")[0]
+        filename = urllib.parse.unquote(urllib.parse.urlsplit(link).path)
+        links[filename.rsplit("/", 1)[-1]] = link
+    return links
+
+
+def _download(
+    pool: ConnectionPool,
+    url: str,
+    headers: Dict[str, str],
+    target: Path,
+    sha256: Optional[str],
+) -> int:
+    response = pool.request("GET", url, headers)
+    if response.status != 200:
+        response.read()
+        raise OSError(f"{response.status} {response.reason}")
+
+    fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.")
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+
+        if sha256 is not None and digest.hexdigest() != sha256:
+            raise ValueError(f"hash mismatch, expected sha256 {sha256}")
+        os.replace(tmp_path, target)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
+    return size
@@ -0,0 +1,405 @@
+"""A local caching proxy in front of the simple index of a CodeArtifact repository.
+
+pip and poetry are pointed at http://127.0.0.1:<port>/simple/ instead of
+CodeArtifact. The proxy adds the token to upstream requests, keeps index pages
+for a short time before revalidating them with their ETag, and stores
+distributions in an on-disk cache addressed by their SHA-256 digest, so jobs on
+the same host download each distribution from CodeArtifact only once.
+
+Links on index pages are rewritten to point to the proxy, with distributions
+served under /files/ followed by their upstream path. CodeArtifact serves
+distributions below the index, at <project>/<version>/<file>, so links are told
+apart by their depth and file suffix rather than by their prefix.
+
+The HTTP server itself lives in `proxy_server`, as `http.server` takes longer to
+import than the rest of the CLI.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import html
+import os
+import re
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from partifact.cache import default_cache_dir
+from partifact.connections import basic_auth
+
+DEFAULT_INDEX_TTL = 300.0
+DEFAULT_MAX_CACHE_SIZE = 5 * 1024**3
+# index pages and digests of links held in memory, beyond which the least
+# recently used are forgotten
+MAX_CACHED_PAGES = 1024
+MAX_CACHED_DIGESTS = 100_000
+PROXY_DIR_NAME = "proxy"
+INDEX_PREFIX = "/simple/"
+FILES_PREFIX = "/files/"
+UPSTREAM_TIMEOUT = 60.0
+CHUNK_SIZE = 1024 * 1024
+DISTRIBUTION_SUFFIXES = (".whl", ".tar.gz", ".tar.bz2", ".tgz", ".zip", ".egg")
+
+_HREF_PATTERN = re.compile(r'href="([^"]*)"')
+
+_K = TypeVar("_K")
+_V = TypeVar("_V")
+
+
+class UpstreamError(Exception):
+    """Raised if a request to the upstream index fails."""
+
+    def __init__(self, status: int, message: str) -> None:
+        """Creates an error.
+
+        Args:
+            status (int): The HTTP status the proxy responds with.
+            message (str): What went wrong.
+        """
+        super().__init__(message)
+        self.status = status
+
+
+class FileCache:
+    """Distributions stored by their SHA-256 digest, evicting the least recently used.
+
+    Recency is tracked through the modification time of the files, which is
+    updated on every hit, as access times are often not recorded. The size of
+    the cache is tracked as files are stored, so the directory is only scanned
+    for files to evict once it grows beyond the limit.
+    """
+
+    def __init__(self, directory: Path, max_size: int = DEFAULT_MAX_CACHE_SIZE) -> None:
+        """Creates a cache.
+
+        Args:
+            directory (Path): The directory the files are kept in.
+            max_size (int): The total size of the files, in bytes, beyond which
+                the least recently used files are evicted.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self._evict_lock = threading.Lock()
+        # the total size of the files, unknown until the directory is scanned
+        self._size: Optional[int] = None
+
+    def path(self, digest: str) -> Path:
+        """Returns the path a file with the given digest is kept at."""
+        return self.directory / digest[:2] / digest
+
+    def get(self, digest: str) -> Optional[Path]:
+        """Returns the path of a cached file, marking it as recently used."""
+        path = self.path(digest)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(
+        self, chunks: Iterable[bytes], expected_digest: Optional[str] = None
+    ) -> str:
+        """Stores a file, evicting others if the cache grows too large.
+
+        Args:
+            chunks (Iterable[bytes]): The content of the file.
+            expected_digest (Optional[str]): The SHA-256 digest the content
+                must have, if known.
+
+        Returns:
+            The SHA-256 digest of the file.
+
+        Raises:
+            ValueError: If the content doesn't match the expected digest.
+        """
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".download.")
+        try:
+            sha256 = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    sha256.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+
+            digest = sha256.hexdigest()
+            if expected_digest and digest != expected_digest.lower():
+                raise ValueError(f"expected digest {expected_digest}, got {digest}")
+
+            path = self.path(digest)
+            path.parent.mkdir(exist_ok=True)
+            added = 0 if path.exists() else size
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp_path)
+            raise
+
+        with self._evict_lock:
+            if self._size is not None:
+                self._size += added
+            full = self._size is None or self._size > self.max_size
+        if full:
+            self.evict(keep=path)
+        return digest
+
+    def evict(self, keep: Optional[Path] = None) -> None:
+        """Removes the least recently used files until the cache fits its size.
+
+        Args:
+            keep (Optional[Path]): A file never to remove, e.g. one just stored.
+        """
+        with self._evict_lock:
+            self._size = self._evict(keep)
+
+    def _evict(self, keep: Optional[Path]) -> int:
+        files: List[Tuple[float, int, Path]] = []
+        for path in self.directory.glob("??/*"):
+            with contextlib.suppress(FileNotFoundError):
+                stat = path.stat()
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                path.unlink()
+            total -= size
+        return total
+
+
+@dataclass(frozen=True)
+class _Page:
+    body: bytes
+    etag: Optional[str]
+    fetched: float
+
+
+class _Recent(Generic[_K, _V]):
+    """A mapping that forgets its least recently used entries beyond a size."""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[_K, _V]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: _K) -> Optional[_V]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def __setitem__(self, key: _K, value: _V) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class Proxy:
+    """Serves the simple index of a repository from a local cache."""
+
+    def __init__(
+        self,
+        upstream: str,
+        token: Callable[[], str],
+        directory: Optional[Path] = None,
+        index_ttl: float = DEFAULT_INDEX_TTL,
+        max_cache_size: int = DEFAULT_MAX_CACHE_SIZE,
+    ) -> None:
+        """Creates a proxy.
+
+        Args:
+            upstream (str): The simple index URL of the repository.
+            token (Callable[[], str]): Returns a valid token for the repository.
+            directory (Optional[Path]): Where distributions are cached. Defaults
+                to the proxy directory in partifact's cache directory.
+            index_ttl (float): How long index pages are served before they are
+                revalidated, in seconds.
+            max_cache_size (int): The size of the distribution cache, in bytes.
+        """
+        self.upstream = upstream if upstream.endswith("/") else upstream + "/"
+        self.token = token
+        self.index_ttl = index_ttl
+        self.files = FileCache(
+            directory or default_cache_dir() / PROXY_DIR_NAME, max_cache_size
+        )
+
+        parsed = urllib.parse.urlsplit(self.upstream)
+        self._origin = f"{parsed.scheme}://{parsed.netloc}"
+        self._pages: _Recent[str, _Page] = _Recent(MAX_CACHED_PAGES)
+        self._digests: _Recent[str, str] = _Recent(MAX_CACHED_DIGESTS)
+        self._lock = threading.Lock()
+        self._server: Any = None
+
+    def index_page(self, path: str) -> bytes:
+        """Returns an index page with its links pointing to the proxy.
+
+        Args:
+            path (str): The path of the page relative to the index, e.g. "pkg/".
+
+        Raises:
+            UpstreamError: If the page couldn't be fetched.
+        """
+        import urllib.error
+
+        url = urllib.parse.urljoin(self.upstream, path)
+        if not url.startswith(self.upstream) or _is_distribution(path):
+            raise UpstreamError(404, "not found")
+
+        with self._lock:
+            page = self._pages.get(url)
+        now = time.time()
+        if page is not None and now - page.fetched < self.index_ttl:
+            return page.body
+
+        headers = {"Accept": "text/html"}
+        if page is not None and page.etag:
+            headers["If-None-Match"] = page.etag
+
+        try:
+            with self._open(url, headers) as response:
+                body = self._rewrite(url, response.read())
+                page = _Page(body, response.headers.get("ETag"), now)
+        except urllib.error.HTTPError as err:
+            if err.code != 304 or page is None:
+                raise _upstream_error(err)
+            page = _Page(page.body, page.etag, now)
+
+        with self._lock:
+            self._pages[url] = page
+        return page.body
+
+    def file(self, path: str) -> Path:
+        """Returns the cached copy of a distribution, downloading it if needed.
+
+        Args:
+            path (str): The path of the distribution on the proxy, starting
+                with /files/.
+
+        Raises:
+            UpstreamError: If the distribution couldn't be downloaded or
+                didn't match the digest on the index page.
+        """
+        import urllib.error
+
+        with self._lock:
+            digest = self._digests.get(path)
+        if digest is not None:
+            cached = self.files.get(digest)
+            if cached is not None:
+                return cached
+
+        url = f"{self._origin}/{path[len(FILES_PREFIX):]}"
+        try:
+            with self._open(url) as response:
+                chunks = iter(lambda: response.read(CHUNK_SIZE), b"")
+                digest = self.files.put(chunks, digest)
+        except urllib.error.HTTPError as err:
+            raise _upstream_error(err)
+        except ValueError as err:
+            raise UpstreamError(502, f"corrupt download of {url}: {err}")
+
+        with self._lock:
+            self._digests[path] = digest
+        return self.files.path(digest)
+
+    def serve_forever(
+        self,
+        host: str,
+        port: int,
+        ready: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        """Serves the index until `shutdown` is called.
+
+        Args:
+            host (str): The address to listen on.
+            port (int): The port to listen on, or 0 for any free port.
+            ready (Optional[Callable[[str], None]]): Called with the URL of the
+                index once the proxy accepts requests.
+        """
+        from partifact.proxy_server import ProxyServer
+
+        with ProxyServer((host, port), self) as server:
+            self._server = server
+            if ready is not None:
+                ready(f"http://{host}:{server.server_address[1]}{INDEX_PREFIX}")
+            server.serve_forever()
+
+    def shutdown(self) -> None:
+        """Stops serving the index."""
+        if self._server is not None:
+            self._server.shutdown()
+
+    def _open(self, url: str, headers: Optional[Dict[str, str]] = None) -> Any:
+        import urllib.error
+        import urllib.request
+
+        request = urllib.request.Request(
+            url, headers={**(headers or {}), "Authorization": basic_auth(self.token())}
+        )
+        try:
+            return urllib.request.urlopen(  # noqa: S310
+                request, timeout=UPSTREAM_TIMEOUT
+            )
+        except urllib.error.HTTPError:
+            raise
+        except OSError as err:
+            raise UpstreamError(502, f"failed to reach {url}: {err}")
+
+    def _rewrite(self, page_url: str, body: bytes) -> bytes:
+        def local(match: re.Match) -> str:
+            target = urllib.parse.urljoin(page_url, html.unescape(match.group(1)))
+            if not target.startswith(self._origin + "/"):
+                return match.group(0)
+
+            location, _, fragment = target.partition("#")
+            relative = location[len(self.upstream) :]
+            if location.startswith(self.upstream) and not _is_distribution(relative):
+                path = INDEX_PREFIX + relative
+            else:
+                path = FILES_PREFIX + location[len(self._origin) + 1 :]
+                digest = dict(urllib.parse.parse_qsl(fragment)).get("sha256")
+                if digest:
+                    with self._lock:
+                        self._digests[path] = digest
+
+            href = f"{path}#{fragment}" if fragment else path
+            return f'href="{html.escape(href)}"'
+
+        return _HREF_PATTERN.sub(local, body.decode()).encode()
+
+
+def _is_distribution(path: str) -> bool:
+    # project pages are a single level below the index, anything deeper is a file
+    path = urllib.parse.urlsplit(path).path
+    return "/" in path.strip("/") or path.endswith(DISTRIBUTION_SUFFIXES)
+
+
+def _upstream_error(err: Any) -> UpstreamError:
+    # missing pages are passed on, so pip can tell a missing project apart
+    status = 404 if err.code == 404 else 502
+    return UpstreamError(status, f"upstream responded with {err.code} {err.reason}")
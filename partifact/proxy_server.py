@@ -0,0 +1,72 @@
+"""The HTTP server of the caching proxy, see `partifact.proxy`."""
+
+from __future__ import annotations
+
+import os
+import shutil
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Tuple
+
+from partifact.proxy import FILES_PREFIX, INDEX_PREFIX, Proxy, UpstreamError
+
+
+class ProxyServer(ThreadingHTTPServer):
+    """Serves a proxy's index and distributions over HTTP."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], proxy: Proxy) -> None:
+        """Creates a server listening on an address.
+
+        Args:
+            address (Tuple[str, int]): The host and port to listen on.
+            proxy (Proxy): The proxy handling the requests.
+        """
+        super().__init__(address, _Handler)
+        self.proxy = proxy
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: ProxyServer
+    # keep connections open, pip makes many requests in a row
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:  # noqa: N802
+        path = urllib.parse.urlsplit(self.path).path
+        try:
+            if path.startswith(INDEX_PREFIX):
+                body = self.server.proxy.index_page(path[len(INDEX_PREFIX) :])
+                self._respond(200, body, "text/html; charset=utf-8")
+            elif path.startswith(FILES_PREFIX):
+                self._send_file(self.server.proxy.file(self.path))
+            else:
+                self._respond(404, b"not found")
+        except UpstreamError as err:
+            self._respond(err.status, str(err).encode())
+
+    def log_message(self, *args: Any) -> None:
+        # requests are too frequent to log, errors are returned to the client
+        pass
+
+    def _respond(
+        self, status: int, body: bytes, content_type: str = "text/plain"
+    ) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_file(self, path: Any) -> None:
+        try:
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(size))
+                self.end_headers()
+                shutil.copyfileobj(f, self.wfile)
+        except FileNotFoundError:
+            # evicted in the meantime, which the next request will make up for
+            self._respond(503, b"evicted, try again")
@@ -0,0 +1,356 @@
+"""Uploading built distributions to a CodeArtifact repository.
+
+Files are uploaded through the same legacy upload API twine uses, several at a
+time over keep-alive connections. Each upload is streamed from disk, and
+retried with backoff if it fails with a server error or a broken connection.
+"""
+
+from __future__ import annotations
+
+import email.parser
+import hashlib
+import http.client
+import io
+import os
+import tarfile
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Dict, List, Optional, Sequence, Tuple
+
+from partifact.connections import ConnectionPool, basic_auth
+from partifact.retry import RetryPolicy
+
+DEFAULT_UPLOAD_WORKERS = 4
+DEFAULT_UPLOAD_POLICY = RetryPolicy(max_attempts=3, base_delay=1.0, deadline=600.0)
+CHUNK_SIZE = 1024 * 1024
+# statuses worth retrying, as the upload may succeed on another attempt
+RETRYABLE_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+ALREADY_EXISTS_STATUS = 409
+DISTRIBUTION_SUFFIXES = (".whl", ".tar.gz", ".zip")
+
+# metadata fields which may occur several times, and their form field names
+MULTIPLE_USE_FIELDS = {
+    "classifier": "classifiers",
+    "requires-dist": "requires_dist",
+    "provides-dist": "provides_dist",
+    "obsoletes-dist": "obsoletes_dist",
+    "requires-external": "requires_external",
+    "project-url": "project_urls",
+    "provides-extra": "provides_extra",
+    "dynamic": "dynamic",
+    "platform": "platform",
+    "supported-platform": "supported_platform",
+    "license-file": "license_files",
+}
+
+Fields = List[Tuple[str, str]]
+
+
+class PublishError(Exception):
+    """Raised if a file cannot be published."""
+
+    pass
+
+
+class AlreadyPublished(PublishError):
+    """Raised if the repository already holds a file."""
+
+    pass
+
+
+@dataclass
+class PublishResult:
+    """The outcome of a publish.
+
+    Attributes:
+        uploaded (List[str]): The files uploaded.
+        skipped (List[str]): The files already in the repository.
+        failed (Dict[str, str]): Why files failed to upload, keyed by file.
+        size (int): The number of bytes uploaded.
+        duration (float): How long the publish took, in seconds.
+    """
+
+    uploaded: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    size: int = 0
+    duration: float = 0.0
+
+    def summary(self) -> str:
+        """Returns a human readable summary."""
+        megabytes = self.size / 1024**2
+        rate = megabytes / self.duration if self.duration else 0.0
+        return (
+            f"uploaded {len(self.uploaded)} files ({megabytes:.1f} MB) in"
+            f" {self.duration:.1f} s ({rate:.1f} MB/s), {len(self.skipped)} already"
+            f" published, {len(self.failed)} failed"
+        )
+
+
+def upload_fields(path: Path) -> Fields:
+    """Returns the form fields describing a distribution to the upload API.
+
+    Args:
+        path: A wheel or sdist.
+
+    Raises:
+        PublishError: If the distribution's metadata cannot be read.
+    """
+    metadata = email.parser.Parser().parsestr(_read_metadata(path))
+    if not metadata.get("Name") or not metadata.get("Version"):
+        raise PublishError(f"{path.name} lacks a name or version")
+
+    fields: Fields = [
+        (":action", "file_upload"),
+        ("protocol_version", "1"),
+        ("filetype", "bdist_wheel" if path.suffix == ".whl" else "sdist"),
+        ("pyversion", _python_version(path)),
+    ]
+    for name, value in metadata.items():
+        key = name.lower()
+        fields.append((MULTIPLE_USE_FIELDS.get(key, key.replace("-", "_")), value))
+
+    description = metadata.get_payload()
+    if isinstance(description, str) and description.strip():
+        fields.append(("description", description))
+
+    md5 = hashlib.md5(usedforsecurity=False)
+    sha256 = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            md5.update(chunk)
+            sha256.update(chunk)
+    fields += [("md5_digest", md5.hexdigest()), ("sha256_digest", sha256.hexdigest())]
+    return fields
+
+
+def publish_files(
+    paths: Sequence[Path],
+    url: str,
+    token: str,
+    max_workers: int = DEFAULT_UPLOAD_WORKERS,
+    policy: RetryPolicy = DEFAULT_UPLOAD_POLICY,
+    skip_existing: bool = False,
+) -> PublishResult:
+    """Uploads distributions to a repository.
+
+    Args:
+        paths: The wheels and sdists to upload.
+        url: The upload URL of the repository.
+        token: A valid CodeArtifact token.
+        max_workers: The maximum number of concurrent uploads.
+        policy: How failed uploads are retried.
+        skip_existing: Whether files already in the repository are skipped
+            rather than reported as failed.
+    """
+    started = time.perf_counter()
+    result = PublishResult()
+    headers = {"Authorization": basic_auth(token)}
+
+    with ConnectionPool() as pool, ThreadPoolExecutor(max_workers) as executor:
+
+        def upload(path: Path) -> Tuple[Optional[str], bool]:
+            try:
+                _upload(pool, url, headers, path, policy)
+            except AlreadyPublished as err:
+                return (None if skip_existing else str(err)), True
+            except PublishError as err:
+                return str(err), False
+            return None, False
+
+        for path, (error, exists) in zip(paths, executor.map(upload, paths)):
+            if error is not None:
+                result.failed[path.name] = error
+            elif exists:
+                result.skipped.append(path.name)
+            else:
+                result.uploaded.append(path.name)
+                result.size += path.stat().st_size
+
+    result.duration = time.perf_counter() - started
+    return result
+
+
+class MultipartBody(io.RawIOBase):
+    """A multipart/form-data body streaming a file from disk.
+
+    It is read like a file, so it can be sent without holding the file in
+    memory, and rewound to send it again.
+    """
+
+    def __init__(self, fields: Fields, path: Path) -> None:
+        """Creates a body.
+
+        Args:
+            fields (Fields): The form fields preceding the file.
+            path (Path): The file, sent as the "content" field.
+        """
+        self.boundary = uuid.uuid4().hex
+        parts = [
+            self._header(f'name="{name}"') + value.encode() + b"\r\n"
+            for name, value in fields
+        ]
+        parts.append(self._header(f'name="content"; filename="{path.name}"'))
+        self._preamble = b"".join(parts)
+        self._epilogue = f"\r\n--{self.boundary}--\r\n".encode()
+        self._file: IO[bytes] = path.open("rb")
+        self._file_size = os.fstat(self._file.fileno()).st_size
+        self._position = 0
+
+    @property
+    def content_type(self) -> str:
+        """The value of the Content-Type header of the body."""
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        """Returns the size of the body in bytes."""
+        return len(self._preamble) + self._file_size + len(self._epilogue)
+
+    def readable(self) -> bool:
+        """Returns True, the body can be read."""
+        return True
+
+    def seekable(self) -> bool:
+        """Returns True, the body can be rewound."""
+        return True
+
+    def tell(self) -> int:
+        """Returns the current position in the body."""
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        """Moves to a position from the start of the body."""
+        if whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("only seeking from the start is supported")
+        self._position = offset
+        return offset
+
+    def read(self, size: int = -1) -> bytes:
+        """Reads up to `size` bytes, or the rest of the body."""
+        if size < 0:
+            size = len(self) - self._position
+
+        chunks = []
+        while size > 0 and self._position < len(self):
+            chunk = self._read_at(self._position, size)
+            chunks.append(chunk)
+            self._position += len(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def close(self) -> None:
+        """Closes the file."""
+        self._file.close()
+        super().close()
+
+    def _read_at(self, position: int, size: int) -> bytes:
+        file_start = len(self._preamble)
+        file_end = file_start + self._file_size
+        if position < file_start:
+            return self._preamble[position : position + size]
+        if position < file_end:
+            self._file.seek(position - file_start)
+            return self._file.read(min(size, file_end - position))
+        start = position - file_end
+        return self._epilogue[start : start + size]
+
+    def _header(self, disposition: str) -> bytes:
+        return (
+            f"--{self.boundary}\r\n"
+            f"Content-Disposition: form-data; {disposition}\r\n\r\n"
+        ).encode()
+
+
+def _upload(
+    pool: ConnectionPool,
+    url: str,
+    headers: Dict[str, str],
+    path: Path,
+    policy: RetryPolicy,
+) -> None:
+    fields = upload_fields(path)
+    deadline = time.monotonic() + policy.deadline
+
+    with MultipartBody(fields, path) as body:
+        request_headers = {
+            **headers,
+            "Content-Type": body.content_type,
+            "Content-Length": str(len(body)),
+        }
+
+        attempt = 1
+        while True:
+            body.seek(0)
+            try:
+                response = pool.request("POST", url, request_headers, body)
+                response.read()
+                error = f"{response.status} {response.reason}"
+                retryable = response.status in RETRYABLE_STATUSES
+            except (http.client.HTTPException, OSError) as err:
+                error, retryable = str(err) or type(err).__name__, True
+            else:
+                if 200 <= response.status < 300:
+                    return
+                if response.status == ALREADY_EXISTS_STATUS:
+                    if attempt > 1:
+                        # an earlier attempt was stored, but its response lost
+                        return
+                    raise AlreadyPublished("already published")
+
+            delay = policy.delay(attempt)
+            if (
+                not retryable
+                or attempt >= policy.max_attempts
+                or time.monotonic() + delay > deadline
+            ):
+                raise PublishError(error)
+            time.sleep(delay)
+            attempt += 1
+
+
+def _read_metadata(path: Path) -> str:
+    try:
+        content = _metadata_file(path)
+        if content is not None:
+            return content.decode()
+    except (OSError, UnicodeDecodeError, zipfile.BadZipFile, tarfile.TarError):
+        pass
+    raise PublishError(f"failed to read the metadata of {path.name}")
+
+
+def _metadata_file(path: Path) -> Optional[bytes]:
+    if path.name.endswith((".whl", ".zip")):
+        suffix = ".dist-info/METADATA" if path.name.endswith(".whl") else "/PKG-INFO"
+        with zipfile.ZipFile(path) as archive:
+            name = next(
+                (
+                    n
+                    for n in archive.namelist()
+                    if n.count("/") == 1 and n.endswith(suffix)
+                ),
+                None,
+            )
+            return archive.read(name) if name is not None else None
+
+    with tarfile.open(path) as sdist:
+        member = next(
+            (
+                m
+                for m in sdist
+                if m.name.count("/") == 1 and m.name.endswith("/PKG-INFO")
+            ),
+            None,
+        )
+        f = sdist.extractfile(member) if member is not None else None
+        return f.read() if f is not None else None
+
+
+def _python_version(path: Path) -> str:
+    if path.suffix != ".whl":
+        return "source"
+    # name-version(-build)?-python-abi-platform.whl
+    return path.stem.split("-")[-3]
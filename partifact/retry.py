@@ -0,0 +1,127 @@
+"""Retrying AWS calls that are throttled under burst load."""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, TypeVar
+
+from partifact.timing import phase
+
+T = TypeVar("T")
+
+RETRYABLE_ERROR_CODES = frozenset(
+    {
+        "Throttling",
+        "ThrottlingException",
+        "ThrottledException",
+        "TooManyRequestsException",
+        "RequestLimitExceeded",
+        "RequestThrottled",
+        "RequestThrottledException",
+        "ServiceUnavailable",
+        "InternalFailure",
+        "InternalServerException",
+    }
+)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How throttled AWS calls are retried.
+
+    Delays follow exponential backoff with full jitter, i.e. a random delay
+    between zero and the exponential bound, which spreads retries of many
+    clients throttled at once instead of synchronising them.
+
+    Attributes:
+        max_attempts (int): The maximum number of attempts of a call.
+        base_delay (float): The bound of the first delay, in seconds.
+        max_delay (float): The largest bound of any delay, in seconds.
+        deadline (float): The longest time spent on a call including its
+            retries, in seconds. No retry is started that would sleep past it.
+    """
+
+    max_attempts: int = 10
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+    deadline: float = 120.0
+
+    def delay(self, attempt: int) -> float:
+        """Returns a random delay before the given retry, counting from 1."""
+        import random
+
+        bound = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, bound)  # noqa: S311
+
+    def botocore_config(self) -> Any:
+        """Returns the botocore config for clients used with this policy.
+
+        botocore's adaptive mode adds client-side rate limiting that backs off
+        the request rate when throttled, while the retries themselves, of
+        throttling as well as of connection errors and timeouts, are left to
+        `call_with_retry`.
+        """
+        from botocore.config import Config
+
+        return Config(retries={"mode": "adaptive", "total_max_attempts": 1})
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an error of an AWS call is worth retrying.
+
+    These are throttling and transient server errors, as well as failures to
+    connect and timeouts, which botocore would retry by default.
+    """
+    if _is_connection_error(error):
+        return True
+    response = getattr(error, "response", None)
+    if not isinstance(response, dict):
+        return False
+    return response.get("Error", {}).get("Code") in RETRYABLE_ERROR_CODES
+
+
+def _is_connection_error(error: Exception) -> bool:
+    from botocore import exceptions
+
+    # EndpointConnectionError and ConnectTimeoutError are ConnectionErrors,
+    # ConnectionClosedError and ReadTimeoutError are HTTPClientErrors
+    return isinstance(error, (exceptions.ConnectionError, exceptions.HTTPClientError))
+
+
+def call_with_retry(
+    operation: str,
+    call: Callable[[], T],
+    policy: Optional[RetryPolicy] = None,
+) -> T:
+    """Calls an AWS operation, retrying it while it is throttled or unreachable.
+
+    Every backoff is timed as a "retry.<operation>" phase, so `--timings`
+    reports how often and for how long calls were throttled.
+
+    Args:
+        operation: The name of the operation, used for reporting.
+        call: Makes the call.
+        policy: The retry policy, `DEFAULT_RETRY_POLICY` by default.
+    """
+    policy = policy or DEFAULT_RETRY_POLICY
+    deadline = time.monotonic() + policy.deadline
+
+    attempt = 1
+    while True:
+        try:
+            return call()
+        except Exception as err:  # noqa: B902
+            if not is_retryable(err) or attempt >= policy.max_attempts:
+                raise
+
+            delay = policy.delay(attempt)
+            if time.monotonic() + delay > deadline:
+                raise
+
+        with phase(f"retry.{operation}"):
+            time.sleep(delay)
+        attempt += 1
@@ -1,10 +1,21 @@
 """Shell commands to configure pip and poetry."""
 
+import configparser
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
-from typing import Dict, List
+from typing import Dict, List, Mapping, Sequence
 
 from partifact.config import Configuration
+from partifact.config_writers import (
+    pip_config_path,
+    poetry_auth_path,
+    read_pip_index_url,
+    read_poetry_credentials,
+    write_pip_index_url,
+    write_poetry_credentials,
+)
+from partifact.timing import phase
 
 PIP_COMMAND = [
     "pip",
@@ -23,6 +34,9 @@ POETRY_COMMAND = [
 ]
 
 
+Command = List[str]
+
+
 class ShellCommandException(Exception):
     """Represents a failure in a shell command."""
 
@@ -30,34 +44,188 @@ class ShellCommandException(Exception):
 
 
 PIP_URL_TEMPLATE = "https://aws:{token}@{domain}-{account}.d.codeartifact.{region}.amazonaws.com/pypi/{repo}/simple/"
+INDEX_URL_TEMPLATE = "https://{domain}-{account}.d.codeartifact.{region}.amazonaws.com/pypi/{repo}/simple/"
+UPLOAD_URL_TEMPLATE = (
+    "https://{domain}-{account}.d.codeartifact.{region}.amazonaws.com/pypi/{repo}/"
+)
+
+
+def pip_url(config: Configuration, token: str) -> str:
+    """Returns the simple index URL of the repository with the token embedded."""
+    return PIP_URL_TEMPLATE.format(
+        token=token,
+        domain=config.code_artifact_domain,
+        account=config.aws_account,
+        region=config.aws_region,
+        repo=config.code_artifact_repository,
+    )
+
+
+def index_url(config: Configuration) -> str:
+    """Returns the simple index URL of the repository without credentials."""
+    return INDEX_URL_TEMPLATE.format(
+        domain=config.code_artifact_domain,
+        account=config.aws_account,
+        region=config.aws_region,
+        repo=config.code_artifact_repository,
+    )
+
+
+def upload_url(config: Configuration) -> str:
+    """Returns the URL distributions are uploaded to, as used by twine."""
+    return UPLOAD_URL_TEMPLATE.format(
+        domain=config.code_artifact_domain,
+        account=config.aws_account,
+        region=config.aws_region,
+        repo=config.code_artifact_repository,
+    )
 
 
 def configure_pip(config: Configuration, token: str) -> None:
-    """Configures pip globally to use CodeArtifact by default."""
-    try:
-        url = PIP_URL_TEMPLATE.format(
-            token=token,
-            domain=config.code_artifact_domain,
-            account=config.aws_account,
-            region=config.aws_region,
-            repo=config.code_artifact_repository,
-        )
-        _run_command(PIP_COMMAND, {"URL": url})
-    except subprocess.CalledProcessError as err:
-        raise ShellCommandException(f"failed to configure pip: {err.stderr}")
+    """Configures pip globally to use CodeArtifact by default.
+
+    The pip configuration file is written directly if its location can be
+    resolved, otherwise this falls back to `pip config`.
+    """
+    configure_pip_index(pip_url(config, token))
+
+
+def configure_pip_index(url: str) -> None:
+    """Configures pip globally to use an index URL by default, e.g. a local proxy."""
+    with phase("configure.pip"):
+        _configure_pip(url)
+
+
+def _configure_pip(url: str) -> None:
+    run_commands("pip", pip_commands(url))
+
+
+def pip_commands(url: str) -> List[Command]:
+    """Writes pip's configuration file, returning the commands still to run.
+
+    Returns:
+        `pip config` to run if the file can't be located or written.
+    """
+    path = pip_config_path()
+    if path is not None:
+        try:
+            write_pip_index_url(path, url)
+            return []
+        except (OSError, configparser.Error):
+            pass
+    return [expand_command(PIP_COMMAND, {"URL": url})]
+
+
+def pip_pending(config: Configuration, token: str) -> bool:
+    """Whether pip's index URL differs from the one for the repository and token.
+
+    If the pip configuration file can't be located, the URL is assumed to differ.
+    """
+    path = pip_config_path()
+    return path is None or read_pip_index_url(path) != pip_url(config, token)
+
+
+def poetry_pending(tokens: Dict[str, str]) -> Dict[str, str]:
+    """Returns the tokens poetry doesn't hold yet, keyed by poetry repository name.
+
+    If poetry's auth.toml can't be located, all tokens are assumed to be new.
+    """
+    path = poetry_auth_path()
+    if path is None:
+        return dict(tokens)
+
+    current = read_poetry_credentials(path)
+    return {r: t for r, t in tokens.items() if current.get(r) != t}
 
 
 def configure_poetry(repository: str, token: str) -> None:
     """Configures the login credentials for the supplied repo in poetry."""
-    try:
-        _run_command(POETRY_COMMAND, {"TOKEN": token, "REPO": repository})
-    except subprocess.CalledProcessError as err:
-        raise ShellCommandException(f"failed to configure poetry: {err.stderr}")
+    configure_poetry_repositories({repository: token})
+
+
+def configure_poetry_repositories(tokens: Dict[str, str]) -> None:
+    """Configures the login credentials for several repos in poetry in one go.
+
+    Poetry's auth.toml is written once for all repositories if its location
+    can be resolved, otherwise this falls back to `poetry config` per repository.
 
+    Args:
+        tokens (Dict[str, str]): The tokens keyed by poetry repository name.
+    """
+    with phase("configure.poetry"):
+        _configure_poetry_repositories(tokens)
+
+
+def _configure_poetry_repositories(tokens: Dict[str, str]) -> None:
+    run_commands("poetry", poetry_commands(tokens))
+
+
+def poetry_commands(tokens: Dict[str, str]) -> List[Command]:
+    """Writes poetry's auth.toml, returning the commands still to run.
+
+    Args:
+        tokens (Dict[str, str]): The tokens keyed by poetry repository name.
+
+    Returns:
+        `poetry config` to run per repository if auth.toml can't be located
+        or written.
+    """
+    from tomlkit.exceptions import TOMLKitError
+
+    path = poetry_auth_path()
+    if path is not None:
+        try:
+            write_poetry_credentials(path, tokens)
+            return []
+        except (OSError, TOMLKitError):
+            pass
+
+    return [
+        expand_command(POETRY_COMMAND, {"TOKEN": token, "REPO": repository})
+        for repository, token in tokens.items()
+    ]
+
+
+def run_commands(tool: str, commands: Sequence[Command]) -> None:
+    """Runs commands configuring a tool one after another.
+
+    Raises:
+        ShellCommandException: If a command fails or can't be run, e.g. as the
+            tool isn't installed.
+    """
+    for command in commands:
+        try:
+            _run_command(command)
+        except subprocess.CalledProcessError as err:
+            raise ShellCommandException(f"failed to configure {tool}: {err.stderr}")
+        except OSError as err:
+            raise ShellCommandException(f"failed to configure {tool}: {err}")
+
+
+def run_concurrently(commands: Mapping[str, Sequence[Command]]) -> None:
+    """Runs the commands of several tools, each tool's in order but tools at once.
+
+    Args:
+        commands: The commands keyed by the tool they configure.
+
+    Raises:
+        ShellCommandException: If any command fails, once all tools are done.
+    """
+    if len(commands) <= 1:
+        for tool, tool_commands in commands.items():
+            run_commands(tool, tool_commands)
+        return
+
+    with ThreadPoolExecutor(max_workers=len(commands)) as pool:
+        futures = [pool.submit(run_commands, *item) for item in commands.items()]
+    errors = [f.exception() for f in futures if f.exception() is not None]
+    if errors:
+        raise ShellCommandException("\n".join(str(e) for e in errors))
+
+
+def expand_command(command: List[str], env: Dict[str, str]) -> Command:
+    """Replaces the $VARIABLES of a command template with their values."""
 
-def _run_command(
-    command: List[str], env: Dict[str, str]
-) -> subprocess.CompletedProcess:
     def expand(v: str) -> str:
         # this tries each environment variable, and if it's found in "v",
         # it replaces the variable with its value specified in the "env" dict
@@ -67,5 +235,9 @@ def _run_command(
             v,
         )
 
-    command_with_env = [expand(v) for v in command]
-    return subprocess.run(command_with_env, capture_output=True, text=True, check=True)
+    return [expand(v) for v in command]
+
+
+def _run_command(command: Command) -> subprocess.CompletedProcess:
+    with phase(f"command.{command[0]}"):
+        return subprocess.run(command, capture_output=True, text=True, check=True)
@@ -0,0 +1,116 @@
+"""How long the cached tokens of repositories remain valid, without calling AWS."""
+
+from __future__ import annotations
+
+import time
+import urllib.parse
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from partifact.cache import TokenCache
+from partifact.config import Configuration
+from partifact.config_writers import (
+    pip_config_path,
+    poetry_auth_path,
+    read_pip_index_url,
+    read_poetry_credentials,
+)
+from partifact.shell_commands import pip_url
+
+
+@dataclass(frozen=True)
+class TokenStatus:
+    """The state of the cached token of a repository.
+
+    Attributes:
+        repository (str): The name of the poetry repository.
+        valid (bool): Whether the token is valid for at least the required time.
+        expiration (float, optional): When the token expires, as a UNIX
+            timestamp, or None if no token is cached.
+        remaining (float, optional): How many seconds the token is still
+            valid for, or None if no token is cached.
+        known (bool): False if poetry or pip hold a token other than the
+            cached one, whose validity is then unknown.
+    """
+
+    repository: str
+    valid: bool
+    expiration: Optional[float]
+    remaining: Optional[float]
+    known: bool = True
+
+    def describe(self, now: Optional[float] = None) -> str:
+        """Returns a human readable description of the state."""
+        if not self.known:
+            return "unknown, poetry or pip hold a token that isn't cached"
+        if self.expiration is None:
+            return "no token, log in first"
+        if not self.remaining:
+            expired = (time.time() if now is None else now) - self.expiration
+            return f"expired {format_duration(expired)} ago"
+        until = datetime.fromtimestamp(self.expiration, timezone.utc)
+        state = "valid" if self.valid else "expiring"
+        return (
+            f"{state} for {format_duration(self.remaining)}"
+            f" (until {until:%Y-%m-%d %H:%M} UTC)"
+        )
+
+
+def token_status(
+    configurations: Dict[str, Configuration],
+    cache: TokenCache,
+    min_validity: float = 0,
+    now: Optional[float] = None,
+) -> List[TokenStatus]:
+    """Returns the state of the cached token of every repository.
+
+    Only the cache and the configuration of poetry and pip are read, so this
+    makes no network calls. If poetry or pip hold a token other than the
+    cached one, e.g. one fetched with --no-cache, its validity is unknown.
+    Tokens held in a keyring, or in files partifact can't locate, can't be
+    compared and are assumed to be the cached ones.
+
+    Args:
+        configurations: The configurations keyed by the name of the repository.
+        cache: The token cache the tokens were stored in.
+        min_validity: How many seconds a token must remain valid to count as valid.
+        now: The current UNIX timestamp. Defaults to the current time.
+    """
+    now = time.time() if now is None else now
+    poetry_path = poetry_auth_path()
+    poetry_tokens = read_poetry_credentials(poetry_path) if poetry_path else {}
+    pip_path = pip_config_path()
+    pip_index_url = read_pip_index_url(pip_path) if pip_path else None
+
+    statuses = []
+    for repository, configuration in configurations.items():
+        cached = cache.peek(configuration)
+        held = {poetry_tokens.get(repository), _pip_token(configuration, pip_index_url)}
+        held.discard(None)
+        if held and held != {cached and cached.token}:
+            statuses.append(TokenStatus(repository, False, None, None, known=False))
+            continue
+        if cached is None:
+            statuses.append(TokenStatus(repository, False, None, None))
+            continue
+        remaining = max(cached.expiration - now, 0.0)
+        valid = remaining > min_validity
+        statuses.append(TokenStatus(repository, valid, cached.expiration, remaining))
+    return statuses
+
+
+def _pip_token(configuration: Configuration, url: Optional[str]) -> Optional[str]:
+    # pip holds the token only if its index is this repository
+    token = urllib.parse.urlsplit(url).password if url else None
+    if token is None or url != pip_url(configuration, token):
+        return None
+    return token
+
+
+def format_duration(seconds: float) -> str:
+    """Formats a duration in hours and minutes, e.g. "11h 58m"."""
+    minutes = int(seconds) // 60
+    if minutes < 60:
+        return f"{minutes}m"
+    return f"{minutes // 60}h {minutes % 60:02d}m"
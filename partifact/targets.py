@@ -0,0 +1,282 @@
+"""The tools login configures with CodeArtifact credentials.
+
+Each tool is a `Target` registered under its name. Built in are poetry, pip,
+uv, twine and pdm; other packages can add targets through the
+"partifact.targets" entry point group, pointing to a `Target` subclass.
+
+Targets write their configuration files directly where they can. Commands
+they still need to run, e.g. for tools without a known configuration file,
+are collected and run for all targets at once.
+"""
+
+from __future__ import annotations
+
+import configparser
+from abc import ABC, abstractmethod
+from typing import Dict, List, Mapping, Sequence, Tuple
+
+from partifact.config import Configuration
+from partifact.config_writers import (
+    pdm_config_path,
+    pypirc_path,
+    read_pdm_sources,
+    read_pypirc,
+    read_uv_indexes,
+    uv_config_path,
+    write_pdm_sources,
+    write_pypirc,
+    write_uv_indexes,
+)
+from partifact.shell_commands import (
+    Command,
+    ShellCommandException,
+    index_url,
+    pip_commands,
+    pip_pending,
+    pip_url,
+    poetry_commands,
+    poetry_pending,
+    run_concurrently,
+    upload_url,
+)
+from partifact.timing import phase
+
+TARGET_ENTRY_POINTS = "partifact.targets"
+DEFAULT_TARGETS = ("poetry",)
+
+# the configuration and token of each repository, keyed by poetry repository name
+Logins = Mapping[str, Tuple[Configuration, str]]
+
+
+class UnknownTarget(Exception):
+    """Raised if no target is registered under a name."""
+
+    pass
+
+
+class Target(ABC):
+    """A tool configured with the credentials of the repositories logged into.
+
+    Subclasses set `name` and implement `configure`, and should override
+    `pending` if they can tell which logins the tool already holds.
+    """
+
+    name = ""
+
+    def pending(self, logins: Logins) -> Logins:
+        """Returns the logins the tool doesn't hold yet, by default all of them."""
+        return dict(logins)
+
+    def describe(self, logins: Logins) -> List[str]:
+        """Describes the changes `configure` makes for the logins."""
+        return [f"{self.name}: update credentials of {r}" for r in logins]
+
+    @abstractmethod
+    def configure(self, logins: Logins) -> List[Command]:
+        """Configures the tool, writing its files directly where possible.
+
+        Returns:
+            The commands still to run, in order.
+        """
+
+
+class PoetryTarget(Target):
+    """Stores http-basic credentials for every repository in poetry."""
+
+    name = "poetry"
+
+    def pending(self, logins: Logins) -> Logins:
+        """Returns the logins whose token poetry doesn't hold yet."""
+        changed = poetry_pending({r: token for r, (_, token) in logins.items()})
+        return {r: logins[r] for r in changed}
+
+    def configure(self, logins: Logins) -> List[Command]:
+        """Writes auth.toml, or returns `poetry config` commands."""
+        return poetry_commands({r: token for r, (_, token) in logins.items()})
+
+
+class PipTarget(Target):
+    """Points pip's global index URL to the first repository."""
+
+    name = "pip"
+
+    def pending(self, logins: Logins) -> Logins:
+        """Returns the first login unless pip already uses it."""
+        first = next(iter(logins), None)
+        if first is None or not pip_pending(*logins[first]):
+            return {}
+        return {first: logins[first]}
+
+    def describe(self, logins: Logins) -> List[str]:
+        """Describes pointing pip to the first repository."""
+        return [f"pip: point global.index-url to {r}" for r in list(logins)[:1]]
+
+    def configure(self, logins: Logins) -> List[Command]:
+        """Writes pip's configuration file, or returns `pip config`."""
+        first = next(iter(logins), None)
+        return [] if first is None else pip_commands(pip_url(*logins[first]))
+
+
+class UvTarget(Target):
+    """Adds every repository as a named index to uv's user configuration."""
+
+    name = "uv"
+
+    def pending(self, logins: Logins) -> Logins:
+        """Returns the logins whose index URL uv doesn't have yet."""
+        path = uv_config_path()
+        current = read_uv_indexes(path) if path else {}
+        return {
+            r: login for r, login in logins.items() if current.get(r) != pip_url(*login)
+        }
+
+    def configure(self, logins: Logins) -> List[Command]:
+        """Writes uv.toml."""
+        from tomlkit.exceptions import TOMLKitError
+
+        path = uv_config_path()
+        if path is None:
+            raise ShellCommandException("failed to configure uv: no home directory")
+        try:
+            write_uv_indexes(path, {r: pip_url(*login) for r, login in logins.items()})
+        except (OSError, TOMLKitError) as err:
+            raise ShellCommandException(f"failed to configure uv: {err}")
+        return []
+
+
+class TwineTarget(Target):
+    """Adds every repository with its upload URL and token to .pypirc."""
+
+    name = "twine"
+
+    def pending(self, logins: Logins) -> Logins:
+        """Returns the logins .pypirc doesn't hold yet."""
+        path = pypirc_path()
+        current = read_pypirc(path) if path else {}
+        return {
+            r: (config, token)
+            for r, (config, token) in logins.items()
+            if current.get(r) != (upload_url(config), token)
+        }
+
+    def configure(self, logins: Logins) -> List[Command]:
+        """Writes .pypirc."""
+        path = pypirc_path()
+        if path is None:
+            raise ShellCommandException("failed to configure twine: no home directory")
+        repositories = {
+            r: (upload_url(config), token) for r, (config, token) in logins.items()
+        }
+        try:
+            write_pypirc(path, repositories)
+        except (OSError, configparser.Error) as err:
+            raise ShellCommandException(f"failed to configure twine: {err}")
+        return []
+
+
+class PdmTarget(Target):
+    """Adds every repository as a named source to pdm's global configuration.
+
+    The configuration file is written directly rather than through `pdm config`,
+    which would take the token as an argument, visible to other local users.
+    """
+
+    name = "pdm"
+
+    def pending(self, logins: Logins) -> Logins:
+        """Returns the logins pdm's configuration doesn't hold yet."""
+        path = pdm_config_path()
+        current = read_pdm_sources(path) if path else {}
+        return {
+            r: (config, token)
+            for r, (config, token) in logins.items()
+            if current.get(r) != (index_url(config), token)
+        }
+
+    def configure(self, logins: Logins) -> List[Command]:
+        """Writes pdm's config.toml."""
+        from tomlkit.exceptions import TOMLKitError
+
+        path = pdm_config_path()
+        if path is None:
+            raise ShellCommandException("failed to configure pdm: no home directory")
+        sources = {
+            r: (index_url(config), token) for r, (config, token) in logins.items()
+        }
+        try:
+            write_pdm_sources(path, sources)
+        except (OSError, TOMLKitError) as err:
+            raise ShellCommandException(f"failed to configure pdm: {err}")
+        return []
+
+
+_targets: Dict[str, Target] = {
+    t.name: t
+    for t in (PoetryTarget(), PipTarget(), UvTarget(), TwineTarget(), PdmTarget())
+}
+
+
+def register_target(target: Target) -> None:
+    """Registers a target under its name, replacing any registered before."""
+    _targets[target.name] = target
+
+
+def get_target(name: str) -> Target:
+    """Returns the target registered under a name.
+
+    Targets not registered yet are looked up among the "partifact.targets"
+    entry points.
+
+    Raises:
+        UnknownTarget: If there is no such target.
+    """
+    target = _targets.get(name)
+    if target is not None:
+        return target
+
+    from importlib.metadata import entry_points
+
+    for entry_point in entry_points(group=TARGET_ENTRY_POINTS):
+        if entry_point.name == name:
+            target = entry_point.load()()
+            register_target(target)
+            return target
+
+    choices = ", ".join(sorted(_targets))
+    raise UnknownTarget(f"unknown target {name}, use one of {choices}")
+
+
+def plan_targets(targets: Sequence[Target], logins: Logins) -> Dict[Target, Logins]:
+    """Returns the logins each target doesn't hold yet, leaving out up to date ones."""
+    plan = {}
+    for target in targets:
+        pending = target.pending(logins)
+        if pending:
+            plan[target] = pending
+    return plan
+
+
+def describe_plan(plan: Mapping[Target, Logins]) -> str:
+    """Returns a human readable description of the changes of a plan."""
+    changes = [
+        line for target, logins in plan.items() for line in target.describe(logins)
+    ]
+    return "\n".join(changes) or "nothing to change"
+
+
+def configure_targets(plan: Mapping[Target, Logins]) -> None:
+    """Configures every target of a plan in one pass.
+
+    Files are written first, one target after another, then the commands
+    left by all targets run concurrently, each target's in order.
+
+    Raises:
+        ShellCommandException: If a target fails to be configured.
+    """
+    commands: Dict[str, List[Command]] = {}
+    for target, logins in plan.items():
+        with phase(f"configure.{target.name}"):
+            target_commands = target.configure(logins)
+        if target_commands:
+            commands[target.name] = target_commands
+    run_concurrently(commands)
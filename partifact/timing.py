@@ -0,0 +1,126 @@
+"""Timing of the phases of a login, to find out where the time goes."""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from partifact import metrics
+
+
+@dataclass(frozen=True)
+class Phase:
+    """A timed phase.
+
+    Attributes:
+        name (str): The name of the phase, e.g. "aws.get_authorization_token".
+        start (float): When the phase started, in seconds since recording began.
+        duration (float): How long the phase took, in seconds.
+    """
+
+    name: str
+    start: float
+    duration: float
+
+
+class Timings:
+    """Collects the phases timed while it is active.
+
+    Phases may be recorded from several threads at once, e.g. when tokens
+    are fetched concurrently.
+    """
+
+    def __init__(self) -> None:
+        """Creates an empty set of timings."""
+        self.phases: List[Phase] = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, name: str, started: float, ended: float) -> None:
+        """Records a phase from its `time.perf_counter` start and end."""
+        phase = Phase(name, started - self._origin, ended - started)
+        with self._lock:
+            self.phases.append(phase)
+
+    def totals(self) -> Dict[str, float]:
+        """Returns the total time spent in each phase, in order of first occurrence."""
+        totals: Dict[str, float] = {}
+        for phase in self.phases:
+            totals[phase.name] = totals.get(phase.name, 0.0) + phase.duration
+        return totals
+
+    def summary(self) -> str:
+        """Returns a human readable summary of the phases."""
+        counts: Dict[str, int] = {}
+        for phase in self.phases:
+            counts[phase.name] = counts.get(phase.name, 0) + 1
+
+        width = max((len(name) for name in counts), default=0)
+        lines = []
+        for name, total in self.totals().items():
+            count = f" ({counts[name]}x)" if counts[name] > 1 else ""
+            lines.append(f"{name:<{width}}  {total * 1000:9.1f} ms{count}")
+        return "\n".join(lines)
+
+    def to_json(self) -> str:
+        """Returns the phases as JSON, e.g. to feed into CI metrics."""
+        return json.dumps(
+            {
+                "phases": [asdict(phase) for phase in self.phases],
+                "totals": self.totals(),
+            },
+            indent=2,
+        )
+
+    def write_json(self, path: Path) -> None:
+        """Writes the phases as JSON to a file."""
+        path.write_text(self.to_json())
+
+
+_active: Optional[Timings] = None
+
+
+@contextlib.contextmanager
+def recording() -> Iterator[Timings]:
+    """Activates timing, collecting every phase until the block exits."""
+    global _active
+    previous, _active = _active, Timings()
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+
+@contextlib.contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Times the enclosed block as a phase if timing or metrics are active.
+
+    The phase is also reported to the active metrics emitter, see
+    `partifact.metrics`. When neither is active, this costs no more than
+    entering a context manager.
+    """
+    timings = _active
+    emitter = metrics.active_emitter()
+    if timings is None and emitter is None:
+        yield
+        return
+
+    wall_clock = time.time()
+    started = time.perf_counter()
+    error: Optional[BaseException] = None
+    try:
+        yield
+    except BaseException as err:
+        error = err
+        raise
+    finally:
+        ended = time.perf_counter()
+        if timings is not None:
+            timings.add(name, started, ended)
+        if emitter is not None:
+            emitter.phase(name, wall_clock, ended - started, error)
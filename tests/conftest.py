@@ -1,13 +1,73 @@
+import base64
+import email.parser
+import email.policy
+import hashlib
+import threading
+import time
 from dataclasses import asdict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import pytest
 import tomlkit
+from botocore.exceptions import ClientError
 
-from partifact.config import CONFIG_PATH, Configuration
+from partifact.config import (
+    CONFIG_PATH,
+    Configuration,
+    clear_registry_cache,
+    clear_sources_cache,
+)
+from partifact.credentials import clear_client_pool
 
 URL_TEMPLATE = "https://{code_artifact_domain}-{aws_account}.d.codeartifact.{aws_region}.amazonaws.com/pypi/{code_artifact_repository}"
 
 
+@pytest.fixture(autouse=True)
+def _fresh_sources():
+    """Makes sure every test parses its own config file and registry."""
+    clear_sources_cache()
+    clear_registry_cache()
+
+
+@pytest.fixture(autouse=True)
+def _fresh_clients():
+    """Makes sure every test creates its own AWS sessions and clients."""
+    clear_client_pool()
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keeps the token cache of every test in an isolated directory."""
+    directory = tmp_path / "cache"
+    monkeypatch.setenv("PARTIFACT_CACHE_DIR", str(directory))
+    return directory
+
+
+@pytest.fixture(autouse=True)
+def config_home(tmp_path, monkeypatch):
+    """Points the user configuration of the tools to an isolated directory."""
+    directory = tmp_path / "config"
+    monkeypatch.setenv("HOME", str(directory))
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(directory))
+    monkeypatch.setenv("APPDATA", str(directory))
+    monkeypatch.setenv("POETRY_CONFIG_DIR", str(directory / "pypoetry"))
+    monkeypatch.setenv("POETRY_KEYRING_ENABLED", "false")
+    monkeypatch.delenv("PYTHON_KEYRING_BACKEND", raising=False)
+    monkeypatch.delenv("PIP_CONFIG_FILE", raising=False)
+    monkeypatch.delenv("UV_CONFIG_FILE", raising=False)
+    monkeypatch.delenv("PDM_CONFIG_FILE", raising=False)
+    monkeypatch.delenv("PARTIFACT_CONFIG_WRITER", raising=False)
+    monkeypatch.delenv("PARTIFACT_METRICS", raising=False)
+    return directory
+
+
+@pytest.fixture
+def _subprocess_writers(monkeypatch):
+    """Configures poetry and pip through their CLIs rather than writing files."""
+    monkeypatch.setenv("PARTIFACT_CONFIG_WRITER", "subprocess")
+
+
 @pytest.fixture
 def write_conf(fs):
     """Fixture to write a configuration entry."""
@@ -23,6 +83,20 @@ def write_conf(fs):
     return _write
 
 
+@pytest.fixture
+def write_sources(fs):
+    """Fixture to write several source entries, given as a mapping of name to URL."""
+
+    def _write(sources: dict):
+        entries = [{"name": name, "url": url} for name, url in sources.items()]
+        config = {"tool": {"poetry": {"source": entries}}}
+
+        with open(CONFIG_PATH, "w") as f:
+            f.write(tomlkit.dumps(config))
+
+    return _write
+
+
 @pytest.fixture
 def add_conf(write_conf):
     """Fixture to add a test configuration entry."""
@@ -42,7 +116,7 @@ class MockSession:
         self._aws = aws
         self.kwargs = kwargs
 
-    def client(self, service: str):
+    def client(self, service: str, **kwargs):
         """Returns a client for an expected service or raises an exception otherwise."""
         if service == "sts":
             return MockSTSClient(self._aws)
@@ -58,6 +132,14 @@ class DummyAWS:
         self._sessions = []
         self._repositories = {}
         self.assumed_role = None
+        self.role_duration = None
+        self.role_requests = 0
+        self.token_requests = 0
+        self.token_lifetime = timedelta(hours=12)
+        self.token_duration = None
+        self.token_delay = 0.0
+        self.throttled_requests = 0
+        self._lock = threading.Lock()
 
     @property
     def sessions(self):
@@ -80,15 +162,29 @@ class DummyAWS:
         self._sessions.append(s)
         return s
 
-    def register_role(self, role):
+    def register_role(self, role, duration=None):
         """Keeps track of assumed roles."""
         self.assumed_role = role
+        self.role_duration = duration
+        self.role_requests += 1
 
-    def _get_authorization_token(self, domain, domain_owner):
+    def _get_authorization_token(self, domain, domain_owner, duration=None):
         token = self._repositories.get((domain_owner, domain))
         assert token is not None
 
-        return {"authorizationToken": token}
+        with self._lock:
+            self.token_requests += 1
+            self.token_duration = duration
+            throttled = self.throttled_requests > 0
+            self.throttled_requests -= 1
+        if throttled:
+            error = {"Error": {"Code": "ThrottlingException", "Message": "slow down"}}
+            raise ClientError(error, "GetAuthorizationToken")
+
+        time.sleep(self.token_delay)
+        lifetime = timedelta(seconds=duration) if duration else self.token_lifetime
+        expiration = datetime.now(timezone.utc) + lifetime
+        return {"authorizationToken": token, "expiration": expiration}
 
 
 class MockSTSClient:
@@ -100,14 +196,17 @@ class MockSTSClient:
         self,
         RoleArn=None,  # noqa: N803
         RoleSessionName=None,  # noqa: N803
+        DurationSeconds=3600,  # noqa: N803
     ):
         """Mimicking boto3.client('sts')."""
-        self.aws.register_role(RoleArn)
+        self.aws.register_role(RoleArn, DurationSeconds)
+        expiration = datetime.now(timezone.utc) + timedelta(seconds=DurationSeconds)
         return {
             "Credentials": {
                 "AccessKeyId": "test_access_key",
                 "SecretAccessKey": "test_secret_key",
                 "SessionToken": "test_token",
+                "Expiration": expiration,
             }
         }
 
@@ -121,9 +220,10 @@ class MockCodeArtifactClient:
         self,
         domain=None,
         domainOwner=None,  # noqa: N803
+        durationSeconds=None,  # noqa: N803
     ):
         """Mimicking boto3.client('codeartifact')."""
-        return self.aws._get_authorization_token(domain, domainOwner)
+        return self.aws._get_authorization_token(domain, domainOwner, durationSeconds)
 
 
 @pytest.fixture
@@ -140,3 +240,147 @@ def subprocess_mock(mocker):
     """Patches subprocess.run so that it does not execute anything."""
     mock = mocker.patch("subprocess.run")
     return mock
+
+
+class FakeIndex(ThreadingHTTPServer):
+    """A stand-in for the simple index of a CodeArtifact repository.
+
+    It requires the token "test-token", and records the path of every request.
+    Distributions are served below their project page as CodeArtifact does, at
+    /pypi/repo/simple/<project>/<version>/<file>, optionally via a redirect.
+    Uploads to /pypi/repo/ are recorded in `uploads`, keyed by file name, and
+    the next `failures` uploads are answered with 503. The next `lost_responses`
+    uploads are recorded but answered with 502, as if the response got lost.
+    Responses to the project pages and uploads of the files named in
+    `truncated` are cut short by closing the connection, uploads only once.
+    """
+
+    daemon_threads = True
+    token = "test-token"
+
+    def __init__(self) -> None:
+        """Creates the index on a free port."""
+        super().__init__(("127.0.0.1", 0), _FakeIndexHandler)
+        self.requests = []
+        self.projects = {}
+        self.files = {}
+        self.etag = '"v1"'
+        self.redirect = False
+        self.uploads = {}
+        self.failures = 0
+        self.lost_responses = 0
+        self.truncated = set()
+
+    @property
+    def url(self) -> str:
+        """The URL of the simple index."""
+        return f"http://127.0.0.1:{self.server_address[1]}/pypi/repo/simple/"
+
+    @property
+    def upload_url(self) -> str:
+        """The URL distributions are uploaded to."""
+        return f"http://127.0.0.1:{self.server_address[1]}/pypi/repo/"
+
+    def add_file(self, project, filename, content, digest=None, version="1.0"):
+        """Adds a distribution, listed with its actual digest unless given another."""
+        digest = digest or hashlib.sha256(content).hexdigest()
+        self.projects.setdefault(project, {})[filename] = (version, digest)
+        self.files[filename] = content
+        return digest
+
+
+class _FakeIndexHandler(BaseHTTPRequestHandler):
+    server: FakeIndex
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # noqa: N802
+        self.server.requests.append(self.path)
+        expected = base64.b64encode(f"aws:{self.server.token}".encode()).decode()
+        parts = self.path[len("/pypi/repo/simple/") :].strip("/").split("/")
+        project = parts[0]
+        filename = self.path.rsplit("/", 1)[-1]
+        is_index = self.path.startswith("/pypi/repo/simple/")
+
+        if self.path.startswith("/storage/") and filename in self.server.files:
+            self._respond(200, self.server.files[filename])
+        elif self.headers["Authorization"] != f"Basic {expected}":
+            self._respond(401, b"unauthorized")
+        elif is_index and len(parts) == 1 and project in self.server.projects:
+            if self.headers["If-None-Match"] == self.server.etag:
+                self._respond(304, b"")
+                return
+            links = "".join(
+                f'<a href="{version}/{name}#sha256={digest}">{name}</a>'
+                for name, (version, digest) in self.server.projects[project].items()
+            )
+            headers = {"ETag": self.server.etag}
+            if project in self.server.truncated:
+                self.close_connection = True
+                headers["Content-Length"] = str(len(links) + 1)
+            self._respond(200, links.encode(), headers)
+        elif is_index and len(parts) == 3 and filename in self.server.files:
+            if self.server.redirect:
+                self._respond(302, b"", {"Location": f"/storage/{filename}"})
+            else:
+                self._respond(200, self.server.files[filename])
+        else:
+            self._respond(404, b"not found")
+
+    def do_POST(self):  # noqa: N802
+        self.server.requests.append(self.path)
+        expected = base64.b64encode(f"aws:{self.server.token}".encode()).decode()
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+
+        if self.headers["Authorization"] != f"Basic {expected}":
+            self._respond(401, b"unauthorized")
+            return
+        if self.server.failures:
+            self.server.failures -= 1
+            self._respond(503, b"unavailable")
+            return
+
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+        )
+        fields, filename = {}, None
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            fields.setdefault(name, []).append(part.get_payload(decode=True))
+            filename = part.get_filename() or filename
+
+        if filename in self.server.truncated:
+            self.server.truncated.discard(filename)
+            self.close_connection = True
+            self._respond(200, b"ok", {"Content-Length": "3"})
+        elif filename in self.server.uploads:
+            self._respond(409, b"conflict")
+        elif self.server.lost_responses:
+            self.server.lost_responses -= 1
+            self.server.uploads[filename] = fields
+            self._respond(502, b"bad gateway")
+        else:
+            self.server.uploads[filename] = fields
+            self._respond(200, b"ok")
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, status, body, headers=None):
+        self.send_response(status)
+        headers = {"Content-Length": str(len(body)), **(headers or {})}
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def fake_index():
+    """Runs a stand-in simple index in a background thread."""
+    index = FakeIndex()
+    thread = threading.Thread(target=index.serve_forever)
+    thread.start()
+    yield index
+    index.shutdown()
+    thread.join()
+    index.server_close()
@@ -0,0 +1,127 @@
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+from typer.testing import CliRunner
+
+from partifact.agent import Agent, AgentError, AgentUnavailable, request_token
+from partifact.cache import TokenCache
+from partifact.config import Configuration
+from partifact.main import app
+
+runner = CliRunner()
+
+
+def _conf(domain: str, repository: str) -> Configuration:
+    return Configuration(
+        aws_account="1234",
+        aws_region="eu-west-1",
+        code_artifact_repository=repository,
+        code_artifact_domain=domain,
+    )
+
+
+@pytest.fixture
+def configs(aws):
+    """Configurations of three repositories spread over two domains."""
+    aws.add_repository("domain-a", "1234", "token-a")
+    aws.add_repository("domain-b", "1234", "token-b")
+    return {
+        "repo-a": _conf("domain-a", "repo-a"),
+        "repo-a2": _conf("domain-a", "repo-a2"),
+        "repo-b": _conf("domain-b", "repo-b"),
+    }
+
+
+@pytest.fixture
+def running_agent(configs, cache_dir, tmp_path):
+    """Runs an agent on a socket in a background thread."""
+    socket_path = tmp_path / "agent.sock"
+    agent = Agent(configs, TokenCache(cache_dir))
+    thread = threading.Thread(target=agent.serve_forever, args=(socket_path,))
+    thread.start()
+
+    deadline = time.monotonic() + 5
+    while not socket_path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    yield agent, socket_path
+
+    agent.shutdown()
+    thread.join()
+
+
+def test_agent_serves_tokens_over_socket(aws, running_agent):
+    """Tests that the agent serves tokens fetched up front without calling AWS again."""
+    _, socket_path = running_agent
+
+    for _ in range(5):
+        assert request_token("repo-a", socket_path).token == "token-a"
+        assert request_token("repo-a2", socket_path).token == "token-a"
+        assert request_token("repo-b", socket_path).token == "token-b"
+
+    assert aws.token_requests == 2
+
+
+def test_agent_rejects_unknown_repository(running_agent):
+    """Tests that an error is returned for repositories the agent doesn't hold."""
+    _, socket_path = running_agent
+
+    with pytest.raises(AgentError, match="unknown repository"):
+        request_token("unknown", socket_path)
+
+
+def test_request_without_agent(tmp_path):
+    """Tests that a missing agent is reported as unavailable."""
+    with pytest.raises(AgentUnavailable):
+        request_token("repo-a", tmp_path / "missing.sock")
+
+
+def test_agent_refreshes_tokens_ahead_of_expiry(aws, configs, cache_dir):
+    """Tests that tokens are refreshed once they get within the refresh margin."""
+    aws.token_lifetime = timedelta(seconds=120)
+    agent = Agent(configs, TokenCache(cache_dir, refresh_margin=60))
+
+    delay = agent.refresh()
+    assert aws.token_requests == 2
+    assert 1 <= delay <= 60
+
+    agent.cache.refresh_margin = 300
+    agent.refresh()
+    assert aws.token_requests == 4
+
+
+def test_token_command_uses_agent(aws, running_agent):
+    """Tests that `partifact token` prints the token served by the agent."""
+    _, socket_path = running_agent
+
+    result = runner.invoke(app, ["token", "repo-b", "--socket", str(socket_path)])
+
+    assert result.exit_code == 0
+    assert result.output.strip() == "token-b"
+    assert aws.token_requests == 2
+
+
+def test_token_command_skips_agent_with_overrides(running_agent, mocker):
+    """Tests that tokens for other credentials than the agent's are not served by it."""
+    _, socket_path = running_agent
+    mocker.patch("partifact.main.Configuration.load")
+    mocker.patch("partifact.auth_token.get_token", return_value="role-token")
+
+    args = ["token", "repo-b", "--role", "deploy", "--socket", str(socket_path)]
+    result = runner.invoke(app, args)
+
+    assert result.exit_code == 0, result.output
+    assert result.output.strip() == "role-token"
+
+
+def test_second_agent_refuses_to_start(running_agent, configs, cache_dir):
+    """Tests that an agent doesn't take over the socket of a running one."""
+    agent, socket_path = running_agent
+
+    with pytest.raises(AgentError, match="already listening"):
+        Agent(configs, TokenCache(cache_dir)).serve_forever(socket_path)
+
+    assert request_token("repo-a", socket_path).token == "token-a"
+    assert socket_path.stat().st_mode & 0o077 == 0
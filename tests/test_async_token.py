@@ -0,0 +1,128 @@
+import asyncio
+import contextlib
+import time
+
+import pytest
+
+from partifact import async_token
+from partifact.auth_token import get_token
+from partifact.cache import RoleCredentials, TokenCache
+from partifact.config import Configuration
+from partifact.retry import RetryPolicy
+
+
+class FakeAsyncAWS:
+    """An async stand-in for AWS, recording how many calls overlap."""
+
+    def __init__(self, delay=0.01):
+        """Creates a stand-in answering every call after a delay."""
+        self.delay = delay
+        self.roles = []
+        self.tokens = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def assume_role(self, configuration, role_arn):
+        """Records the role and returns credentials valid for an hour."""
+        async with self._call():
+            self.roles.append(role_arn)
+            return RoleCredentials("key", "secret", "session", time.time() + 3600)
+
+    async def get_authorization_token(self, configuration, credentials):
+        """Returns a token named after the domain and credentials."""
+        async with self._call():
+            self.tokens.append(configuration.code_artifact_domain)
+            suffix = f"-{credentials.access_key_id}" if credentials else ""
+            return f"{configuration.code_artifact_domain}{suffix}", time.time() + 3600
+
+    @contextlib.asynccontextmanager
+    async def _call(self):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            yield
+        finally:
+            self.in_flight -= 1
+
+
+def _conf(domain, role=None):
+    return Configuration("1234", "eu-west-1", domain, "repo", aws_role_name=role)
+
+
+def test_async_tokens_are_fetched_concurrently_and_bounded():
+    """Tests that distinct tokens are fetched at once, up to the limit."""
+    aws = FakeAsyncAWS()
+    configs = [_conf(f"domain-{i}") for i in range(6)] + [_conf("domain-0")]
+
+    tokens = asyncio.run(async_token.get_tokens(configs, max_concurrency=3, aws=aws))
+
+    assert tokens == [f"domain-{i}" for i in range(6)] + ["domain-0"]
+    assert len(aws.tokens) == 6
+    assert aws.max_in_flight == 3
+
+
+def test_async_token_via_assumed_role():
+    """Tests that the role is assumed before the token is fetched with its credentials."""
+    aws = FakeAsyncAWS()
+
+    token = asyncio.run(async_token.get_token(_conf("domain", "role"), aws=aws))
+
+    assert token == "domain-key"
+    assert aws.roles == ["arn:aws:iam::1234:role/role"]
+
+
+def test_async_tokens_share_the_cache_with_the_sync_path(aws, cache_dir):
+    """Tests that tokens and role credentials cached by either path are reused."""
+    cache = TokenCache()
+    fake = FakeAsyncAWS()
+    configs = [_conf("domain-a", "role"), _conf("domain-b", "role")]
+
+    asyncio.run(async_token.get_tokens(configs, cache, aws=fake))
+    assert get_token(configs[0], cache) == "domain-a-key"
+    assert aws.token_requests == 0
+    roles = len(fake.roles)
+    asyncio.run(async_token.get_token(_conf("domain-d", "role"), cache, aws=fake))
+    assert len(fake.roles) == roles
+
+    aws.add_repository("domain-c", "1234", "sync-token")
+    get_token(_conf("domain-c"), cache)
+    tokens = asyncio.run(async_token.get_tokens([_conf("domain-c")], cache, aws=fake))
+
+    assert tokens == ["sync-token"]
+    assert "domain-c" not in fake.tokens
+
+
+def test_async_token_with_boto3(aws):
+    """Tests that the default client runs the boto3 calls off the event loop."""
+    aws.add_repository("domain", "1234", "test-token")
+
+    token = asyncio.run(async_token.get_token(_conf("domain", "role")))
+
+    assert token == "test-token"
+    assert aws.assumed_role == "arn:aws:iam::1234:role/role"
+
+
+def test_cancelled_fetch_gives_the_lock_back(cache_dir):
+    """Tests that a fetch cancelled while waiting for the lock doesn't keep it."""
+    cache = TokenCache(lock_timeout=5)
+    conf = _conf("domain")
+    held = cache.lock(conf)
+    held.acquire()
+
+    async def cancel_while_waiting():
+        task = asyncio.create_task(
+            async_token.get_token(
+                conf, cache, RetryPolicy(deadline=0.0), FakeAsyncAWS()
+            )
+        )
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        held.release()
+        await asyncio.sleep(0.5)
+
+    asyncio.run(cancel_while_waiting())
+
+    assert cache.lock(conf).acquire()
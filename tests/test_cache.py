@@ -0,0 +1,170 @@
+import json
+import os
+import time
+
+import pytest
+
+from partifact.auth_token import get_token
+from partifact.cache import RoleCredentials, TokenCache
+from partifact.config import Configuration
+
+
+@pytest.fixture
+def conf():
+    """A configuration for which the dummy AWS issues tokens."""
+    return Configuration(
+        aws_account="1234",
+        aws_region="eu-west-1",
+        code_artifact_repository="test-repo",
+        code_artifact_domain="test-domain",
+    )
+
+
+def test_cached_token_is_reused(aws, conf, cache_dir):
+    """Tests that a still valid token is returned without calling AWS."""
+    aws.add_repository(conf.code_artifact_domain, conf.aws_account, "test-token")
+    cache = TokenCache(cache_dir)
+
+    assert get_token(conf, cache) == "test-token"
+    assert get_token(conf, cache) == "test-token"
+
+    assert aws.token_requests == 1
+    assert len(aws.sessions) == 1
+
+
+def test_cache_keys_include_credentials(aws, conf, cache_dir):
+    """Tests that tokens fetched with different roles are cached separately."""
+    aws.add_repository(conf.code_artifact_domain, conf.aws_account, "test-token")
+    cache = TokenCache(cache_dir)
+    role_conf = Configuration(**{**conf.__dict__, "aws_role_name": "test-role"})
+
+    get_token(conf, cache)
+    get_token(role_conf, cache)
+
+    assert aws.token_requests == 2
+
+
+def test_cache_keys_include_credential_source(conf, cache_dir):
+    """Tests that tokens and role credentials from different sources are kept apart."""
+    cache = TokenCache(cache_dir)
+    env_conf = Configuration(**{**conf.__dict__, "aws_credential_source": "env"})
+    sso_conf = Configuration(**{**conf.__dict__, "aws_credential_source": "sso"})
+    role_arn = "arn:aws:iam::1234:role/test-role"
+    credentials = RoleCredentials("key", "secret", "session", time.time() + 3600)
+
+    cache.put(env_conf, "env-token", time.time() + 3600)
+    cache.put_role_credentials(role_arn, None, credentials, "env")
+
+    assert cache.get(env_conf).token == "env-token"
+    assert cache.get(sso_conf) is None
+    assert cache.get(conf) is None
+    assert cache.get_role_credentials(role_arn, None, "env") == credentials
+    assert cache.get_role_credentials(role_arn, None, "sso") is None
+
+
+def test_token_within_refresh_margin_is_refetched(aws, conf, cache_dir):
+    """Tests that a token expiring within the refresh margin is treated as stale."""
+    aws.add_repository(conf.code_artifact_domain, conf.aws_account, "test-token")
+    cache = TokenCache(cache_dir, refresh_margin=600)
+    cache.put(conf, "old-token", time.time() + 300)
+
+    assert get_token(conf, cache) == "test-token"
+    assert aws.token_requests == 1
+    assert cache.get(conf).token == "test-token"
+
+
+def test_expired_entries_are_evicted(conf, cache_dir):
+    """Tests that expired tokens are removed when a new token is stored."""
+    cache = TokenCache(cache_dir)
+    other = Configuration(**{**conf.__dict__, "code_artifact_domain": "other"})
+    cache.put(other, "expired-token", time.time() - 1)
+
+    cache.put(conf, "test-token", time.time() + 3600)
+
+    assert not cache.path(other).exists()
+    assert cache.path(conf).exists()
+
+
+def test_cache_files_are_private(conf, cache_dir):
+    """Tests that cached tokens are only readable by the owner."""
+    cache = TokenCache(cache_dir)
+    cache.put(conf, "test-token", time.time() + 3600)
+
+    assert os.stat(cache.path(conf)).st_mode & 0o777 == 0o600
+
+
+def test_corrupt_cache_entry_is_ignored(aws, conf, cache_dir):
+    """Tests that an unreadable cache entry results in a new token."""
+    aws.add_repository(conf.code_artifact_domain, conf.aws_account, "test-token")
+    cache = TokenCache(cache_dir)
+    cache_dir.mkdir()
+    cache.path(conf).write_text("not json")
+
+    assert get_token(conf, cache) == "test-token"
+    assert json.loads(cache.path(conf).read_text())["token"] == "test-token"
+
+
+def test_role_credentials_are_reused(aws, conf, cache_dir):
+    """Tests that a fresh token for a role doesn't assume the role again."""
+    role_conf = Configuration(**{**conf.__dict__, "aws_role_name": "test-role"})
+    other_conf = Configuration(
+        **{**role_conf.__dict__, "code_artifact_domain": "other-domain"}
+    )
+    aws.add_repository(role_conf.code_artifact_domain, conf.aws_account, "token")
+    aws.add_repository(other_conf.code_artifact_domain, conf.aws_account, "other")
+    cache = TokenCache(cache_dir)
+
+    assert get_token(role_conf, cache) == "token"
+    assert get_token(other_conf, cache) == "other"
+
+    assert aws.role_requests == 1
+    assert aws.token_requests == 2
+    # only the initial session assumes the role, and a single session with its
+    # credentials is shared by both token fetches
+    assert [s.kwargs.get("aws_access_key_id") for s in aws.sessions] == [
+        None,
+        "test_access_key",
+    ]
+
+
+def test_role_credentials_are_private(aws, conf, cache_dir):
+    """Tests that cached role credentials are only readable by the owner."""
+    role_conf = Configuration(**{**conf.__dict__, "aws_role_name": "test-role"})
+    aws.add_repository(role_conf.code_artifact_domain, conf.aws_account, "token")
+    cache = TokenCache(cache_dir)
+
+    get_token(role_conf, cache)
+
+    path = cache.role_path("arn:aws:iam::1234:role/test-role", None)
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert os.stat(cache_dir).st_mode & 0o777 == 0o700
+
+
+def test_role_credentials_are_refreshed_before_expiry(aws, conf, cache_dir):
+    """Tests that role credentials about to expire are not reused."""
+    role_conf = Configuration(
+        **{**conf.__dict__, "aws_role_name": "test-role", "aws_role_duration": 30}
+    )
+    aws.add_repository(role_conf.code_artifact_domain, conf.aws_account, "token")
+
+    get_token(role_conf, TokenCache(cache_dir))
+    get_token(role_conf, TokenCache(cache_dir, refresh_margin=13 * 3600))
+
+    assert aws.role_requests == 2
+    assert aws.role_duration == 30
+
+
+def test_cached_token_must_last_the_requested_duration(aws, conf, cache_dir):
+    """Tests that a cached token not lasting the requested duration is refetched."""
+    aws.add_repository(conf.code_artifact_domain, conf.aws_account, "test-token")
+    cache = TokenCache(cache_dir)
+    cache.put(conf, "short-token", time.time() + 3600)
+    long_conf = Configuration(**{**conf.__dict__, "code_artifact_token_duration": 7200})
+
+    assert get_token(conf, cache) == "short-token"
+    token = get_token(long_conf, cache)
+    assert token == "test-token"
+    assert get_token(long_conf, cache) == "test-token"
+
+    assert aws.token_requests == 1
+    assert token.expiration == cache.get(long_conf).expiration
@@ -1,13 +1,25 @@
+import os
+
 import pytest
 import tomlkit
+from typer.testing import CliRunner
 
+from partifact import config
 from partifact.config import (
     CONFIG_PATH,
+    REGISTRY_FILE_NAME,
     Configuration,
+    ConfigurationWarning,
     InvalidConfiguration,
     MissingConfiguration,
+    default_config_dir,
+    load_registry,
     parse_url,
+    save_registry,
 )
+from partifact.main import app
+
+runner = CliRunner()
 
 
 def test_config_with_mandatory_fields(write_conf):
@@ -117,3 +129,226 @@ def test_parse_url_edgecase(url):
         "aws_region": "eu-west-1",
     }
     assert actual == expected
+
+
+def test_load_all_skips_other_sources(write_sources):
+    """Tests that every CodeArtifact source is loaded, ignoring other indexes."""
+    write_sources(
+        {
+            "repo-a": "https://domain-123456789.d.codeartifact.eu-west-1.amazonaws.com/pypi/repo-a/simple/",
+            "mirror": "https://pypi.example.com/simple/",
+            "repo-b": "https://domain-123456789.d.codeartifact.eu-west-1.amazonaws.com/pypi/repo-b/simple/",
+        }
+    )
+
+    configs = Configuration.load_all(profile="dummy_profile")
+
+    assert list(configs) == ["repo-a", "repo-b"]
+    assert configs["repo-b"].code_artifact_repository == "repo-b"
+    assert configs["repo-b"].aws_profile == "dummy_profile"
+
+
+def test_sources_are_parsed_once(write_sources, mocker):
+    """Tests that loading several repositories only parses the file once."""
+    write_sources(
+        {
+            "repo-a": "https://domain-123456789.d.codeartifact.eu-west-1.amazonaws.com/pypi/repo-a/",
+            "repo-b": "https://domain-123456789.d.codeartifact.eu-west-1.amazonaws.com/pypi/repo-b/",
+        }
+    )
+    parse = mocker.spy(config, "_parse_sources")
+
+    Configuration.load("repo-a")
+    Configuration.load("repo-b")
+
+    assert parse.call_count == 1
+
+
+def test_sources_are_parsed_again_when_changed(write_sources, mocker):
+    """Tests that memoised sources are refreshed when the config file changes."""
+    url = "https://domain-123456789.d.codeartifact.eu-west-1.amazonaws.com/pypi/{}/"
+    write_sources({"repo-a": url.format("repo-a")})
+    Configuration.load("repo-a")
+
+    write_sources({"repo-a": url.format("repo-a"), "repo-b": url.format("repo-b")})
+
+    assert Configuration.load("repo-b").code_artifact_repository == "repo-b"
+
+
+def test_config_is_found_in_parent_directory(write_conf):
+    """Tests that the nearest pyproject.toml in a parent directory is used."""
+    write_conf(
+        "test_repo",
+        aws_account="123456789",
+        aws_region="eu-west-1",
+        code_artifact_domain="test_domain",
+        code_artifact_repository="test_ca_repo",
+    )
+    os.makedirs("src/package")
+    os.chdir("src/package")
+
+    conf = Configuration.load("test_repo")
+
+    assert conf.code_artifact_repository == "test_ca_repo"
+
+
+def test_invalid_config_file(fs):
+    """Tests that an appropriate exception is raised for malformed TOML."""
+    with open(CONFIG_PATH, "w") as f:
+        f.write("[tool.poetry\n")
+
+    with pytest.raises(MissingConfiguration, match="invalid pyproject.toml"):
+        Configuration.load("test_repo")
+
+
+def _write_project(path: str, sources: dict):
+    os.makedirs(path, exist_ok=True)
+    entries = [{"name": name, "url": url} for name, url in sources.items()]
+    with open(os.path.join(path, "pyproject.toml"), "w") as f:
+        f.write(tomlkit.dumps({"tool": {"poetry": {"source": entries}}}))
+
+
+SCAN_URL = "https://{}-123456789.d.codeartifact.eu-west-1.amazonaws.com/pypi/{}/simple/"
+
+
+@pytest.mark.usefixtures("fs")
+def test_scan_finds_sources_across_projects():
+    """Tests that sources of every project in a tree are loaded once per name."""
+    _write_project("mono", {"shared": SCAN_URL.format("domain", "shared")})
+    _write_project(
+        "mono/packages/a",
+        {
+            "shared": SCAN_URL.format("domain", "shared"),
+            "pypi-mirror": "https://pypi.example.com/simple/",
+        },
+    )
+    _write_project("mono/packages/b", {"private": SCAN_URL.format("other", "private")})
+    _write_project("mono/.venv/lib", {"ignored": SCAN_URL.format("domain", "ignored")})
+
+    configs = Configuration.scan("mono", role_name="test_role")
+
+    assert set(configs) == {"shared", "private"}
+    assert configs["private"].code_artifact_domain == "other"
+    assert configs["shared"].aws_role_name == "test_role"
+
+
+@pytest.mark.usefixtures("fs")
+def test_scan_rejects_conflicting_repository_names():
+    """Tests that a repository name used for different domains is reported."""
+    _write_project("mono/a", {"repo": SCAN_URL.format("domain", "repo")})
+    _write_project("mono/b", {"repo": SCAN_URL.format("other", "repo")})
+
+    with pytest.raises(InvalidConfiguration, match="different CodeArtifact domains"):
+        Configuration.scan("mono")
+
+
+def test_load_from_registry(write_conf):
+    """Tests that configured repositories are loaded without a pyproject.toml."""
+    registered = Configuration(
+        "123456789", "eu-west-1", "domain", "repo", aws_role_name="stored_role"
+    )
+    save_registry({"registered": registered})
+    write_conf(
+        "registered",
+        aws_account="123456789",
+        aws_region="eu-west-1",
+        code_artifact_domain="domain",
+        code_artifact_repository="repo",
+    )
+
+    assert Configuration.load("registered") == registered
+    conf = Configuration.load("registered", profile="profile", role_name="role")
+    assert conf.aws_profile == "profile"
+    assert conf.aws_role_name == "role"
+
+    os.remove(CONFIG_PATH)
+    assert Configuration.load("registered") == registered
+    with pytest.raises(MissingConfiguration):
+        Configuration.load("unknown")
+
+
+def test_project_overrides_registry(write_conf):
+    """Tests that a repository defined differently in the project is taken from it."""
+    registered = Configuration(
+        "123456789", "eu-west-1", "domain", "repo", aws_role_name="stored_role"
+    )
+    save_registry({"registered": registered})
+    write_conf(
+        "registered",
+        aws_account="987654321",
+        aws_region="us-east-1",
+        code_artifact_domain="other",
+        code_artifact_repository="other",
+    )
+
+    with pytest.warns(ConfigurationWarning, match="ignoring the registry"):
+        conf = Configuration.load("registered")
+
+    assert conf == Configuration("987654321", "us-east-1", "other", "other")
+
+
+@pytest.mark.usefixtures("fs")
+def test_invalid_registry():
+    """Tests that a corrupt registry is reported."""
+    save_registry({})
+    path = default_config_dir() / REGISTRY_FILE_NAME
+    path.write_text('{"repositories": {"repo": {"unknown": 1}}}')
+
+    with pytest.raises(InvalidConfiguration, match="invalid repository registry"):
+        load_registry()
+
+
+def test_invalid_registry_is_ignored_on_load(write_conf):
+    """Tests that repositories in the project can be loaded despite a corrupt registry."""
+    write_conf(
+        "test_repo",
+        aws_account="123456789",
+        aws_region="eu-west-1",
+        code_artifact_domain="test_domain",
+        code_artifact_repository="test_ca_repo",
+    )
+    path = default_config_dir() / REGISTRY_FILE_NAME
+    path.parent.mkdir(parents=True)
+    path.write_text("not json")
+
+    with pytest.warns(ConfigurationWarning, match="invalid repository registry"):
+        conf = Configuration.load("test_repo")
+
+    assert conf.code_artifact_domain == "test_domain"
+
+
+def test_configure_command(write_conf):
+    """Tests that repositories are configured from their poetry source or a URL."""
+    write_conf(
+        "test_repo",
+        aws_account="123456789",
+        aws_region="eu-west-1",
+        code_artifact_domain="test_domain",
+        code_artifact_repository="test_ca_repo",
+    )
+    result = runner.invoke(app, ["configure", "test_repo", "--role", "stored_role"])
+
+    assert result.exit_code == 0, result.output
+    assert load_registry()["test_repo"].aws_role_name == "stored_role"
+    assert load_registry()["test_repo"].code_artifact_repository == "test_ca_repo"
+
+    url = SCAN_URL.format("domain", "elsewhere")
+    result = runner.invoke(app, ["configure", "elsewhere", "--url", url])
+    assert result.exit_code == 0, result.output
+    assert set(load_registry()) == {"test_repo", "elsewhere"}
+
+    result = runner.invoke(app, ["configure", "test_repo", "--remove"])
+    assert result.exit_code == 0, result.output
+    assert set(load_registry()) == {"elsewhere"}
+
+
+def test_configure_unknown_repository(tmp_path, monkeypatch):
+    """Tests that repositories without a URL or poetry source are rejected."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "pyproject.toml").write_text("[tool.poetry]\n")
+
+    result = runner.invoke(app, ["configure", "missing"])
+
+    assert result.exit_code == 2
+    assert "pass its --url" in result.output
+    assert not load_registry()
@@ -0,0 +1,120 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from partifact.auth_token import get_token
+from partifact.cache import RoleCredentials
+from partifact.config import Configuration, InvalidConfiguration
+from partifact.credentials import (
+    ClientPool,
+    CredentialSource,
+    aws_session,
+    clear_credential_providers,
+    credential_provider,
+    credential_source,
+)
+
+
+@pytest.fixture(autouse=True)
+def _fresh_providers(monkeypatch):
+    """Resolves credentials from scratch in every test, from the environment only."""
+    for name in ("AWS_PROFILE", "AWS_SHARED_CREDENTIALS_FILE", "AWS_CONFIG_FILE"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "access-key")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "secret-key")
+    monkeypatch.delenv("PARTIFACT_CREDENTIAL_SOURCE", raising=False)
+    clear_credential_providers()
+    yield
+    clear_credential_providers()
+
+
+def test_credential_source_defaults_to_the_environment(monkeypatch):
+    """Tests that the credential source can be set through an environment variable."""
+    assert credential_source() is None
+
+    monkeypatch.setenv("PARTIFACT_CREDENTIAL_SOURCE", "web-identity")
+    assert credential_source() == CredentialSource.WEB_IDENTITY
+    assert credential_source("container") == CredentialSource.CONTAINER
+
+    with pytest.raises(InvalidConfiguration, match="unknown credential source"):
+        credential_source("imds")
+
+
+def test_pinned_source_skips_instance_metadata():
+    """Tests that only the providers of a pinned source are consulted."""
+    provider = credential_provider(None, "container")
+
+    methods = [p.METHOD for p in provider.resolver().providers]
+    assert methods == ["container-role"]
+    assert provider.load_credentials() is None
+    assert "iam-role" in [
+        p.METHOD for p in credential_provider(None).resolver().providers
+    ]
+
+
+def test_credentials_are_resolved_once():
+    """Tests that every session shares the credentials resolved first."""
+    first = aws_session(None, "eu-west-1", "env").get_credentials()
+    second = aws_session(None, "eu-west-1", "env").get_credentials()
+
+    assert first.access_key == "access-key"
+    assert first is second
+    assert credential_provider(None, "env") is credential_provider(None, "env")
+    assert credential_provider(None, "env") is not credential_provider(None)
+
+
+def test_token_uses_the_credential_source(aws):
+    """Tests that the session tokens are fetched with uses the shared credentials."""
+    conf = Configuration(
+        aws_account="1234",
+        aws_region="eu-west-1",
+        code_artifact_repository="test-repo",
+        code_artifact_domain="test-domain",
+        aws_profile="test-profile",
+        aws_credential_source="env",
+    )
+    aws.add_repository(conf.code_artifact_domain, conf.aws_account, "test-token")
+
+    assert get_token(conf) == "test-token"
+
+    session = aws.sessions[0].kwargs
+    assert session["profile_name"] == "test-profile"
+    provider = session["botocore_session"].get_component("credential_provider")
+    assert provider is credential_provider("test-profile", "env")
+
+
+def test_clients_are_shared():
+    """Tests that the pool creates each client once, even when asked concurrently."""
+    pool = ClientPool(max_pool_connections=32)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        clients = list(
+            executor.map(
+                lambda _: pool.client("codeartifact", None, "eu-west-1", "env"),
+                range(16),
+            )
+        )
+
+    assert all(c is clients[0] for c in clients)
+    assert clients[0].meta.config.max_pool_connections == 32
+    assert pool.client("sts", None, "eu-west-1", "env") is not clients[0]
+    assert pool.client("codeartifact", None, "us-east-1", "env") is not clients[0]
+
+
+def test_role_clients_are_keyed_by_credentials():
+    """Tests that role credentials get their own clients, until they expire."""
+    pool = ClientPool()
+    expired = RoleCredentials("expired", "secret", "session", time.time() - 1)
+    current = RoleCredentials("current", "secret", "session", time.time() + 3600)
+
+    old = pool.client("codeartifact", None, "eu-west-1", credentials=expired)
+    new = pool.client("codeartifact", None, "eu-west-1", credentials=current)
+
+    assert old is not new
+    assert new.meta.region_name == "eu-west-1"
+    assert pool.client("codeartifact", None, "eu-west-1", credentials=current) is new
+    # the clients of expired credentials are dropped when new ones are created
+    assert (
+        pool.client("codeartifact", None, "eu-west-1", credentials=expired) is not old
+    )
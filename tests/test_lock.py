@@ -0,0 +1,111 @@
+import json
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from partifact.auth_token import get_token
+from partifact.cache import TokenCache
+from partifact.config import Configuration
+from partifact.lock import FileLock
+from partifact.retry import RetryPolicy
+
+
+def test_lock_is_exclusive(tmp_path):
+    """Tests that a held lock cannot be acquired until it is released."""
+    path = tmp_path / "test.lock"
+    first = FileLock(path)
+    second = FileLock(path, timeout=0.1)
+
+    assert first.acquire()
+    assert not second.acquire()
+
+    first.release()
+    assert second.acquire()
+    second.release()
+    assert not path.exists()
+
+
+def test_lock_from_dead_process_is_broken(tmp_path):
+    """Tests that a lock left behind by a crashed process is taken over."""
+    path = tmp_path / "test.lock"
+    # PIDs are capped well below this, so no process can be running with it
+    owner = {"host": socket.gethostname(), "pid": 2**31 - 1, "time": time.time()}
+    path.write_text(json.dumps(owner))
+
+    lock = FileLock(path, timeout=0.1)
+    assert lock.acquire()
+    assert json.loads(path.read_text())["pid"] == os.getpid()
+
+
+def test_old_lock_is_broken(tmp_path):
+    """Tests that a lock held for longer than the stale threshold is taken over."""
+    path = tmp_path / "test.lock"
+    owner = {"host": "other-host", "pid": 1, "time": 0}
+    path.write_text(json.dumps(owner))
+    os.utime(path, (0, 0))
+
+    lock = FileLock(path, timeout=0.1, stale_after=60)
+    assert lock.acquire()
+
+
+def test_lock_from_live_process_on_other_host_is_kept(tmp_path):
+    """Tests that a recent lock owned by another host is waited on."""
+    path = tmp_path / "test.lock"
+    owner = {"host": "other-host", "pid": 1, "time": time.time()}
+    path.write_text(json.dumps(owner))
+
+    lock = FileLock(path, timeout=0.1, stale_after=60)
+    assert not lock.acquire()
+
+
+def test_concurrent_fetches_are_single_flight(aws, cache_dir):
+    """Tests that concurrent callers sharing a cache fetch a token only once."""
+    conf = Configuration(
+        aws_account="1234",
+        aws_region="eu-west-1",
+        code_artifact_repository="test-repo",
+        code_artifact_domain="test-domain",
+    )
+    aws.add_repository(conf.code_artifact_domain, conf.aws_account, "test-token")
+    aws.token_delay = 0.2
+
+    def login(_):
+        return get_token(conf, TokenCache(cache_dir))
+
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        tokens = list(executor.map(login, range(20)))
+
+    assert tokens == ["test-token"] * 20
+    assert aws.token_requests == 1
+
+
+def test_fetch_proceeds_after_lock_timeout(aws, cache_dir):
+    """Tests that a token is still fetched when the lock cannot be acquired."""
+    conf = Configuration(
+        aws_account="1234",
+        aws_region="eu-west-1",
+        code_artifact_repository="test-repo",
+        code_artifact_domain="test-domain",
+    )
+    aws.add_repository(conf.code_artifact_domain, conf.aws_account, "test-token")
+    cache = TokenCache(cache_dir, lock_timeout=0.1)
+
+    with cache.lock(conf):
+        assert get_token(conf, cache, RetryPolicy(deadline=0.0)) == "test-token"
+
+
+def test_lock_wait_covers_retries(cache_dir):
+    """Tests that waiters outlast a fetch retrying throttled calls."""
+    conf = Configuration(
+        aws_account="1234",
+        aws_region="eu-west-1",
+        code_artifact_repository="test-repo",
+        code_artifact_domain="test-domain",
+    )
+    cache = TokenCache(cache_dir, lock_timeout=30, lock_stale_after=120)
+
+    lock = cache.lock(conf, retry_time=240)
+
+    assert lock.timeout == 270
+    assert lock.stale_after == 270
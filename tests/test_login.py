@@ -1,8 +1,10 @@
-from unittest.mock import Mock
+from unittest.mock import ANY, Mock
 
 import pytest
+import tomlkit
 from typer.testing import CliRunner
 
+from partifact.cache import TokenCache
 from partifact.config import Configuration
 from partifact.main import app
 
@@ -29,7 +31,7 @@ def token_mock(mocker):
     """Patches token generation."""
     test_token = "TEST_TOKEN"
 
-    mock = mocker.patch("partifact.main.get_token")
+    mock = mocker.patch("partifact.auth_token.get_token")
     mock.return_value = test_token
 
     return mock
@@ -45,9 +47,9 @@ def test_login_generates_token_with_correct_inputs(
     result = runner.invoke(app, ["login", test_poetry_repo])
     assert result.exit_code == 0
 
-    load_config_mock.assert_called_once_with(test_poetry_repo, None, None)
+    load_config_mock.assert_called_once_with(test_poetry_repo, None, None, None, None)
     config: Configuration = load_config_mock.return_value
-    token_mock.assert_called_once_with(config)
+    token_mock.assert_called_once_with(config, ANY, ANY)
 
 
 @pytest.mark.usefixtures("subprocess_mock")
@@ -61,9 +63,11 @@ def test_login_generates_token_with_correct_inputs_with_profile(
     result = runner.invoke(app, ["login", test_poetry_repo, "--profile", test_profile])
     assert result.exit_code == 0
 
-    load_config_mock.assert_called_once_with(test_poetry_repo, test_profile, None)
+    load_config_mock.assert_called_once_with(
+        test_poetry_repo, test_profile, None, None, None
+    )
     config: Configuration = load_config_mock.return_value
-    token_mock.assert_called_once_with(config)
+    token_mock.assert_called_once_with(config, ANY, ANY)
 
 
 @pytest.mark.usefixtures("subprocess_mock")
@@ -77,11 +81,14 @@ def test_login_generates_token_with_correct_inputs_with_role(
     result = runner.invoke(app, ["login", test_poetry_repo, "--role", test_role])
     assert result.exit_code == 0
 
-    load_config_mock.assert_called_once_with(test_poetry_repo, None, test_role)
+    load_config_mock.assert_called_once_with(
+        test_poetry_repo, None, test_role, None, None
+    )
     config: Configuration = load_config_mock.return_value
-    token_mock.assert_called_once_with(config)
+    token_mock.assert_called_once_with(config, ANY, ANY)
 
 
+@pytest.mark.usefixtures("_subprocess_writers")
 def test_login_command_configures_pip(
     subprocess_mock: Mock, load_config_mock: Mock, token_mock: Mock
 ):
@@ -104,7 +111,7 @@ def test_login_command_configures_pip(
     )
 
 
-@pytest.mark.usefixtures("load_config_mock")
+@pytest.mark.usefixtures("load_config_mock", "_subprocess_writers")
 def test_login_command_configures_poetry(subprocess_mock: Mock, token_mock: Mock):
     """Tests that expected shell command is invoked to configure poetry."""
     test_poetry_repo = "TEST_POETRY_REPO"
@@ -121,3 +128,152 @@ def test_login_command_configures_poetry(subprocess_mock: Mock, token_mock: Mock
     subprocess_mock.assert_called_once_with(
         expected_poetry_command, capture_output=True, text=True, check=True
     )
+
+
+@pytest.mark.usefixtures("subprocess_mock", "load_config_mock")
+def test_login_uses_token_cache(token_mock: Mock, cache_dir):
+    """Tests that the login command looks up tokens through the cache by default."""
+    result = runner.invoke(app, ["login", "whatever", "--refresh-margin", "60"])
+    assert result.exit_code == 0
+
+    cache = token_mock.call_args.args[1]
+    assert isinstance(cache, TokenCache)
+    assert cache.directory == cache_dir
+    assert cache.refresh_margin == 60
+
+
+@pytest.mark.usefixtures("subprocess_mock", "load_config_mock")
+def test_login_without_cache(token_mock: Mock):
+    """Tests that --no-cache bypasses the token cache."""
+    result = runner.invoke(app, ["login", "whatever", "--no-cache"])
+    assert result.exit_code == 0
+
+    assert token_mock.call_args.args[1] is None
+
+
+@pytest.mark.usefixtures("load_config_mock")
+def test_login_command_writes_config_files(
+    subprocess_mock: Mock, token_mock: Mock, config_home
+):
+    """Tests that poetry and pip are configured without spawning subprocesses."""
+    result = runner.invoke(app, ["login", "TEST_POETRY_REPO", "--configure-pip"])
+    assert result.exit_code == 0
+
+    subprocess_mock.assert_not_called()
+    auth = tomlkit.parse((config_home / "pypoetry" / "auth.toml").read_text())
+    assert auth["http-basic"]["TEST_POETRY_REPO"]["password"] == token_mock.return_value
+    assert token_mock.return_value in (config_home / "pip" / "pip.conf").read_text()
+
+
+@pytest.mark.usefixtures("load_config_mock")
+def test_login_keeps_poetry_keyring(
+    subprocess_mock: Mock, token_mock: Mock, config_home, monkeypatch
+):
+    """Tests that poetry stores the token itself while its keyring may be enabled."""
+    monkeypatch.delenv("POETRY_KEYRING_ENABLED")
+
+    result = runner.invoke(app, ["login", "TEST_POETRY_REPO"])
+    assert result.exit_code == 0, result.output
+
+    command = subprocess_mock.call_args.args[0]
+    assert command[:3] == ["poetry", "config", "http-basic.TEST_POETRY_REPO"]
+    assert not (config_home / "pypoetry" / "auth.toml").exists()
+
+
+@pytest.mark.usefixtures("load_config_mock", "token_mock")
+def test_login_skips_unchanged_credentials(mocker, config_home):
+    """Tests that tools already holding the current token aren't written again."""
+    result = runner.invoke(app, ["login", "TEST_POETRY_REPO", "--configure-pip"])
+    assert result.exit_code == 0
+    auth = config_home / "pypoetry" / "auth.toml"
+    modified = auth.stat().st_mtime_ns
+
+    configure = mocker.patch("partifact.targets.configure_targets")
+    result = runner.invoke(app, ["login", "TEST_POETRY_REPO", "--configure-pip"])
+    assert result.exit_code == 0
+
+    configure.assert_not_called()
+    assert auth.stat().st_mtime_ns == modified
+
+
+@pytest.mark.usefixtures("load_config_mock")
+def test_login_plan_reports_changes(token_mock: Mock, config_home):
+    """Tests that --plan reports pending changes without applying them."""
+    result = runner.invoke(app, ["login", "repo", "--configure-pip", "--plan"])
+    assert result.exit_code == 0
+
+    assert "poetry: update credentials of repo" in result.output
+    assert "pip: point global.index-url to repo" in result.output
+    assert not (config_home / "pypoetry" / "auth.toml").exists()
+
+    runner.invoke(app, ["login", "repo", "--configure-pip"])
+    result = runner.invoke(app, ["login", "repo", "--configure-pip", "--plan"])
+    assert result.output.strip() == "nothing to change"
+
+    token_mock.return_value = "NEW_TOKEN"
+    result = runner.invoke(app, ["login", "repo", "--plan"])
+    assert result.output.strip() == "poetry: update credentials of repo"
+
+
+def test_login_to_several_repositories(aws, write_sources, config_home):
+    """Tests that several repositories are logged into with one token per domain."""
+    url = "https://{domain}-1234.d.codeartifact.eu-west-1.amazonaws.com/pypi/{repo}/simple/"
+    write_sources(
+        {
+            "repo-a": url.format(domain="domain-a", repo="repo-a"),
+            "repo-b": url.format(domain="domain-a", repo="repo-b"),
+            "repo-c": url.format(domain="domain-c", repo="repo-c"),
+        }
+    )
+    aws.add_repository("domain-a", "1234", "token-a")
+    aws.add_repository("domain-c", "1234", "token-c")
+
+    result = runner.invoke(app, ["login", "repo-a", "repo-b", "repo-c"])
+    assert result.exit_code == 0, result.output
+
+    assert aws.token_requests == 2
+    auth = tomlkit.parse((config_home / "pypoetry" / "auth.toml").read_text())
+    assert auth["http-basic"]["repo-a"]["password"] == "token-a"
+    assert auth["http-basic"]["repo-b"]["password"] == "token-a"
+    assert auth["http-basic"]["repo-c"]["password"] == "token-c"
+
+
+def test_login_to_all_repositories(aws, write_sources, config_home):
+    """Tests that --all logs into every CodeArtifact source."""
+    url = "https://domain-1234.d.codeartifact.eu-west-1.amazonaws.com/pypi/{repo}/"
+    write_sources(
+        {"repo-a": url.format(repo="repo-a"), "repo-b": url.format(repo="repo-b")}
+    )
+    aws.add_repository("domain", "1234", "test-token")
+
+    result = runner.invoke(app, ["login", "--all"])
+    assert result.exit_code == 0, result.output
+
+    assert aws.token_requests == 1
+    auth = tomlkit.parse((config_home / "pypoetry" / "auth.toml").read_text())
+    assert set(auth["http-basic"]) == {"repo-a", "repo-b"}
+
+
+def test_login_requires_repositories():
+    """Tests that login fails if neither repositories nor --all are given."""
+    result = runner.invoke(app, ["login"])
+    assert result.exit_code != 0
+
+
+def test_login_scans_directory(aws, fs, config_home):
+    """Tests that --scan logs into every source of the projects in a tree."""
+    url = "https://{}-1234.d.codeartifact.eu-west-1.amazonaws.com/pypi/{}/simple/"
+    for package, repositories in (("a", ["repo-a", "repo-b"]), ("b", ["repo-b"])):
+        sources = [{"name": r, "url": url.format("domain", r)} for r in repositories]
+        fs.create_file(
+            f"mono/{package}/pyproject.toml",
+            contents=tomlkit.dumps({"tool": {"poetry": {"source": sources}}}),
+        )
+    aws.add_repository("domain", "1234", "test-token")
+
+    result = runner.invoke(app, ["login", "--scan", "mono"])
+    assert result.exit_code == 0, result.output
+
+    assert aws.token_requests == 1
+    auth = tomlkit.parse((config_home / "pypoetry" / "auth.toml").read_text())
+    assert set(auth["http-basic"]) == {"repo-a", "repo-b"}
@@ -0,0 +1,176 @@
+import json
+import socket
+
+import pytest
+from typer.testing import CliRunner
+
+from partifact.main import app
+from partifact.metrics import (
+    Emitter,
+    OtlpFileEmitter,
+    StatsdEmitter,
+    active_emitter,
+    emitting,
+    from_url,
+)
+from partifact.timing import phase
+
+runner = CliRunner()
+
+
+class RecordingEmitter(Emitter):
+    """An emitter keeping everything it receives."""
+
+    def __init__(self):
+        """Creates an empty emitter."""
+        self.counters = []
+        self.histograms = []
+        self.spans = []
+        self.flushed = False
+
+    def increment(self, name, value=1, tags=None):
+        """Records the counter."""
+        self.counters.append((name, value, tags))
+
+    def histogram(self, name, value, tags=None):
+        """Records the name of the histogram."""
+        self.histograms.append(name)
+
+    def span(self, name, start, duration, error=None):
+        """Records the name and error of the span."""
+        self.spans.append((name, error))
+
+    def flush(self):
+        """Records that the emitter was flushed."""
+        self.flushed = True
+
+
+def test_phases_are_emitted_while_active():
+    """Tests that phases are reported as histograms and spans only while active."""
+    emitter = RecordingEmitter()
+    with phase("ignored"):
+        pass
+
+    with emitting(emitter):
+        assert active_emitter() is emitter
+        with phase("first"):
+            pass
+
+    assert active_emitter() is None
+    assert emitter.histograms == ["first.duration"]
+    assert emitter.spans == [("first", None)]
+    assert emitter.flushed
+
+
+def test_failed_phases_are_counted():
+    """Tests that a phase raising an exception is reported as an error."""
+    emitter = RecordingEmitter()
+    with emitting(emitter), pytest.raises(ValueError, match="boom"), phase("failing"):
+        raise ValueError("boom")
+
+    assert emitter.counters == [("failing.errors", 1, {"error": "ValueError"})]
+    assert emitter.spans[0][0] == "failing"
+    assert isinstance(emitter.spans[0][1], ValueError)
+
+
+@pytest.mark.parametrize(
+    ("tags", "expected"),
+    [
+        (False, b"partifact.login.errors:1|c"),
+        (True, b"partifact.login.errors:1|c|#error:ValueError"),
+    ],
+)
+def test_statsd_emitter(tags, expected):
+    """Tests that StatsD datagrams are sent, with tags in the DogStatsD format."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as server:
+        server.bind(("127.0.0.1", 0))
+        server.settimeout(5)
+        emitter = StatsdEmitter(port=server.getsockname()[1], tags=tags)
+
+        emitter.phase("login", 0.0, 0.25, ValueError("boom"))
+
+        assert server.recv(1024) == b"partifact.login.duration:250.000|ms"
+        assert server.recv(1024) == expected
+
+
+def test_otlp_file_emitter(tmp_path):
+    """Tests that metrics and spans are aggregated and appended as OTLP/JSON."""
+    path = tmp_path / "metrics" / "otlp.jsonl"
+    emitter = OtlpFileEmitter(path)
+
+    emitter.increment("cache.hit")
+    emitter.increment("cache.hit", 2)
+    emitter.phase("aws.get_authorization_token", 1700000000.0, 0.1)
+    emitter.phase("aws.get_authorization_token", 1700000001.0, 0.3, ValueError("x"))
+    emitter.flush()
+    emitter.flush()
+
+    metrics_line, traces_line = path.read_text().splitlines()
+    scope_metrics = json.loads(metrics_line)["resourceMetrics"][0]["scopeMetrics"]
+    metrics = {m["name"]: m for m in scope_metrics[0]["metrics"]}
+    assert metrics["partifact.cache.hit"]["sum"]["dataPoints"][0]["asInt"] == "3"
+    histogram = metrics["partifact.aws.get_authorization_token.duration"]
+    point = histogram["histogram"]["dataPoints"][0]
+    assert point["count"] == "2"
+    assert point["max"] == pytest.approx(300)
+    errors = metrics["partifact.aws.get_authorization_token.errors"]
+    assert errors["sum"]["dataPoints"][0]["attributes"] == [
+        {"key": "error", "value": {"stringValue": "ValueError"}}
+    ]
+
+    resource_spans = json.loads(traces_line)["resourceSpans"][0]
+    spans = resource_spans["scopeSpans"][0]["spans"]
+    assert [s["status"] for s in spans] == [{}, {"code": 2, "message": "x"}]
+    assert spans[0]["startTimeUnixNano"] == "1700000000000000000"
+    assert spans[0]["traceId"] == spans[1]["traceId"]
+
+
+def test_from_url(tmp_path):
+    """Tests that emitters are created from URLs."""
+    statsd = from_url("dogstatsd://localhost:9125")
+    assert isinstance(statsd, StatsdEmitter)
+    assert statsd.address == ("localhost", 9125)
+    assert statsd.tags
+
+    otlp = from_url(f"otlp-file:{tmp_path}/otlp.jsonl")
+    assert isinstance(otlp, OtlpFileEmitter)
+    assert otlp.path == tmp_path / "otlp.jsonl"
+
+    with pytest.raises(ValueError, match="unsupported metrics URL"):
+        from_url("https://collector")
+
+
+def test_login_emits_metrics(aws, write_sources, monkeypatch):
+    """Tests that login reports metrics when PARTIFACT_METRICS is set."""
+    write_sources(
+        {
+            "repo": "https://domain-1234.d.codeartifact.eu-west-1.amazonaws.com/pypi/repo/",
+        }
+    )
+    aws.add_repository("domain", "1234", "test-token")
+    monkeypatch.setenv("PARTIFACT_METRICS", "otlp-file:otlp.jsonl")
+
+    for _ in range(2):
+        result = runner.invoke(app, ["login", "repo"])
+        assert result.exit_code == 0, result.output
+
+    with open("otlp.jsonl") as f:
+        lines = [json.loads(line) for line in f]
+    names = [
+        m["name"]
+        for line in lines
+        for resource in line.get("resourceMetrics", [])
+        for m in resource["scopeMetrics"][0]["metrics"]
+    ]
+    assert names.count("partifact.cache.miss") == 1
+    assert names.count("partifact.cache.hit") == 1
+    assert "partifact.aws.get_authorization_token.duration" in names
+    assert "partifact.login.duration" in names
+
+
+def test_login_rejects_unsupported_metrics_url():
+    """Tests that an unsupported metrics URL is a usage error."""
+    result = runner.invoke(app, ["login", "repo", "--metrics", "udp://collector"])
+
+    assert result.exit_code == 2
+    assert "unsupported metrics URL" in result.output
@@ -0,0 +1,197 @@
+import hashlib
+
+import pytest
+import tomlkit
+from typer.testing import CliRunner
+
+from partifact.main import app
+from partifact.prefetch import LockedFile, PrefetchError, locked_files, prefetch_files
+
+runner = CliRunner()
+
+WHEEL = b"wheel content"
+SDIST = b"sdist content"
+
+
+def _hash(content: bytes) -> str:
+    return f"sha256:{hashlib.sha256(content).hexdigest()}"
+
+
+@pytest.fixture
+def index(fake_index):
+    """A stand-in index serving a wheel and an sdist of a project."""
+    fake_index.add_file("my-package", "my_package-1.0-py3-none-any.whl", WHEEL)
+    fake_index.add_file("my-package", "my_package-1.0.tar.gz", SDIST)
+    return fake_index
+
+
+@pytest.fixture
+def lock_file(tmp_path):
+    """Writes a lock file pinning the files of the stand-in index."""
+    lock = {
+        "package": [
+            {
+                "name": "My_Package",
+                "version": "1.0",
+                "files": [
+                    {"file": "my_package-1.0-py3-none-any.whl", "hash": _hash(WHEEL)},
+                    {"file": "my_package-1.0.tar.gz", "hash": _hash(SDIST)},
+                ],
+            },
+            {
+                "name": "local",
+                "version": "0.1",
+                "files": [],
+                "source": {"type": "directory", "url": "../local"},
+            },
+        ]
+    }
+    path = tmp_path / "poetry.lock"
+    path.write_text(tomlkit.dumps(lock))
+    return path
+
+
+def test_locked_files(lock_file):
+    """Tests that the files of packages from an index are read from the lock file."""
+    files = locked_files(lock_file)
+
+    assert files == [
+        LockedFile("my-package", "my_package-1.0-py3-none-any.whl", _hash(WHEEL)[7:]),
+        LockedFile("my-package", "my_package-1.0.tar.gz", _hash(SDIST)[7:]),
+    ]
+    assert len(locked_files(lock_file, include=["*.whl"])) == 1
+
+
+def test_locked_files_of_older_lock_files(tmp_path):
+    """Tests that files listed under metadata.files by older poetry versions are read."""
+    path = tmp_path / "poetry.lock"
+    path.write_text(
+        tomlkit.dumps(
+            {
+                "package": [{"name": "pkg", "version": "1.0"}],
+                "metadata": {"files": {"pkg": [{"file": "pkg.whl", "hash": "md5:1"}]}},
+            }
+        )
+    )
+
+    assert locked_files(path) == [LockedFile("pkg", "pkg.whl", None)]
+    with pytest.raises(PrefetchError, match="not found"):
+        locked_files(tmp_path / "missing.lock")
+
+
+def test_prefetch_downloads_and_skips_present_files(index, lock_file, tmp_path):
+    """Tests that locked files are downloaded once and skipped when present."""
+    wheelhouse = tmp_path / "wheelhouse"
+
+    result = prefetch_files(
+        locked_files(lock_file), wheelhouse, index.url, "test-token"
+    )
+
+    assert sorted(result.downloaded) == [
+        "my_package-1.0-py3-none-any.whl",
+        "my_package-1.0.tar.gz",
+    ]
+    assert result.size == len(WHEEL) + len(SDIST)
+    assert (wheelhouse / "my_package-1.0-py3-none-any.whl").read_bytes() == WHEEL
+
+    requests = len(index.requests)
+    result = prefetch_files(
+        locked_files(lock_file), wheelhouse, index.url, "test-token"
+    )
+
+    assert len(result.skipped) == 2
+    assert not result.downloaded
+    assert len(index.requests) == requests
+
+
+def test_prefetch_follows_redirects(index, lock_file, tmp_path):
+    """Tests that downloads redirected to storage are followed."""
+    index.redirect = True
+
+    result = prefetch_files(
+        locked_files(lock_file), tmp_path / "wheelhouse", index.url, "test-token"
+    )
+
+    assert len(result.downloaded) == 2
+    assert any(r.startswith("/storage/") for r in index.requests)
+
+
+def test_prefetch_verifies_hashes(index, lock_file, tmp_path):
+    """Tests that files not matching the lock file are rejected."""
+    index.files["my_package-1.0.tar.gz"] = b"tampered"
+    index.files["my_package-1.0-py3-none-any.whl"] = b""
+    wheelhouse = tmp_path / "wheelhouse"
+    wheelhouse.mkdir()
+    (wheelhouse / "my_package-1.0-py3-none-any.whl").write_bytes(b"stale")
+
+    result = prefetch_files(
+        locked_files(lock_file), wheelhouse, index.url, "test-token"
+    )
+
+    assert set(result.failed) == {
+        "my_package-1.0-py3-none-any.whl",
+        "my_package-1.0.tar.gz",
+    }
+    assert "hash mismatch" in result.failed["my_package-1.0.tar.gz"]
+    assert not (wheelhouse / "my_package-1.0.tar.gz").exists()
+    assert (wheelhouse / "my_package-1.0-py3-none-any.whl").read_bytes() == b"stale"
+    assert sorted(p.name for p in wheelhouse.iterdir()) == [
+        "my_package-1.0-py3-none-any.whl"
+    ]
+
+
+def test_prefetch_reports_missing_files(index, lock_file, tmp_path):
+    """Tests that files missing from the index are reported as failed."""
+    del index.projects["my-package"]
+
+    result = prefetch_files(
+        locked_files(lock_file), tmp_path / "wheelhouse", index.url, "test-token"
+    )
+
+    assert result.failed == {
+        "my_package-1.0-py3-none-any.whl": "not found in the index",
+        "my_package-1.0.tar.gz": "not found in the index",
+    }
+
+
+def test_prefetch_reports_broken_responses(index, lock_file, tmp_path):
+    """Tests that a response cut short fails its files without stopping the rest."""
+    index.add_file("other", "other-1.0.tar.gz", SDIST)
+    index.truncated.add("my-package")
+    files = [*locked_files(lock_file), LockedFile("other", "other-1.0.tar.gz")]
+
+    result = prefetch_files(files, tmp_path / "wheelhouse", index.url, "test-token")
+
+    assert result.downloaded == ["other-1.0.tar.gz"]
+    assert "IncompleteRead" in result.failed["my_package-1.0.tar.gz"]
+
+
+def test_invalid_lock_files_are_reported(tmp_path):
+    """Tests that malformed or unreadable lock files raise a PrefetchError."""
+    path = tmp_path / "poetry.lock"
+    path.write_text(tomlkit.dumps({"package": [{"version": "1.0", "files": []}]}))
+
+    with pytest.raises(PrefetchError, match="missing 'name'"):
+        locked_files(path)
+    with pytest.raises(PrefetchError, match="failed to read"):
+        locked_files(tmp_path)
+
+
+def test_prefetch_command(index, lock_file, tmp_path, mocker):
+    """Tests that the prefetch command downloads with the repository's token."""
+    mocker.patch("partifact.main.Configuration.load")
+    mocker.patch("partifact.auth_token.get_token", return_value="test-token")
+    mocker.patch("partifact.shell_commands.index_url", return_value=index.url)
+    wheelhouse = tmp_path / "wheelhouse"
+
+    args = ["prefetch", "repo", "--lock-file", str(lock_file)]
+    result = runner.invoke(app, [*args, "--wheelhouse", str(wheelhouse)])
+
+    assert result.exit_code == 0, result.output
+    assert "downloaded 2 files" in result.output
+    assert len(list(wheelhouse.iterdir())) == 2
+
+    index.token = "other-token"
+    result = runner.invoke(app, [*args, "--wheelhouse", str(tmp_path / "other")])
+    assert result.exit_code == 1
+    assert "401" in result.output
@@ -0,0 +1,181 @@
+import hashlib
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from partifact import proxy
+from partifact.proxy import FileCache, Proxy
+
+WHEEL = b"wheel content"
+WHEEL_DIGEST = hashlib.sha256(WHEEL).hexdigest()
+WHEEL_NAME = "pkg-1.0-py3-none-any.whl"
+WHEEL_PATH = f"/pypi/repo/simple/pkg/1.0/{WHEEL_NAME}"
+
+
+@pytest.fixture
+def upstream(fake_index):
+    """A stand-in index with a single distribution."""
+    fake_index.add_file("pkg", WHEEL_NAME, WHEEL)
+    return fake_index
+
+
+@pytest.fixture
+def running_proxy(upstream, tmp_path):
+    """Runs a proxy for the stand-in index on a free port."""
+    index_proxy = Proxy(upstream.url, lambda: "test-token", tmp_path / "proxy")
+    started = threading.Event()
+    urls = []
+
+    def ready(url):
+        urls.append(url)
+        started.set()
+
+    thread = threading.Thread(
+        target=index_proxy.serve_forever, args=("127.0.0.1", 0, ready)
+    )
+    thread.start()
+    started.wait(5)
+
+    yield index_proxy, urls[0]
+
+    index_proxy.shutdown()
+    thread.join()
+
+
+def _get(url):
+    with urllib.request.urlopen(url, timeout=5) as response:  # noqa: S310
+        return response.read()
+
+
+def test_index_pages_point_to_the_proxy(upstream, running_proxy):
+    """Tests that index pages are fetched with the token and link to the proxy."""
+    _, url = running_proxy
+
+    page = _get(url + "pkg/").decode()
+
+    assert f'href="/files{WHEEL_PATH}#sha256={WHEEL_DIGEST}"' in page
+    assert upstream.requests == ["/pypi/repo/simple/pkg/"]
+
+
+def test_index_pages_are_revalidated_after_ttl(upstream, running_proxy):
+    """Tests that pages are cached and revalidated through their ETag once stale."""
+    index_proxy, url = running_proxy
+
+    first = _get(url + "pkg/")
+    assert _get(url + "pkg/") == first
+    assert len(upstream.requests) == 1
+
+    index_proxy.index_ttl = 0
+    assert _get(url + "pkg/") == first
+    assert len(upstream.requests) == 2
+
+
+def test_index_pages_in_memory_are_bounded(upstream, monkeypatch, tmp_path):
+    """Tests that the least recently used pages are forgotten beyond the limit."""
+    upstream.add_file("other", "other-1.0-py3-none-any.whl", b"other")
+    monkeypatch.setattr(proxy, "MAX_CACHED_PAGES", 1)
+    index_proxy = Proxy(upstream.url, lambda: "test-token", tmp_path / "proxy")
+
+    index_proxy.index_page("pkg/")
+    index_proxy.index_page("other/")
+    index_proxy.index_page("pkg/")
+
+    assert upstream.requests == [
+        "/pypi/repo/simple/pkg/",
+        "/pypi/repo/simple/other/",
+        "/pypi/repo/simple/pkg/",
+    ]
+
+
+def test_distributions_are_cached_by_digest(upstream, running_proxy, tmp_path):
+    """Tests that a distribution is downloaded once and kept under its digest."""
+    _, url = running_proxy
+    page = _get(url + "pkg/").decode()
+    link = page.split('href="')[1].split("#")[0]
+    file_url = url.replace("/simple/", link)
+
+    assert _get(file_url) == WHEEL
+    assert _get(file_url) == WHEEL
+
+    assert upstream.requests.count(WHEEL_PATH) == 1
+    cached = tmp_path / "proxy" / WHEEL_DIGEST[:2] / WHEEL_DIGEST
+    assert cached.read_bytes() == WHEEL
+
+
+def test_corrupt_distributions_are_rejected(upstream, running_proxy, tmp_path):
+    """Tests that a download not matching the digest on the index page fails."""
+    _, url = running_proxy
+    upstream.add_file("pkg", WHEEL_NAME, WHEEL, digest="0" * 64)
+    _get(url + "pkg/")
+
+    with pytest.raises(urllib.error.HTTPError) as err:
+        _get(url.replace("/simple/", f"/files{WHEEL_PATH}"))
+
+    assert err.value.code == 502
+    assert not list((tmp_path / "proxy").glob("??/*"))
+
+
+def test_distributions_under_the_index_are_not_pages(upstream, running_proxy):
+    """Tests that distributions aren't fetched as index pages, even if asked for."""
+    _, url = running_proxy
+
+    with pytest.raises(urllib.error.HTTPError) as err:
+        _get(url + f"pkg/1.0/{WHEEL_NAME}")
+
+    assert err.value.code == 404
+    assert upstream.requests == []
+
+
+def test_missing_projects_are_passed_on(running_proxy):
+    """Tests that a project missing upstream is reported as missing."""
+    _, url = running_proxy
+
+    with pytest.raises(urllib.error.HTTPError) as err:
+        _get(url + "missing/")
+
+    assert err.value.code == 404
+
+
+def test_file_cache_evicts_least_recently_used(tmp_path):
+    """Tests that the least recently used files are evicted beyond the size limit."""
+    cache = FileCache(tmp_path, max_size=20)
+    first = cache.put([b"a" * 10])
+    second = cache.put([b"b" * 10])
+    os.utime(cache.path(first), (1, 1))
+    os.utime(cache.path(second), (2, 2))
+
+    assert cache.get(first) is not None
+    third = cache.put([b"c" * 10])
+
+    assert cache.get(second) is None
+    assert cache.get(first) is not None
+    assert cache.get(third) is not None
+
+
+def test_file_cache_scans_only_when_full(monkeypatch, tmp_path):
+    """Tests that the cache directory is only scanned once it exceeds the limit."""
+    cache = FileCache(tmp_path, max_size=20)
+    scans = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda keep=None: scans.append(evict(keep)))
+
+    cache.put([b"a" * 10])
+    cache.put([b"b" * 10])
+    cache.put([b"b" * 10])
+    assert len(scans) == 1
+
+    cache.put([b"c" * 10])
+    assert len(scans) == 2
+    assert len(list(tmp_path.glob("??/*"))) == 2
+
+
+def test_file_cache_verifies_digest(tmp_path):
+    """Tests that content not matching the expected digest isn't stored."""
+    cache = FileCache(tmp_path)
+
+    with pytest.raises(ValueError, match="expected digest"):
+        cache.put([WHEEL], expected_digest="0" * 64)
+    assert cache.put([WHEEL], expected_digest=WHEEL_DIGEST) == WHEEL_DIGEST
@@ -0,0 +1,173 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+from typer.testing import CliRunner
+
+from partifact.main import app
+from partifact.publish import PublishError, RetryPolicy, publish_files, upload_fields
+
+runner = CliRunner()
+
+METADATA = """Metadata-Version: 2.1
+Name: my-package
+Version: 1.0
+Summary: A package
+Classifier: Programming Language :: Python :: 3
+Classifier: License :: OSI Approved :: MIT License
+Requires-Dist: requests
+
+A longer description.
+"""
+
+FAST_RETRIES = RetryPolicy(max_attempts=3, base_delay=0.01)
+
+
+@pytest.fixture
+def dist(tmp_path):
+    """Builds a wheel and an sdist of a package."""
+    wheel = tmp_path / "my_package-1.0-py3-none-any.whl"
+    with zipfile.ZipFile(wheel, "w") as f:
+        f.writestr("my_package/__init__.py", "")
+        f.writestr("my_package-1.0.dist-info/METADATA", METADATA)
+
+    sdist = tmp_path / "my-package-1.0.tar.gz"
+    with tarfile.open(sdist, "w:gz") as f:
+        content = METADATA.encode()
+        info = tarfile.TarInfo("my-package-1.0/PKG-INFO")
+        info.size = len(content)
+        f.addfile(info, io.BytesIO(content))
+    return [wheel, sdist]
+
+
+def test_upload_fields(dist):
+    """Tests that distributions are described from their metadata."""
+    wheel, sdist = (dict(upload_fields(p)) for p in dist)
+    fields = upload_fields(dist[0])
+
+    assert wheel["name"] == "my-package"
+    assert wheel["version"] == "1.0"
+    assert wheel["filetype"] == "bdist_wheel"
+    assert wheel["pyversion"] == "py3"
+    assert wheel["description"].strip() == "A longer description."
+    assert len([v for k, v in fields if k == "classifiers"]) == 2
+    assert ("requires_dist", "requests") in fields
+    assert sdist["filetype"] == "sdist"
+    assert sdist["pyversion"] == "source"
+
+
+def test_upload_fields_of_invalid_distributions(tmp_path):
+    """Tests that files without readable metadata are rejected."""
+    path = tmp_path / "broken-1.0-py3-none-any.whl"
+    path.write_bytes(b"not a zip file")
+
+    with pytest.raises(PublishError, match="metadata"):
+        upload_fields(path)
+
+    with zipfile.ZipFile(path, "w") as f:
+        f.writestr("broken/__init__.py", "")
+    with pytest.raises(PublishError, match="metadata"):
+        upload_fields(path)
+
+    with zipfile.ZipFile(path, "w") as f:
+        f.writestr("broken-1.0.dist-info/METADATA", b"Name: \xff")
+    with pytest.raises(PublishError, match="metadata"):
+        upload_fields(path)
+
+
+def test_publish(fake_index, dist):
+    """Tests that every file is uploaded with its metadata and content."""
+    result = publish_files(dist, fake_index.upload_url, "test-token")
+
+    assert sorted(result.uploaded) == sorted(p.name for p in dist)
+    assert result.size == sum(p.stat().st_size for p in dist)
+    upload = fake_index.uploads["my_package-1.0-py3-none-any.whl"]
+    assert upload[":action"] == [b"file_upload"]
+    assert upload["content"] == [dist[0].read_bytes()]
+    assert upload["classifiers"] == [
+        b"Programming Language :: Python :: 3",
+        b"License :: OSI Approved :: MIT License",
+    ]
+
+
+def test_publish_retries_server_errors(fake_index, dist):
+    """Tests that uploads failing with server errors are retried."""
+    fake_index.failures = 2
+
+    result = publish_files(dist, fake_index.upload_url, "test-token", 1, FAST_RETRIES)
+
+    assert len(result.uploaded) == 2
+    assert not result.failed
+    assert len(fake_index.requests) == 4
+
+    fake_index.uploads.clear()
+    fake_index.failures = 3
+    result = publish_files(
+        dist[:1], fake_index.upload_url, "test-token", policy=FAST_RETRIES
+    )
+
+    assert result.failed == {dist[0].name: "503 Service Unavailable"}
+
+
+def test_publish_retries_broken_responses(fake_index, dist):
+    """Tests that uploads whose response is cut short are retried."""
+    fake_index.truncated.add(dist[0].name)
+
+    result = publish_files(
+        dist[:1], fake_index.upload_url, "test-token", policy=FAST_RETRIES
+    )
+
+    assert result.uploaded == [dist[0].name]
+    assert len(fake_index.requests) == 2
+
+
+def test_publish_retry_after_stored_upload(fake_index, dist):
+    """Tests that a conflict on a retry counts as uploaded, as the first one landed."""
+    fake_index.lost_responses = 1
+
+    result = publish_files(
+        dist[:1], fake_index.upload_url, "test-token", policy=FAST_RETRIES
+    )
+
+    assert result.uploaded == [dist[0].name]
+    assert not result.failed
+    assert len(fake_index.requests) == 2
+
+
+def test_publish_existing_files(fake_index, dist):
+    """Tests that files already published fail unless they are skipped."""
+    publish_files(dist[:1], fake_index.upload_url, "test-token")
+
+    result = publish_files(dist, fake_index.upload_url, "test-token")
+    assert result.failed == {dist[0].name: "already published"}
+    assert result.uploaded == [dist[1].name]
+
+    result = publish_files(
+        dist, fake_index.upload_url, "test-token", skip_existing=True
+    )
+    assert sorted(result.skipped) == sorted(p.name for p in dist)
+    assert not result.failed
+
+
+def test_publish_command(fake_index, dist, mocker):
+    """Tests that the publish command uploads with the repository's token."""
+    mocker.patch("partifact.main.Configuration.load")
+    mocker.patch("partifact.auth_token.get_token", return_value="test-token")
+    mocker.patch(
+        "partifact.shell_commands.upload_url", return_value=fake_index.upload_url
+    )
+
+    result = runner.invoke(app, ["publish", "repo", *map(str, dist)])
+
+    assert result.exit_code == 0, result.output
+    assert "uploaded 2 files" in result.output
+    assert len(fake_index.uploads) == 2
+
+    result = runner.invoke(app, ["publish", "repo", str(dist[0])])
+    assert result.exit_code == 1
+    assert "already published" in result.output
+
+    result = runner.invoke(app, ["publish", "repo", __file__])
+    assert result.exit_code == 2
+    assert "not a wheel or sdist" in result.output
@@ -0,0 +1,123 @@
+import pytest
+from botocore.exceptions import (
+    ClientError,
+    ConnectionClosedError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+from partifact.auth_token import get_token
+from partifact.config import Configuration
+from partifact.retry import RetryPolicy, call_with_retry, is_retryable
+from partifact.timing import recording
+
+NO_DELAY = RetryPolicy(base_delay=0.0, max_delay=0.0)
+
+
+def _error(code: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}}, "Operation")
+
+
+class Flaky:
+    """A call failing with an error a given number of times before succeeding."""
+
+    def __init__(self, failures: int, code: str = "ThrottlingException") -> None:
+        """Creates the call."""
+        self.failures = failures
+        self.code = code
+        self.calls = 0
+
+    def __call__(self) -> str:
+        """Makes the call."""
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise _error(self.code)
+        return "ok"
+
+
+def test_throttled_calls_are_retried():
+    """Tests that a throttled call is retried until it succeeds."""
+    call = Flaky(failures=3)
+
+    with recording() as timings:
+        assert call_with_retry("op", call, NO_DELAY) == "ok"
+
+    assert call.calls == 4
+    assert [p.name for p in timings.phases] == ["retry.op"] * 3
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        EndpointConnectionError(endpoint_url="https://sts.amazonaws.com"),
+        ConnectionClosedError(endpoint_url="https://sts.amazonaws.com"),
+        ReadTimeoutError(endpoint_url="https://sts.amazonaws.com"),
+    ],
+)
+def test_connection_errors_are_retried(error):
+    """Tests that failures to reach AWS are retried like throttling."""
+    calls = []
+
+    def call():
+        calls.append(error)
+        if len(calls) < 3:
+            raise error
+        return "ok"
+
+    assert call_with_retry("op", call, NO_DELAY) == "ok"
+    assert len(calls) == 3
+
+
+def test_other_errors_are_not_retried():
+    """Tests that errors other than throttling are raised straight away."""
+    call = Flaky(failures=1, code="AccessDeniedException")
+
+    with pytest.raises(ClientError, match="AccessDenied"):
+        call_with_retry("op", call, NO_DELAY)
+    assert call.calls == 1
+    assert not is_retryable(ValueError("not from AWS"))
+
+
+def test_retries_stop_after_max_attempts():
+    """Tests that a call throttled on every attempt eventually fails."""
+    call = Flaky(failures=10)
+
+    with pytest.raises(ClientError, match="Throttling"):
+        call_with_retry("op", call, RetryPolicy(max_attempts=3, base_delay=0.0))
+    assert call.calls == 3
+
+
+def test_retries_stop_at_the_deadline():
+    """Tests that no retry is started that would sleep past the deadline."""
+    call = Flaky(failures=10)
+    policy = RetryPolicy(base_delay=60.0, max_delay=60.0, deadline=0.0)
+
+    with pytest.raises(ClientError, match="Throttling"):
+        call_with_retry("op", call, policy)
+    assert call.calls == 1
+
+
+def test_delays_are_jittered_and_bounded():
+    """Tests that delays are random but grow no larger than the bounds."""
+    policy = RetryPolicy(base_delay=1.0, max_delay=4.0)
+
+    delays = [policy.delay(attempt) for attempt in range(1, 10) for _ in range(20)]
+
+    assert all(0.0 <= d <= 4.0 for d in delays)
+    assert len(set(delays)) > 1
+    assert all(policy.delay(1) <= 1.0 for _ in range(20))
+
+
+def test_throttled_token_requests_are_retried(aws):
+    """Tests that fetching a token survives being throttled by CodeArtifact."""
+    conf = Configuration(
+        aws_account="1234",
+        aws_region="eu-west-1",
+        code_artifact_repository="test-repo",
+        code_artifact_domain="test-domain",
+    )
+    aws.add_repository(conf.code_artifact_domain, conf.aws_account, "test-token")
+    aws.throttled_requests = 2
+
+    assert get_token(conf, retry=NO_DELAY) == "test-token"
+    assert aws.token_requests == 3
@@ -0,0 +1,37 @@
+import subprocess
+import sys
+
+import pytest
+
+# modules only needed once a command does its work, which importing the CLI
+# (and so `partifact --help` or a cached token) shouldn't pay for
+LAZY_MODULES = (
+    "boto3",
+    "botocore",
+    "tomlkit",
+    "tomllib",
+    "concurrent.futures",
+    "hashlib",
+    "socket",
+    "tempfile",
+)
+
+
+@pytest.fixture(scope="module")
+def cli_modules():
+    """The modules loaded by importing the CLI in a fresh interpreter."""
+    code = "import sys, partifact.main; print(' '.join(sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-B", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(result.stdout.split())
+
+
+@pytest.mark.parametrize("module", LAZY_MODULES)
+def test_cli_import_is_lazy(cli_modules, module):
+    """Tests that importing the CLI does not load dependencies only needed later."""
+    assert "partifact.main" in cli_modules
+    assert module not in cli_modules
@@ -0,0 +1,117 @@
+import json
+import time
+
+import pytest
+from typer.testing import CliRunner
+
+from partifact.cache import TokenCache
+from partifact.config import Configuration
+from partifact.main import app
+from partifact.status import format_duration, token_status
+
+runner = CliRunner()
+
+URL = "https://domain-1234.d.codeartifact.eu-west-1.amazonaws.com/pypi/{}/"
+
+
+@pytest.fixture
+def conf():
+    """A configuration for which the dummy AWS issues tokens."""
+    return Configuration(
+        aws_account="1234",
+        aws_region="eu-west-1",
+        code_artifact_repository="repo",
+        code_artifact_domain="domain",
+    )
+
+
+def test_token_status(conf, cache_dir):
+    """Tests that the validity of cached tokens is reported."""
+    cache = TokenCache(cache_dir)
+    other = Configuration(**{**conf.__dict__, "code_artifact_domain": "other"})
+    expired = Configuration(**{**conf.__dict__, "code_artifact_domain": "expired"})
+    now = time.time() + 600
+    cache.put(conf, "token", now + 7200)
+    cache.put(expired, "token", now - 300)
+
+    statuses = token_status(
+        {"repo": conf, "other": other, "expired": expired},
+        cache,
+        min_validity=3600,
+        now=now,
+    )
+
+    assert [(s.repository, s.valid, s.remaining) for s in statuses] == [
+        ("repo", True, 7200),
+        ("other", False, None),
+        ("expired", False, 0.0),
+    ]
+    assert statuses[0].describe(now).startswith("valid for 2h 00m (until ")
+    assert statuses[1].describe(now) == "no token, log in first"
+    assert statuses[2].describe(now) == "expired 5m ago"
+
+
+def test_format_duration():
+    """Tests that durations are shown in hours and minutes."""
+    assert format_duration(59) == "0m"
+    assert format_duration(45 * 60) == "45m"
+    assert format_duration(11 * 3600 + 58 * 60 + 30) == "11h 58m"
+
+
+def test_status_after_login(aws, write_sources):
+    """Tests that status reports tokens stored by login without calling AWS."""
+    write_sources({"repo-a": URL.format("repo-a"), "repo-b": URL.format("repo-b")})
+    aws.add_repository("domain", "1234", "test-token")
+
+    result = runner.invoke(app, ["status"])
+    assert result.exit_code == 1
+    assert "repo-a  no token, log in first" in result.output
+
+    result = runner.invoke(app, ["login", "repo-a", "--duration", "3600"])
+    assert result.exit_code == 0, result.output
+    assert aws.token_duration == 3600
+
+    result = runner.invoke(app, ["status", "repo-a", "--json"])
+    assert result.exit_code == 0, result.output
+    (entry,) = json.loads(result.output)
+    assert entry["repository"] == "repo-a"
+    assert entry["valid"]
+    assert entry["remaining"] == pytest.approx(3600, abs=5)
+
+    result = runner.invoke(app, ["status", "repo-a", "--min-validity", "7200"])
+    assert result.exit_code == 1
+    assert "repo-a  expiring for 59m" in result.output
+    assert aws.token_requests == 1
+
+
+def test_status_of_tokens_not_in_the_cache(aws, write_sources):
+    """Tests that tokens poetry or pip hold but the cache doesn't are unknown."""
+    write_sources({"repo-a": URL.format("repo-a")})
+    aws.add_repository("domain", "1234", "test-token")
+
+    result = runner.invoke(app, ["login", "repo-a", "--no-cache"])
+    assert result.exit_code == 0, result.output
+
+    result = runner.invoke(app, ["status", "repo-a"])
+    assert result.exit_code == 1
+    assert "repo-a  unknown" in result.output
+
+    result = runner.invoke(app, ["login", "repo-a"])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(app, ["status", "repo-a"])
+    assert result.exit_code == 0, result.output
+
+    # e.g. replaced by `partifact token` fetching a token of another duration
+    conf = Configuration("1234", "eu-west-1", "domain", "repo-a")
+    TokenCache().put(conf, "other-token", time.time() + 3600)
+    result = runner.invoke(app, ["status", "repo-a", "--json"])
+    assert result.exit_code == 1
+    assert not json.loads(result.output)[0]["known"]
+
+
+def test_login_rejects_invalid_duration():
+    """Tests that token durations CodeArtifact doesn't accept are rejected."""
+    result = runner.invoke(app, ["login", "repo", "--duration", "60"])
+
+    assert result.exit_code == 2
+    assert "between 900 and 43200" in result.output
@@ -0,0 +1,197 @@
+import configparser
+import subprocess
+import threading
+from unittest.mock import Mock
+
+import pytest
+import tomlkit
+from typer.testing import CliRunner
+
+from partifact.config import Configuration
+from partifact.main import app
+from partifact.shell_commands import ShellCommandException
+from partifact.targets import (
+    PdmTarget,
+    Target,
+    configure_targets,
+    get_target,
+    register_target,
+)
+
+runner = CliRunner()
+
+CONFIG = Configuration("1234", "eu-west-1", "domain", "repo")
+INDEX = "domain-1234.d.codeartifact.eu-west-1.amazonaws.com/pypi/repo"
+
+
+@pytest.fixture
+def load_config_mock(mocker) -> Mock:
+    """Patches the load method of Configuration."""
+    return mocker.patch("partifact.main.Configuration.load", return_value=CONFIG)
+
+
+@pytest.fixture
+def token_mock(mocker) -> Mock:
+    """Patches token generation."""
+    return mocker.patch("partifact.auth_token.get_token", return_value="TOKEN")
+
+
+class RecordingTarget(Target):
+    """A target recording what it is configured with."""
+
+    name = "recording"
+
+    def __init__(self):
+        """Creates a target without any recorded logins."""
+        self.logins = []
+
+    def configure(self, logins):
+        """Records the logins."""
+        self.logins.append(logins)
+        return []
+
+
+@pytest.mark.usefixtures("load_config_mock", "token_mock", "subprocess_mock")
+def test_login_configures_every_target(config_home):
+    """Tests that poetry, uv, twine and pdm are configured in one login."""
+    result = runner.invoke(
+        app, ["login", "repo", "--target", "poetry,uv", "-t", "twine", "-t", "pdm"]
+    )
+    assert result.exit_code == 0, result.output
+
+    auth = tomlkit.parse((config_home / "pypoetry" / "auth.toml").read_text())
+    assert auth["http-basic"]["repo"]["password"] == "TOKEN"
+    uv = tomlkit.parse((config_home / "uv" / "uv.toml").read_text())
+    assert uv["index"][0]["url"] == f"https://aws:TOKEN@{INDEX}/simple/"
+    pypirc = configparser.RawConfigParser()
+    pypirc.read(config_home / ".pypirc")
+    assert pypirc.get("repo", "repository") == f"https://{INDEX}/"
+    assert pypirc.get("repo", "password") == "TOKEN"
+    pdm = tomlkit.parse((config_home / "pdm" / "config.toml").read_text())
+    assert pdm["pypi"]["repo"]["url"] == f"https://{INDEX}/simple/"
+    assert pdm["pypi"]["repo"]["password"] == "TOKEN"
+
+    args = ["login", "repo", "-t", "poetry,uv,twine,pdm", "--plan"]
+    result = runner.invoke(app, args)
+    assert result.output.strip() == "nothing to change"
+
+
+@pytest.mark.usefixtures("load_config_mock", "token_mock")
+def test_login_plans_targets():
+    """Tests that the plan lists the changes of each target."""
+    result = runner.invoke(app, ["login", "repo", "-t", "uv,pdm", "--plan"])
+
+    assert result.output.splitlines() == [
+        "uv: update credentials of repo",
+        "pdm: update credentials of repo",
+    ]
+
+
+@pytest.mark.usefixtures("load_config_mock", "token_mock")
+def test_login_rejects_unknown_targets():
+    """Tests that unknown targets are reported before fetching any token."""
+    result = runner.invoke(app, ["login", "repo", "--target", "npm"])
+
+    assert result.exit_code == 2
+    assert "unknown target npm" in result.output
+
+
+@pytest.mark.usefixtures("load_config_mock", "token_mock")
+def test_login_with_registered_target(mocker):
+    """Tests that targets registered by plugins can be selected."""
+    mocker.patch.dict("partifact.targets._targets")
+    target = RecordingTarget()
+    register_target(target)
+
+    result = runner.invoke(app, ["login", "repo", "--target", "recording"])
+
+    assert result.exit_code == 0, result.output
+    assert target.logins == [{"repo": (CONFIG, "TOKEN")}]
+    assert get_target("recording") is target
+
+
+@pytest.mark.usefixtures("_subprocess_writers")
+def test_subprocess_targets_run_concurrently(mocker):
+    """Tests that the commands of different targets run at the same time."""
+    # the command of each tool only returns once the other tool's command is
+    # running too, which never happens if they run one after another
+    barrier = threading.Barrier(2, timeout=5)
+
+    def run(command, **kwargs):
+        barrier.wait()
+        return Mock()
+
+    run_mock = mocker.patch("subprocess.run", side_effect=run)
+    logins = {"repo": (CONFIG, "TOKEN")}
+
+    configure_targets({get_target("poetry"): logins, get_target("pip"): logins})
+
+    assert not barrier.broken
+    assert run_mock.call_count == 2
+    run_mock.assert_any_call(
+        [
+            "pip",
+            "config",
+            "set",
+            "global.index-url",
+            f"https://aws:TOKEN@{INDEX}/simple/",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+@pytest.mark.usefixtures("_subprocess_writers")
+def test_failing_targets_are_reported(mocker):
+    """Tests that a failing command of one target is reported once all are done."""
+
+    def run(command, **kwargs):
+        if command[0] == "pip":
+            raise subprocess.CalledProcessError(1, command, stderr="no pip")
+        return Mock()
+
+    run_mock = mocker.patch("subprocess.run", side_effect=run)
+    logins = {"repo": (CONFIG, "TOKEN")}
+
+    with pytest.raises(ShellCommandException, match="failed to configure pip: no pip"):
+        configure_targets({get_target("poetry"): logins, get_target("pip"): logins})
+    assert run_mock.call_count == 2
+
+
+@pytest.mark.usefixtures("_subprocess_writers")
+def test_missing_tools_are_reported(mocker):
+    """Tests that a tool that isn't installed fails like a failing command."""
+    mocker.patch("subprocess.run", side_effect=FileNotFoundError("pip not found"))
+    logins = {"repo": (CONFIG, "TOKEN")}
+
+    with pytest.raises(ShellCommandException, match="configure pip: pip not found"):
+        configure_targets({get_target("pip"): logins})
+
+
+def test_pdm_token_is_not_passed_as_argument(mocker, config_home, monkeypatch):
+    """Tests that pdm is configured through its file, honouring PDM_CONFIG_FILE."""
+    run_mock = mocker.patch("subprocess.run")
+    path = config_home / "custom" / "pdm.toml"
+    monkeypatch.setenv("PDM_CONFIG_FILE", str(path))
+    path.parent.mkdir(parents=True)
+    path.write_text('[python]\nuse_venv = false\n\n[pypi.other]\nurl = "x"\n')
+
+    configure_targets({PdmTarget(): {"repo": (CONFIG, "TOKEN")}})
+
+    run_mock.assert_not_called()
+    pdm = tomlkit.parse(path.read_text())
+    assert pdm["python"]["use_venv"] is False
+    assert pdm["pypi"]["other"]["url"] == "x"
+    assert pdm["pypi"]["repo"]["username"] == "aws"
+    assert not PdmTarget().pending({"repo": (CONFIG, "TOKEN")})
+
+
+def test_targets_must_implement_configure():
+    """Tests that a target without `configure` can't be created."""
+
+    class Incomplete(Target):
+        name = "incomplete"
+
+    with pytest.raises(TypeError, match="abstract"):
+        Incomplete()
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+from typer.testing import CliRunner
+
+from partifact.main import app
+from partifact.timing import phase, recording
+
+runner = CliRunner()
+
+
+def test_phases_are_only_recorded_while_active():
+    """Tests that phases outside of a recording are not timed."""
+    with phase("ignored"):
+        pass
+
+    with recording() as timings:
+        with phase("first"):
+            pass
+        with phase("second"):
+            pass
+        with phase("first"):
+            pass
+
+    assert [p.name for p in timings.phases] == ["first", "second", "first"]
+    assert list(timings.totals()) == ["first", "second"]
+    assert "(2x)" in timings.summary()
+
+
+def test_failed_phases_are_recorded():
+    """Tests that a phase raising an exception is still timed."""
+    with recording() as timings, pytest.raises(ValueError, match="boom"), phase(
+        "failing"
+    ):
+        raise ValueError("boom")
+
+    assert [p.name for p in timings.phases] == ["failing"]
+
+
+def test_login_reports_timings(aws, write_sources):
+    """Tests that login reports the time spent in each phase."""
+    write_sources(
+        {
+            "repo": "https://domain-1234.d.codeartifact.eu-west-1.amazonaws.com/pypi/repo/",
+        }
+    )
+    aws.add_repository("domain", "1234", "test-token")
+
+    result = runner.invoke(
+        app, ["login", "repo", "--timings", "--timings-json", "timings.json"]
+    )
+    assert result.exit_code == 0, result.output
+
+    with open("timings.json") as f:
+        phases = json.load(f)["totals"]
+    for name in (
+        "login",
+        "config.load",
+        "cache.lookup",
+        "aws.session",
+        "aws.get_authorization_token",
+        "configure.poetry",
+    ):
+        assert name in phases
+        assert name in result.output
@@ -1,4 +1,9 @@
-from partifact.auth_token import get_token
+import dataclasses
+import time
+
+import pytest
+
+from partifact.auth_token import get_token, get_tokens
 from partifact.config import Configuration
 
 
@@ -83,3 +88,63 @@ def test_token_via_named_profile_assumed_role(aws):
     assert aws.assumed_role == "arn:aws:iam::1234:role/test-role"
     assert len(aws.sessions) == 2
     assert aws.sessions[0].kwargs["profile_name"] == conf.aws_profile
+
+
+def test_token_carries_its_expiry(aws):
+    """Tests that the token reports when it expires and can be used as a string."""
+    conf = Configuration(
+        aws_account="1234",
+        aws_region="eu-west-1",
+        code_artifact_repository="test-repo",
+        code_artifact_domain="test-domain",
+    )
+    aws.add_repository(conf.code_artifact_domain, conf.aws_account, "test-token")
+    started = time.time()
+
+    token = get_token(conf)
+
+    assert token == "test-token"
+    assert f"{token}" == "test-token"
+    assert token.expiration == pytest.approx(started + 12 * 3600, abs=5)
+    assert token.remaining() == pytest.approx(12 * 3600, abs=5)
+    assert aws.token_duration is None
+
+
+def test_token_duration_is_passed_to_aws(aws):
+    """Tests that the configured token duration is requested from CodeArtifact."""
+    conf = Configuration(
+        aws_account="1234",
+        aws_region="eu-west-1",
+        code_artifact_repository="test-repo",
+        code_artifact_domain="test-domain",
+        code_artifact_token_duration=1800,
+    )
+    aws.add_repository(conf.code_artifact_domain, conf.aws_account, "test-token")
+
+    token = get_token(conf)
+
+    assert aws.token_duration == 1800
+    assert token.remaining() == pytest.approx(1800, abs=5)
+
+
+def test_tokens_of_different_durations_are_fetched_separately(aws):
+    """Tests that repositories asking for different durations don't share a token."""
+    short = Configuration(
+        aws_account="1234",
+        aws_region="eu-west-1",
+        code_artifact_repository="short-repo",
+        code_artifact_domain="test-domain",
+        code_artifact_token_duration=900,
+    )
+    long = dataclasses.replace(
+        short, code_artifact_repository="long-repo", code_artifact_token_duration=3600
+    )
+    same = dataclasses.replace(long, code_artifact_repository="other-repo")
+    aws.add_repository(short.code_artifact_domain, short.aws_account, "test-token")
+
+    tokens = get_tokens([short, long, same])
+
+    assert aws.token_requests == 2
+    assert tokens[0].remaining() == pytest.approx(900, abs=5)
+    assert tokens[1].remaining() == pytest.approx(3600, abs=5)
+    assert tokens[2] is tokens[1]